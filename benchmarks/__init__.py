@@ -0,0 +1,2 @@
+'''Benchmarks of `noobcash`. Run as modules from the root
+of the repository, e.g. `python -m benchmarks.wire_format`.'''
@@ -0,0 +1,386 @@
+'''Throughput and block time of a local cluster replaying the
+scripts of `transactions/` (random ones for other numbers of nodes,
+see `noobcash.simulator.load_scripts()`), for every combination of
+`capacity`, `difficulty` and `nodes`. Every run launches fresh
+`rest.py` processes, replays the scripts like `cli.py` does, waits
+until all queues are empty and the nodes agree on the length of the
+blockchain and measures:
+
+* throughput and mean block time, from the blocks of the longest
+blockchain appended after the replay started,
+* confirmation latency, median over the nodes of `/latency`,
+* CPU seconds of every node (and its miners) during the run,
+* mined, stale and orphaned blocks, killed miners, reorgs and the
+time spent in `resolve_conflicts` from `/metrics`,
+* nodes left with a shorter blockchain than the longest one.
+
+With any of the fault options, the nodes talk through a
+`benchmarks.faultproxy` whose faults start with the replay, to
+measure reorgs, wasted mining work (mined blocks not in the final
+blockchain) and sync cost (bytes of downloaded blockchains) under
+delay, loss and partitions. The nodes may then never agree, so they
+are given `--settle_timeout` seconds to.
+
+Results (medians of `--repeat` runs) are written to a .csv or .json
+file, which can later be given as `--baseline` to flag regressions
+(exit status 1).
+
+Usage:
+
+python -m benchmarks.cluster [-n NODES ...] [-c CAPACITY ...] [-d DIFFICULTY ...]
+                             [-r REPEAT] [-o OUTPUT] [--baseline BASELINE] [--tolerance TOLERANCE]
+                             [--node_args NODE_ARGS] [--faults FAULTS] [--delay DELAY]
+                             [--jitter JITTER] [--drop DROP] [--reorder REORDER] ...'''
+
+import os
+import sys
+import json
+import time
+import shlex
+import itertools
+import subprocess
+import tempfile
+import threading
+from argparse import ArgumentParser
+
+import numpy as np
+import urllib3
+
+from noobcash.simulator import load_scripts
+
+from benchmarks.common import (
+    write_results, load_results, compare, add_fault_arguments, fault_defaults
+)
+from benchmarks.faultproxy import FaultProxy, serve, load_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+# columns identifying a run and compared against the baseline (higher is better?)
+KEYS = ('nodes', 'capacity', 'difficulty')
+COMPARED = dict(throughput=True, latency_p50=False, latency_p95=False, cpu_per_transaction=False)
+
+HTTP = urllib3.PoolManager(maxsize=32)
+
+def get(port: int, path: str):
+    '''GET `path` of the node at `port`.
+
+    Returns:
+
+    * Decoded JSON response.'''
+
+    return json.loads(HTTP.request('GET', f'127.0.0.1:{port}{path}',
+                                   headers={'Accept': 'application/json'}).data)
+
+def cpu_seconds(pid: int):
+    '''Get CPU seconds of process `pid` and its reaped children (miners).'''
+
+    with open(f'/proc/{pid}/stat', encoding='utf-8') as stat:
+        # the name of the process may contain spaces
+        fields = stat.read().rsplit(')', 1)[1].split()
+    return sum(int(field) for field in fields[11:15]) / CLOCK_TICKS
+
+def scrape(ports: list):
+    '''Get the metrics of the nodes at `ports`, see `parse_metrics()`.'''
+    return [parse_metrics(HTTP.request('GET', f'127.0.0.1:{port}/metrics').data.decode()) \
+        for port in ports]
+
+def parse_metrics(text: str):
+    '''Sum samples of the Prometheus text format by metric name
+    and labels, e.g. 'noobcash_blocks_total{source="mined"}'.
+
+    Returns:
+
+    * `dict` of sample -> `float`.'''
+
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            samples[sample] = float(value)
+    return samples
+
+class Cluster:
+    '''Local nodes (`rest.py` processes) of a run.'''
+
+    def __init__(self, nodes: int, capacity: int, difficulty: int, host: str,
+                 base_port: int, node_args: list, logs: str):
+        '''Launch the nodes, bootstrap first.
+
+        Arguments:
+
+        * `nodes`, `capacity`, `difficulty`: see `rest.py`.
+
+        * `host`: ip of this host (part of the addresses of the wallets).
+
+        * `base_port`: port of the bootstrap, the others follow.
+
+        * `node_args`: `list` of extra arguments of `rest.py`.
+
+        * `logs`: directory of the output of the nodes.'''
+
+        self.ports = [base_port + i for i in range(nodes)]
+        self.processes = []
+        os.makedirs(logs, exist_ok=True)
+        for i, port in enumerate(self.ports):
+            cmd = [sys.executable, os.path.join('noobcash', 'rest.py'), '-p', str(port),
+                   '-n', str(nodes), '-c', str(capacity), '-d', str(difficulty),
+                   '-a', f'{host}:{base_port}'] + (['-b'] if i == 0 else []) + node_args
+            # pylint: disable-next=consider-using-with
+            log = open(os.path.join(logs, f'node{i}.log'), 'w')
+            self.processes.append(subprocess.Popen(
+                cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT,
+                env=dict(os.environ, PYTHONPATH=ROOT)
+            ))
+            log.close()
+            if i == 0:
+                self.wait(lambda: get(base_port, '/length') > 0, timeout=30)
+
+    @staticmethod
+    def wait(condition, timeout: float, interval=0.5):
+        '''Wait until `condition()` is true (errors count as false).
+
+        Raises:
+
+        * `TimeoutError`.'''
+
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                if condition():
+                    return
+            except (urllib3.exceptions.HTTPError, ValueError):
+                pass
+            time.sleep(interval)
+        raise TimeoutError('Cluster did not get ready in time')
+
+    def wait_network(self, timeout: float):
+        '''Wait until all nodes registered and received their initial NBCs.'''
+
+        self.wait(lambda: get(self.ports[0], '/ring'), timeout)
+        self.wait(lambda: all(get(port, '/id') != 0 for port in self.ports[1:]), timeout)
+
+    def settled(self):
+        '''Whether all queues are empty and all blockchains equally long.'''
+
+        mempools = [get(port, '/mempool') for port in self.ports]
+        lengths = {get(port, '/length') for port in self.ports}
+        return len(lengths) == 1 and \
+            all(mem['transactions']['count'] == 0 for mem in mempools)
+
+    def cpu(self):
+        '''Get CPU seconds of every node.'''
+        return [cpu_seconds(process.pid) for process in self.processes]
+
+    def stop(self):
+        '''Kill the nodes.'''
+
+        for process in self.processes:
+            process.kill()
+        for process in self.processes:
+            process.wait()
+
+def replay(port: int, rows: list, batch_size: int, rejected: list):
+    '''Send the script `rows` to the node at `port` in
+    batches (see `cli.py`), counting rejected purchases.'''
+
+    for start in range(0, len(rows), batch_size):
+        purchases = dict(black_hat=True, purchases=[
+            dict(receiver_idx=idx, amount=amount) for idx, amount in rows[start:start + batch_size]
+        ])
+        response = HTTP.request('POST', f'127.0.0.1:{port}/purchase_batch',
+                                headers={'Content-Type': 'application/json'},
+                                body=json.dumps(purchases))
+        rejected.append(json.loads(response.data).count(False))
+
+def run(nodes: int, capacity: int, difficulty: int, args):
+    '''Launch a cluster, replay its scripts and measure it.
+
+    Returns:
+
+    * `dict` of results.'''
+
+    logs = os.path.join(args.logs, f'{nodes}-{capacity}-{difficulty}')
+    node_args = shlex.split(args.node_args)
+    faults = load_config(args.faults, **fault_defaults(args))
+    proxy = server = None
+    if args.faults is not None or any(faults['default'].values()):
+        # no faults until the network is set up
+        proxy = FaultProxy(seed=args.seed)
+        server = serve(proxy, args.proxy_port)
+        node_args += ['--proxy', f'http://127.0.0.1:{args.proxy_port}']
+
+    cluster = Cluster(nodes, capacity, difficulty, args.host, args.port, node_args, logs)
+    try:
+        cluster.wait_network(args.timeout)
+        scripts = load_scripts(args.script, nodes, args.seed)
+        # the ids of the nodes are their order of registration
+        ids = [0] + [get(port, '/id') for port in cluster.ports[1:]]
+
+        samples_0 = scrape(cluster.ports)
+        cpu_0 = cluster.cpu()
+        t_0 = time.time()
+        if proxy is not None:
+            proxy.configure(faults)
+            proxy.start()
+        rejected = []
+        threads = [threading.Thread(target=replay, args=(port, scripts[idx], args.batch_size,
+                                                         rejected)) \
+            for port, idx in zip(cluster.ports, ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # settled twice in a row, a block may be on its way
+        try:
+            cluster.wait(lambda: cluster.settled() and (time.sleep(2) or cluster.settled()),
+                         args.timeout if proxy is None else args.settle_timeout, interval=1)
+        except TimeoutError:
+            # under faults, a node that missed the last blocks (e.g. behind a
+            # partition) only catches up when another block is broadcast
+            if proxy is None:
+                raise
+        cpu = np.subtract(cluster.cpu(), cpu_0)
+
+        lengths = [get(port, '/length') for port in cluster.ports]
+        longest = cluster.ports[int(np.argmax(lengths))]
+        blocks = [block for block in get(longest, '/blockchain')['chain'] \
+            if block['timestamp'] >= t_0]
+        confirmed = sum(len(block['list_of_transactions']) for block in blocks)
+        times = [t_0] + [block['timestamp'] for block in blocks]
+        latencies = [max(get(port, '/latency')['windows'].items(),
+                         key=lambda window: int(window[0][:-1]))[1] for port in cluster.ports]
+        samples = scrape(cluster.ports)
+        links = proxy.report()['links'] if proxy is not None else {}
+        sync = proxy.report()['paths'].get('/blockchain', {}) if proxy is not None else {}
+    finally:
+        cluster.stop()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    def total(sample):
+        # over all nodes, during the run
+        return sum(after.get(sample, 0) - before.get(sample, 0) \
+            for before, after in zip(samples_0, samples))
+
+    def median(key):
+        values = [lat[key] for lat in latencies if lat[key] is not None]
+        return float(np.median(values)) if values else None
+
+    return dict(
+        nodes=nodes,
+        capacity=capacity,
+        difficulty=difficulty,
+        issued=sum(len(rows) for rows in scripts),
+        rejected=sum(rejected),
+        confirmed=confirmed,
+        blocks=len(blocks),
+        duration=times[-1] - t_0,
+        throughput=confirmed / (times[-1] - t_0) if blocks else 0.0,
+        block_time=float(np.mean(np.diff(times))) if blocks else None,
+        latency_p50=median('p50'),
+        latency_p95=median('p95'),
+        cpu_mean=float(np.mean(cpu)),
+        cpu_max=float(np.max(cpu)),
+        cpu_per_transaction=float(np.sum(cpu)) / confirmed if confirmed else None,
+        cpu_nodes=';'.join(f'{seconds:.2f}' for seconds in cpu),
+        mined_blocks=int(total('noobcash_blocks_total{source="mined"}')),
+        wasted_blocks=int(total('noobcash_blocks_total{source="mined"}')) - len(blocks),
+        stale_blocks=int(total('noobcash_stale_blocks_total')),
+        orphaned_blocks=int(total('noobcash_orphaned_blocks_total')),
+        miners_killed=int(total('noobcash_miners_killed_total')),
+        reorgs=int(total('noobcash_reorgs_total')),
+        resolves=int(total('noobcash_resolve_conflicts_seconds_count')),
+        resolve_seconds=total('noobcash_resolve_conflicts_seconds_sum'),
+        sync_bytes=sync.get('bytes', 0),
+        behind=sum(length < max(lengths) for length in lengths),
+        dropped=sum(link['dropped'] for link in links.values()),
+        partitioned=sum(link['partitioned'] for link in links.values())
+    )
+
+def median_result(runs: list):
+    '''Combine `runs` of the same grid point, taking the median of every
+    numeric column (the CPU of the nodes is the one of the first run).
+
+    Returns:
+
+    * `dict`.'''
+
+    result = dict(runs[0])
+    for column, value in result.items():
+        if isinstance(value, (int, float)):
+            values = [run[column] for run in runs if run[column] is not None]
+            result[column] = float(np.median(values)) if values else None
+            if isinstance(value, int):
+                result[column] = int(result[column])
+    return result
+
+def main():
+    '''Run the grid of clusters.'''
+
+    parser = ArgumentParser(description='Benchmark local clusters replaying the scripts.')
+    parser.add_argument('-n', '--nodes', default=[5], type=int, nargs='+',
+                        help='numbers of nodes')
+    parser.add_argument('-c', '--capacity', default=[10], type=int, nargs='+',
+                        help='numbers of transactions in a block')
+    parser.add_argument('-d', '--difficulty', default=[4], type=int, nargs='+',
+                        help='difficulties of mining')
+    parser.add_argument('-s', '--script', default=os.path.join(ROOT, 'transactions'), type=str,
+                        help='directory of scripts (random ones if missing)')
+    parser.add_argument('-k', '--batch_size', default=20, type=int,
+                        help='transactions of the script sent per request')
+    parser.add_argument('--node_args', default='', type=str,
+                        help='extra arguments of rest.py, e.g. "-w binary -B 5"')
+    parser.add_argument('--host', default=None, type=str,
+                        help='ip of this host. Default: first of `hostname -I`')
+    parser.add_argument('-p', '--port', default=5000, type=int, help='port of the bootstrap')
+    parser.add_argument('--timeout', default=600, type=float,
+                        help='seconds to wait for the network and for a run to settle')
+    parser.add_argument('--logs', type=str,
+                        default=os.path.join(tempfile.gettempdir(), 'noobcash-benchmark'),
+                        help='directory of the output of the nodes')
+    parser.add_argument('--seed', default=0, type=int, help='seed of random scripts')
+    parser.add_argument('--faults', default=None, type=str,
+                        help='JSON file of faults of the links (see benchmarks.faultproxy)')
+    # faults of every link (through the proxy)
+    add_fault_arguments(parser)
+    parser.add_argument('--proxy_port', default=8079, type=int, help='port of the proxy')
+    parser.add_argument('--settle_timeout', default=60, type=float,
+                        help='seconds to wait for the nodes to agree under faults')
+    parser.add_argument('-o', '--output', default=None, type=str,
+                        help='write results to this .json or .csv file')
+    parser.add_argument('--baseline', default=None, type=str,
+                        help='results (.json or .csv) of a previous run to compare with')
+    parser.add_argument('-r', '--repeat', default=1, type=int,
+                        help='runs of every grid point, the median is kept')
+    parser.add_argument('--tolerance', default=0.2, type=float,
+                        help='relative change considered a regression')
+    args = parser.parse_args()
+
+    if args.host is None:
+        args.host = subprocess.check_output(['hostname', '-I']).decode().split()[0]
+
+    columns = ['nodes', 'capacity', 'difficulty', 'rejected', 'confirmed', 'blocks',
+               'throughput', 'block_time', 'latency_p50', 'latency_p95', 'cpu_mean',
+               'wasted_blocks', 'reorgs', 'resolves']
+    print(''.join(f'{column:>12}' for column in columns))
+    results = []
+    for nodes, capacity, difficulty in \
+        itertools.product(args.nodes, args.capacity, args.difficulty):
+        result = median_result([run(nodes, capacity, difficulty, args) \
+            for _ in range(args.repeat)])
+        results.append(result)
+        print(''.join(f'{result[column]:>12.3f}' if isinstance(result[column], float) \
+            else f'{str(result[column]):>12}' for column in columns), flush=True)
+
+    if args.output is not None:
+        write_results(args.output, results)
+
+    if args.baseline is not None:
+        print()
+        if compare(results, load_results(args.baseline), KEYS, COMPARED, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
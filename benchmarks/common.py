@@ -0,0 +1,218 @@
+'''Synthetic `noobcash` objects for benchmarks, built
+without a running network, and helpers shared by the benchmarks.'''
+
+import csv
+import json
+import time
+import tracemalloc
+
+from noobcash import signatures
+from noobcash.wallet import Wallet
+from noobcash.transaction import Transaction
+from noobcash.transaction_output import TransactionOutput
+from noobcash.block import Block
+from noobcash.blockchain import Blockchain
+
+def make_wallet(index: int, funds=0, scheme=signatures.DEFAULT_SCHEME):
+    '''Create `Wallet` with a private key, without
+    querying the host for its address.
+
+    Arguments:
+
+    * `index`: used for a dummy address.
+
+    * `funds`: amount of a single seed utxo. Default: 0 (none).
+
+    * `scheme`: signature scheme of the keys.
+
+    Returns:
+
+    * `Wallet`.'''
+
+    wallet = Wallet(port=0, this_node=False)
+    wallet.private_key = signatures.generate_key(scheme)
+    wallet.public_key = signatures.public_key(wallet.private_key)
+    wallet.address = f'127.0.0.1:{5000 + index}'
+    if funds > 0:
+        wallet.add_utxo(TransactionOutput(f'{index:040x}', wallet.public_key, funds))
+    return wallet
+
+def make_transactions(wallets: list, count: int, amount=1):
+    '''Create `count` signed transactions, each wallet sending
+    `amount` to the next one in a round robin fashion. The change of
+    every transaction returns to its sender so it can be respent.
+
+    Arguments:
+
+    * `wallets`: `list` of funded `Wallet`s.
+
+    * `count`: number of transactions.
+
+    * `amount`: NBCs per transaction.
+
+    Returns:
+
+    * `list` of `Transaction`s.'''
+
+    transactions = []
+    for i in range(count):
+        sender = wallets[i % len(wallets)]
+        receiver = wallets[(i + 1) % len(wallets)]
+        transaction = Transaction(receiver.public_key, amount, sender)
+        for tro in transaction.transaction_outputs:
+            if tro.receiver_public_key is sender.public_key:
+                sender.add_utxo(tro)
+        transactions.append(transaction)
+    return transactions
+
+def make_blockchain(transactions: list, capacity: int):
+    '''Pack `transactions` into a chain of (unmined) blocks.
+
+    Arguments:
+
+    * `transactions`: `list` of `Transaction`s.
+
+    * `capacity`: transactions per block.
+
+    Returns:
+
+    * `Blockchain`.'''
+
+    genesis = Transaction(transactions[0].sender_pubk, 1000, my_wallet=None)
+    blockchain = Blockchain(genesis_transaction=genesis)
+    for i in range(0, len(transactions), capacity):
+        block = Block(blockchain)
+        block.add_transactions(transactions[i:i + capacity])
+        block.nonce = i
+        block.my_hash()
+        blockchain.append_block(block)
+    return blockchain
+
+def measure(func, repeat: int):
+    '''Call `func` `repeat` times.
+
+    Returns:
+
+    * Operations per second.'''
+
+    t_0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return repeat / (time.perf_counter() - t_0)
+
+def measure_memory(func, repeat: int):
+    '''Call `func` `repeat` times while tracing allocations.
+
+    Returns:
+
+    * (peak bytes allocated during a call, bytes still
+    allocated after a call), averaged over the calls.'''
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    peak, retained = 0, 0
+    for _ in range(repeat):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        func()
+        current, top = tracemalloc.get_traced_memory()
+        peak += top - before
+        retained += current - before
+    if started:
+        tracemalloc.stop()
+    return peak / repeat, retained / repeat
+
+def write_results(path: str, results: list):
+    '''Write `results` (`list` of flat `dict`s) as CSV
+    if `path` ends with .csv, else as JSON.'''
+
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        if path.endswith('.csv'):
+            writer = csv.DictWriter(output, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+        else:
+            json.dump(results, output, indent=2)
+
+def load_results(path: str):
+    '''Load results written by `write_results()`.
+
+    Returns:
+
+    * `list` of `dict`s.'''
+
+    with open(path, encoding='utf-8', newline='') as results:
+        if not path.endswith('.csv'):
+            return json.load(results)
+        rows = list(csv.DictReader(results))
+    for row in rows:
+        for key, value in row.items():
+            try:
+                row[key] = float(value) if value != '' else None
+            except ValueError:
+                pass
+    return rows
+
+def compare(results: list, baseline: list, keys: tuple, compared: dict, tolerance: float):
+    '''Compare `results` with the `baseline` row with the same
+    `keys`, printing the changes.
+
+    Arguments:
+
+    * `keys`: columns identifying a row.
+
+    * `compared`: `dict` of column -> whether higher is better.
+
+    * `tolerance`: relative change (e.g. 0.1 for 10%) in the
+    worse direction considered a regression.
+
+    Returns:
+
+    * `list` of regressions (`str`), also printed.'''
+
+    def key(row):
+        # numbers of CSV files are floats
+        return tuple(int(row[col]) if isinstance(row[col], float) else row[col] for col in keys)
+
+    baseline = {key(row): row for row in baseline}
+    regressions = []
+    for row in results:
+        base = baseline.get(key(row))
+        if base is None:
+            continue
+        name = '/'.join(str(part) for part in key(row))
+        for column, higher_is_better in compared.items():
+            if row[column] is None or not base[column]:
+                continue
+            change = (row[column] - base[column]) / base[column]
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            print(f'{name:<30}{column:<22}{base[column]:>14.4f}{row[column]:>14.4f}'
+                  f'{change * 100:>+9.1f}%{"  REGRESSION" if worse else ""}')
+            if worse:
+                regressions.append(f'{name} {column}: {change * 100:+.1f}%')
+    if regressions:
+        print(f'\n{len(regressions)} regression(s):\n' + '\n'.join(regressions))
+    return regressions
+
+def add_fault_arguments(parser):
+    '''Add options of the default rule of the links of
+    `benchmarks.faultproxy` to `parser` (see `fault_defaults()`).'''
+
+    parser.add_argument('--delay', default=None, type=float,
+                        help='seconds of delay of every message')
+    parser.add_argument('--jitter', default=None, type=float,
+                        help='extra random seconds of delay')
+    parser.add_argument('--drop', default=None, type=float,
+                        help='probability of dropping a message')
+    parser.add_argument('--reorder', default=None, type=float,
+                        help='probability of holding a message back')
+
+def fault_defaults(args):
+    '''Get the options of `add_fault_arguments()` from parsed `args`.
+
+    Returns:
+
+    * `dict`, to be given to `faultproxy.load_config()`.'''
+
+    return dict(delay=args.delay, jitter=args.jitter, drop=args.drop, reorder=args.reorder)
@@ -0,0 +1,300 @@
+'''HTTP proxy between the nodes of a local cluster (see `--proxy` of
+`rest.py`) that injects faults per link: delay, jitter, drops,
+reordering and partitions. A link is a (sender, receiver) pair of
+ports, the sender given by the transport in `SOURCE_HEADER`.
+
+The configuration is a `dict` (or JSON file):
+
+{
+  "default": {"delay": 0.05, "jitter": 0.02, "drop": 0.01,
+              "reorder": 0.05, "reorder_delay": 0.2},
+  "links": [{"src": "5001", "dst": "5002", "delay": 0.5}],
+  "partitions": [["5000", "5001"], ["5002", "5003", "5004"]],
+  "schedule": [{"at": 30, "partitions": []}]
+}
+
+`links` override the default for matching links (a missing `src` or
+`dst` matches any node), nodes in different `partitions` cannot reach
+each other and every entry of `schedule` replaces these keys `at`
+seconds after `start()`. Dropped and partitioned requests are answered
+with 503 (after the delay for drops) without being forwarded, which
+the nodes already treat as a failed send. Reordering holds a request
+for an extra `reorder_delay`. As nodes send to a peer one request at a
+time, broadcast messages (`ASYNC_PATHS`) that are reordered are
+answered right away and forwarded in the background, so that later
+ones overtake them; other requests are just delayed more.
+
+The configuration can be changed (PUT) and statistics of every link
+and path read (GET) at `/config` and `/stats` of the proxy.
+
+Usage:
+
+python -m benchmarks.faultproxy [-p PORT] [--config CONFIG] [--delay DELAY] [--jitter JITTER]
+                                [--drop DROP] [--reorder REORDER]'''
+
+import json
+import time
+import random
+import threading
+from argparse import ArgumentParser
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import urllib3
+
+from noobcash.transport import SOURCE_HEADER
+
+from benchmarks.common import add_fault_arguments, fault_defaults
+
+LINK_DEFAULTS = dict(delay=0.0, jitter=0.0, drop=0.0, reorder=0.0, reorder_delay=0.2)
+
+# messages whose response the nodes only check for success,
+# so they can be answered before being forwarded
+ASYNC_PATHS = frozenset(('/transaction', '/transactions', '/block'))
+
+# not forwarded in either direction
+HOP_HEADERS = frozenset(('connection', 'keep-alive', 'proxy-connection', 'proxy-authorization',
+                         'transfer-encoding', 'content-length', 'te', 'trailer', 'upgrade'))
+
+def _normalized(config: dict):
+    '''Ports of `config` (and its schedule) as `str`s, JSON may have `int`s.'''
+
+    config = dict(config)
+    if 'links' in config:
+        config['links'] = [dict(link, **{end: str(link[end]) for end in ('src', 'dst') \
+            if end in link}) for link in config['links']]
+    if 'partitions' in config:
+        config['partitions'] = [[str(port) for port in group] for group in config['partitions']]
+    if 'schedule' in config:
+        config['schedule'] = [_normalized(entry) for entry in config['schedule']]
+    return config
+
+class FaultProxy:
+    '''Rules and statistics of the proxy.'''
+
+    def __init__(self, config=None, seed=None):
+        '''Initialize `FaultProxy` object.
+
+        Arguments:
+
+        * `config`: `dict`, see the module. Default: `None`, no faults.
+
+        * `seed`: of the random faults. Default: `None`, random.'''
+
+        self.rng = random.Random(seed)
+        self.http = urllib3.PoolManager(maxsize=16, retries=False)
+        self.config = {}
+        self.schedule = []
+        self.started = None
+        self.stats = defaultdict(lambda: dict(messages=0, bytes=0, dropped=0,
+                                              partitioned=0, reordered=0, failed=0))
+        self.paths = defaultdict(lambda: dict(messages=0, bytes=0))
+        self._lock = threading.Lock()
+        self.configure(config or {})
+
+    def configure(self, config: dict):
+        '''Replace the rules (and schedule, if given).'''
+
+        config = _normalized(config)
+        with self._lock:
+            self.config = dict(default=dict(LINK_DEFAULTS, **config.get('default', {})),
+                               links=config.get('links', []),
+                               partitions=config.get('partitions', []))
+            if 'schedule' in config:
+                self.schedule = sorted(config['schedule'], key=lambda entry: entry['at'])
+
+    def start(self):
+        '''Start the clock of the schedule.'''
+        self.started = time.time()
+
+    def _apply_schedule(self):
+        if self.started is None:
+            return
+        while self.schedule and self.schedule[0]['at'] <= time.time() - self.started:
+            entry = self.schedule.pop(0)
+            with self._lock:
+                for key in ('default', 'links', 'partitions'):
+                    if key in entry:
+                        self.config[key] = dict(LINK_DEFAULTS, **entry[key]) \
+                            if key == 'default' else entry[key]
+
+    def rule(self, src: str, dst: str):
+        '''Get the rule of link `src` -> `dst` (ports).
+
+        Returns:
+
+        * `dict` of the rule, `None` if the link is partitioned.'''
+
+        self._apply_schedule()
+        with self._lock:
+            for group in self.config['partitions']:
+                if src is not None and (src in group) != (dst in group):
+                    return None
+            rule = dict(self.config['default'])
+            for link in self.config['links']:
+                if link.get('src', src) == src and link.get('dst', dst) == dst:
+                    rule.update({key: value for key, value in link.items() \
+                        if key in LINK_DEFAULTS})
+        return rule
+
+    def count(self, src, dst, path, key=None, size=0):
+        '''Record a message of `size` bytes (or an event `key`) on a link.'''
+
+        with self._lock:
+            link = self.stats[f'{src}->{dst}']
+            if key is not None:
+                link[key] += 1
+                return
+            link['messages'] += 1
+            link['bytes'] += size
+            self.paths[path]['messages'] += 1
+            self.paths[path]['bytes'] += size
+
+    def forward(self, method: str, url: str, headers: dict, body: bytes):
+        '''Apply the faults of the link of the request and forward it.
+
+        Returns:
+
+        * (`int` status, `dict` headers, `bytes` body).'''
+
+        target = urlsplit(url)
+        src, dst, path = headers.get(SOURCE_HEADER), str(target.port), target.path
+        rule = self.rule(src, dst)
+        if rule is None:
+            self.count(src, dst, path, 'partitioned')
+            return 503, {}, b''
+
+        delay = rule['delay'] + self.rng.uniform(0, rule['jitter'])
+        if self.rng.random() < rule['reorder']:
+            delay += rule['reorder_delay']
+            self.count(src, dst, path, 'reordered')
+            if method == 'POST' and path in ASYNC_PATHS:
+                threading.Thread(target=self._deliver, daemon=True,
+                                 args=(method, url, headers, body, rule, delay)).start()
+                return 200, {'Content-Type': 'application/json'}, b'null'
+        return self._deliver(method, url, headers, body, rule, delay)
+
+    def _deliver(self, method, url, headers, body, rule, delay):
+        '''Forward a request after `delay` seconds, unless it is dropped.'''
+
+        target = urlsplit(url)
+        src, dst, path = headers.get(SOURCE_HEADER), str(target.port), target.path
+        time.sleep(delay)
+        if self.rng.random() < rule['drop']:
+            self.count(src, dst, path, 'dropped')
+            return 503, {}, b''
+
+        try:
+            response = self.http.request(method, url, body=body, headers=headers,
+                                         decode_content=False, redirect=False)
+        except urllib3.exceptions.HTTPError:
+            self.count(src, dst, path, 'failed')
+            return 502, {}, b''
+        self.count(src, dst, path, size=len(body or b'') + len(response.data))
+        return response.status, dict(response.headers), response.data
+
+    def report(self):
+        '''Get statistics of every link and path.
+
+        Returns:
+
+        * `dict`.'''
+
+        with self._lock:
+            return dict(links={link: dict(stats) for link, stats in sorted(self.stats.items())},
+                        paths={path: dict(stats) for path, stats in sorted(self.paths.items())})
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    '''Forwards requests in absolute form, serves `/config` and `/stats`.'''
+
+    protocol_version = 'HTTP/1.1'
+    proxy = None # `FaultProxy`, set by `serve()`
+
+    def _reply(self, status: int, headers: dict, body: bytes):
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in HOP_HEADERS:
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else None
+
+        if self.path.startswith('/'): # to the proxy itself
+            if self.path == '/config' and self.command == 'PUT':
+                self.proxy.configure(json.loads(body))
+                reply = self.proxy.config
+            elif self.path == '/config':
+                reply = self.proxy.config
+            elif self.path == '/stats':
+                reply = self.proxy.report()
+            else:
+                self._reply(404, {}, b'')
+                return
+            self._reply(200, {'Content-Type': 'application/json'}, json.dumps(reply).encode())
+            return
+
+        headers = {key: value for key, value in self.headers.items() \
+            if key.lower() not in HOP_HEADERS}
+        self._reply(*self.proxy.forward(self.command, self.path, headers, body))
+
+    do_GET = do_POST = do_PUT = _handle
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+def serve(proxy: FaultProxy, port: int, host='127.0.0.1'):
+    '''Serve `proxy` in a background thread.
+
+    Returns:
+
+    * `ThreadingHTTPServer`, `shutdown()` to stop.'''
+
+    handler = type('Handler', (ProxyHandler,), dict(proxy=proxy))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def load_config(path=None, **default):
+    '''Load the configuration of JSON file `path` (if given),
+    with `default` overriding its default rule.
+
+    Returns:
+
+    * `dict`.'''
+
+    config = {}
+    if path is not None:
+        with open(path, encoding='utf-8') as config_file:
+            config = json.load(config_file)
+    config['default'] = dict(config.get('default', {}),
+                             **{key: value for key, value in default.items() if value is not None})
+    return config
+
+def main():
+    '''Run the proxy.'''
+
+    parser = ArgumentParser(description='Fault-injecting HTTP proxy between noobcash nodes.')
+    parser.add_argument('-p', '--port', default=8080, type=int, help='port to listen on')
+    parser.add_argument('--config', default=None, type=str, help='JSON file of the rules')
+    add_fault_arguments(parser)
+    parser.add_argument('--seed', default=None, type=int)
+    args = parser.parse_args()
+
+    proxy = FaultProxy(load_config(args.config, **fault_defaults(args)), args.seed)
+    server = serve(proxy, args.port, host='0.0.0.0')
+    proxy.start()
+    print(f'Proxy listening on port {args.port}, e.g. rest.py --proxy http://127.0.0.1:{args.port}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+'''Hashes per second of every hash function of `noobcash.hashing` in
+the mining loop, reusing the hash state of the block without its nonce
+(`Block.search_nonce()`) and rehashing the whole block per nonce, along
+with the rate of transaction IDs.
+
+Usage:
+
+python -m benchmarks.hashing [-c CAPACITY] [-t TRIES]'''
+
+import time
+from argparse import ArgumentParser
+
+from noobcash import hashing
+from noobcash.block import Block
+
+from benchmarks.common import make_wallet, make_transactions, make_blockchain, measure
+
+def main():
+    '''Run the benchmark.'''
+
+    parser = ArgumentParser()
+    parser.add_argument('-c', '--capacity', default=10, type=int,
+                        help='number of transactions in a block')
+    parser.add_argument('-t', '--tries', default=100000, type=int,
+                        help='nonces tried per measurement')
+    args = parser.parse_args()
+
+    print(f'{"hash":<10}{"prefix H/s":>14}{"full H/s":>14}{"tx ids/s":>14}')
+    for name in hashing.HASHES:
+        hashing.use(name)
+        wallets = [make_wallet(i, funds=10 ** 6) for i in range(2)]
+        transactions = make_transactions(wallets, args.capacity)
+        block = make_blockchain(transactions, args.capacity).chain[-1]
+        # no nonce satisfies it, so that exactly `tries` are tried
+        difficulty = hashing.digest_bits()
+
+        t_0 = time.perf_counter()
+        Block.search_nonce(hashing.new(block.message_prefix()), difficulty, 0, args.tries)
+        prefix_rate = args.tries / (time.perf_counter() - t_0)
+
+        def full_hash(block=block, difficulty=difficulty):
+            block.nonce += 1
+            return block.validate_hash(difficulty)
+        full_rate = measure(full_hash, args.tries // 10)
+
+        ids = measure(transactions[0].make_hash, args.tries // 10)
+        print(f'{name:<10}{prefix_rate:>14.1f}{full_rate:>14.1f}{ids:>14.1f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+'''Open-loop load generator: offers transactions to one or many nodes
+at a target rate, whether or not earlier requests have been answered,
+in steps of increasing rate, to find the saturation point of the
+cluster. Receivers and amounts are random or come from the scripts of
+`transactions/`. For every step it measures:
+
+* accept latency, from when a request was due (not when it was sent,
+so that a slow node cannot slow down the load) until it was answered,
+* confirmation latency and throughput of the transactions created by
+the nodes during the step, after the warm-up (`/latency?since=...`),
+once they are all confirmed or `--drain` seconds have passed.
+
+A step is saturated if the transactions confirmed fall short of those
+accepted (after the warm-up), too many requests fail or the accept
+latency is too high. The saturation point is the confirmed throughput of the last
+step that was not saturated.
+
+Usage:
+
+python -m benchmarks.loadgen [-a ADDRESS ...] [--launch NODES [-c CAPACITY] [-d DIFFICULTY]]
+                             [-r RATE ...] [-D DURATION] [-k BATCH_SIZE] [--poisson]
+                             [-s SCRIPT] [-o OUTPUT] ...'''
+
+import os
+import json
+import time
+import shlex
+import random
+import tempfile
+import itertools
+import subprocess
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import urllib3
+
+from noobcash.simulator import load_scripts
+
+from benchmarks.common import write_results
+from benchmarks.cluster import Cluster
+
+DEFAULT_RATES = [1, 2, 4, 8, 16, 32, 64, 128]
+
+HTTP = urllib3.PoolManager()
+
+class Workload:
+    '''Receivers and amounts of the transactions of every node.'''
+
+    def __init__(self, ids: list, script=None, max_amount=1, seed=0):
+        '''Initialize `Workload` object.
+
+        Arguments:
+
+        * `ids`: IDs of the nodes loaded.
+
+        * `script`: directory of scripts (see `cli.py`), replayed in
+        a loop. Default: `None`, random receivers among all nodes.
+
+        * `max_amount`: maximum random amount (minimum 1).
+
+        * `seed`: of random receivers and amounts.'''
+
+        self.ids = ids
+        self.max_amount = max_amount
+        self.rng = random.Random(seed)
+        self.rows = None
+        if script is not None:
+            scripts = load_scripts(script, len(ids), seed)
+            self.rows = {idx: itertools.cycle(scripts[idx]) for idx in ids}
+
+    def next(self, idx: int):
+        '''Get (receiver ID, amount) of the next transaction of node `idx`.'''
+
+        if self.rows is not None:
+            return next(self.rows[idx])
+        receiver = self.rng.choice([other for other in self.ids if other != idx])
+        return receiver, self.rng.randint(1, self.max_amount)
+
+class Request:
+    '''Outcome of a request of the load.'''
+
+    __slots__ = ('due', 'done', 'transactions', 'accepted', 'failed')
+
+    def __init__(self, due: float, transactions: int):
+        self.due = due
+        self.done = None
+        self.transactions = transactions
+        self.accepted = 0
+        self.failed = False
+
+def send(http, address: str, orders: list, request: Request):
+    '''Order transactions `orders` from the node at `address`
+    (one `/purchase` or a `/purchase_batch`).'''
+
+    try:
+        if len(orders) == 1:
+            path, body = 'purchase', dict(receiver_idx=orders[0][0], amount=orders[0][1])
+        else:
+            path, body = 'purchase_batch', dict(purchases=[
+                dict(receiver_idx=idx, amount=amount) for idx, amount in orders
+            ])
+        response = http.request('POST', f'{address}/{path}', body=json.dumps(body),
+                                headers={'Content-Type': 'application/json'})
+        if response.status != 200:
+            request.failed = True
+        else:
+            valid = json.loads(response.data)
+            request.accepted = sum(valid) if isinstance(valid, list) else int(valid)
+    except (urllib3.exceptions.HTTPError, ValueError):
+        request.failed = True
+    request.done = time.time()
+
+def run_step(addresses: list, ids: list, workload: Workload, rate: float, args):
+    '''Offer `rate` transactions per second for `args.duration` seconds,
+    round robin over the nodes, then measure the step.
+
+    Returns:
+
+    * `dict` of results.'''
+
+    http = urllib3.PoolManager(maxsize=args.connections)
+    rng = random.Random(args.seed)
+    interval = args.batch_size / rate
+    requests = []
+    with ThreadPoolExecutor(max_workers=args.connections) as pool:
+        t_0 = time.time()
+        due = t_0
+        for k in itertools.count():
+            if due >= t_0 + args.duration:
+                break
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            idx = k % len(addresses)
+            orders = [workload.next(ids[idx]) for _ in range(args.batch_size)]
+            request = Request(due, len(orders))
+            requests.append(request)
+            pool.submit(send, http, addresses[idx], orders, request)
+            due += rng.expovariate(1 / interval) if args.poisson else interval
+
+    # transactions created after the warm-up, given time to be confirmed
+    since, until = t_0 + args.warmup, t_0 + args.duration
+    window = args.duration - args.warmup
+    measured = sum(req.accepted for req in requests if req.due >= since)
+    deadline = time.time() + args.drain
+    while True:
+        latencies = [get_latency(address, since, until) for address in addresses]
+        confirmed = sum(lat['count'] for lat in latencies)
+        if confirmed >= measured or time.time() >= deadline:
+            break
+        time.sleep(1)
+
+    accept = [req.done - req.due for req in requests if not req.failed]
+    offered = sum(req.transactions for req in requests)
+    accepted = sum(req.accepted for req in requests)
+
+    def percentile(values, pct):
+        return float(np.percentile(values, pct)) if len(values) else None
+
+    def over_nodes(func, key):
+        values = [lat[key] for lat in latencies if lat[key] is not None]
+        return float(func(values)) if values else None
+
+    result = dict(
+        rate=rate,
+        offered=offered,
+        offered_tps=offered / args.duration,
+        accepted=accepted,
+        accepted_tps=accepted / args.duration,
+        measured=measured,
+        failed=sum(req.failed for req in requests),
+        accept_p50=percentile(accept, 50),
+        accept_p95=percentile(accept, 95),
+        accept_p99=percentile(accept, 99),
+        confirmed=confirmed,
+        confirmed_tps=confirmed / window,
+        # percentiles of every node over its own transactions
+        confirm_p50=over_nodes(np.median, 'p50'),
+        confirm_p95=over_nodes(np.max, 'p95'),
+        confirm_p99=over_nodes(np.max, 'p99')
+    )
+    result['saturated'] = bool(
+        confirmed < (1 - args.tolerance) * measured
+        or result['failed'] > args.max_failures * len(requests)
+        or result['accept_p95'] is None or result['accept_p95'] > args.max_accept_latency
+    )
+    return result
+
+def get(address: str, path: str):
+    '''GET `path` of the node at `address`.
+
+    Returns:
+
+    * Decoded JSON response.'''
+
+    return json.loads(HTTP.request('GET', f'{address}{path}',
+                                   headers={'Accept': 'application/json'}).data)
+
+def get_latency(address: str, since: float, until: float):
+    '''Get confirmation latency of the transactions created by the
+    node at `address` from `since` until `until` (`time.time()`),
+    confirmed so far.
+
+    Returns:
+
+    * `dict` with count and percentiles.'''
+
+    # window back to `since`, all of their confirmations
+    window = time.time() - since + 1
+    summary = get(address, f'/latency?window={window}&local=1&since={since}&until={until}')
+    return next(iter(summary['windows'].values()))
+
+def main():
+    '''Run the steps of load.'''
+
+    parser = ArgumentParser(description='Open-loop load generator for noobcash nodes.')
+    parser.add_argument('-a', '--addresses', default=None, type=str, nargs='+',
+                        help='ip+port of the nodes to load (all of the network)')
+    parser.add_argument('--launch', default=None, type=int,
+                        help='launch a local cluster of this many nodes instead')
+    parser.add_argument('-c', '--capacity', default=10, type=int,
+                        help='number of transactions in a block (--launch)')
+    parser.add_argument('-d', '--difficulty', default=4, type=int,
+                        help='difficulty of mining (--launch)')
+    parser.add_argument('--node_args', default='', type=str,
+                        help='extra arguments of rest.py (--launch)')
+    parser.add_argument('-p', '--port', default=5000, type=int,
+                        help='port of the bootstrap (--launch)')
+    parser.add_argument('-r', '--rates', default=DEFAULT_RATES, type=float, nargs='+',
+                        help='transactions per second offered to the cluster in every step')
+    parser.add_argument('-D', '--duration', default=30, type=float, help='seconds of a step')
+    parser.add_argument('-W', '--warmup', default=10, type=float,
+                        help='seconds at the start of a step left out of confirmations')
+    parser.add_argument('--drain', default=30, type=float,
+                        help='seconds to wait for the transactions of a step to be confirmed')
+    parser.add_argument('--cooldown', default=10, type=float,
+                        help='seconds between steps, for queues to drain')
+    parser.add_argument('-k', '--batch_size', default=1, type=int,
+                        help='transactions per request, /purchase_batch if more than 1')
+    parser.add_argument('--poisson', action='store_true',
+                        help='exponential intervals between requests instead of fixed ones')
+    parser.add_argument('-s', '--script', default=None, type=str,
+                        help='directory of scripts for receivers and amounts (else random)')
+    parser.add_argument('-m', '--max_amount', default=1, type=int,
+                        help='maximum random amount')
+    parser.add_argument('--connections', default=64, type=int,
+                        help='requests in flight at most')
+    parser.add_argument('--tolerance', default=0.1, type=float,
+                        help='shortfall of confirmed throughput considered saturation')
+    parser.add_argument('--max_accept_latency', default=1.0, type=float,
+                        help='p95 accept latency (seconds) considered saturation')
+    parser.add_argument('--max_failures', default=0.01, type=float,
+                        help='fraction of failed requests considered saturation')
+    parser.add_argument('--all_steps', action='store_true',
+                        help='keep going after the first saturated step')
+    parser.add_argument('--timeout', default=600, type=float,
+                        help='seconds to wait for a launched network')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('-o', '--output', default=None, type=str,
+                        help='write results to this .json or .csv file')
+    args = parser.parse_args()
+
+    cluster = None
+    if args.launch is not None:
+        host = subprocess.check_output(['hostname', '-I']).decode().split()[0]
+        cluster = Cluster(args.launch, args.capacity, args.difficulty, host, args.port,
+                          shlex.split(args.node_args),
+                          os.path.join(tempfile.gettempdir(), 'noobcash-loadgen'))
+        cluster.wait_network(args.timeout)
+        addresses = [f'127.0.0.1:{port}' for port in cluster.ports]
+    elif args.addresses is not None:
+        addresses = args.addresses
+    else:
+        parser.error('give the --addresses of the nodes or --launch a cluster')
+
+    try:
+        ids = [get(address, '/id') for address in addresses]
+        workload = Workload(ids, args.script, args.max_amount, args.seed)
+
+        columns = ['rate', 'accepted_tps', 'failed', 'accept_p50', 'accept_p95',
+                   'confirmed_tps', 'confirm_p50', 'confirm_p95', 'saturated']
+        print(''.join(f'{column:>14}' for column in columns))
+        results, saturation = [], None
+        for step, rate in enumerate(args.rates):
+            if step:
+                time.sleep(args.cooldown)
+            result = run_step(addresses, ids, workload, rate, args)
+            results.append(result)
+            print(''.join(f'{result[column]:>14.3f}' if isinstance(result[column], float) \
+                else f'{str(result[column]):>14}' for column in columns), flush=True)
+            if result['saturated']:
+                if not args.all_steps:
+                    break
+            elif saturation is None or result['confirmed_tps'] > saturation['confirmed_tps']:
+                saturation = result
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    if saturation is None:
+        print('\nSaturated at the lowest rate')
+    else:
+        print(f'\nSaturation point: {saturation["confirmed_tps"]:.2f} tx/s confirmed '
+              f'(offered {saturation["rate"]:g} tx/s, p95 confirmation '
+              f'{saturation["confirm_p95"]} s)')
+
+    if args.output is not None:
+        write_results(args.output, results)
+
+if __name__ == '__main__':
+    main()
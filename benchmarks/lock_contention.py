@@ -0,0 +1,123 @@
+'''Throughput of a `Node` while transactions of many unrelated
+senders are received (and ours are created) concurrently. With
+`--serialized` every call goes through a single lock, as it did
+with the global `TRANSACTION_LOCK`, to compare against.
+
+Usage:
+
+python -m benchmarks.lock_contention [-s SENDERS] [-c CREATORS] [-t TRANSACTIONS] [--serialized]'''
+
+import time
+import threading
+from argparse import ArgumentParser
+
+from noobcash.node import Node
+from noobcash.transaction import Transaction
+from noobcash.transaction_output import TransactionOutput
+
+from benchmarks.common import make_wallet
+
+FUNDS = 10 ** 6
+
+def make_node(senders: list):
+    '''Create a bootstrap `Node` that knows `senders` and
+    their funds and never forks a miner.
+
+    Arguments:
+
+    * `senders`: `list` of funded `Wallet`s from `make_wallet()`.
+
+    Returns:
+
+    * `Node`.'''
+
+    node = Node(bootstrap_address='', capacity=10 ** 9, difficulty=1,
+                port=5000, nodes=len(senders) + 1, is_bootstrap=True)
+    node.mine_block = lambda: None
+
+    for i, sender in enumerate(senders):
+        idx = node.register_node_to_ring(sender.to_dict())['id']
+        # same seed utxo as make_wallet()
+        node.ring[idx].add_utxo(TransactionOutput(f'{i + 1:040x}', sender.public_key, FUNDS))
+    return node
+
+def make_chain(sender, receiver_pubk, count: int):
+    '''Create `count` transactions of `sender`, each
+    spending the change of the previous one.
+
+    Returns:
+
+    * `list` of `Transaction`s.'''
+
+    transactions = []
+    for _ in range(count):
+        transaction = Transaction(receiver_pubk, 1, sender)
+        for tro in transaction.transaction_outputs:
+            if tro.receiver_public_key is sender.public_key:
+                sender.add_utxo(tro)
+        transactions.append(transaction)
+    return transactions
+
+def run(node, chains: list, creators: int, per_creator: int, serialized: bool):
+    '''Receive `chains` (one thread per sender) while `creators`
+    threads create transactions of the node.
+
+    Returns:
+
+    * (transactions per second, `list` of results).'''
+
+    lock = threading.RLock()
+    results = []
+
+    def call(func, *args):
+        if serialized:
+            with lock:
+                return func(*args)
+        return func(*args)
+
+    def receive(chain):
+        results.extend(call(node.receive_transaction, tra) for tra in chain)
+
+    def create():
+        results.extend(call(node.create_transaction, 1, 1) is not None \
+            for _ in range(per_creator))
+
+    threads = [threading.Thread(target=receive, args=(chain,)) for chain in chains]
+    threads += [threading.Thread(target=create) for _ in range(creators)]
+
+    t_0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t_0
+
+    return len(results) / elapsed, results
+
+def main():
+    '''Run the benchmark.'''
+
+    parser = ArgumentParser()
+    parser.add_argument('-s', '--senders', default=4, type=int,
+                        help='number of other nodes sending transactions')
+    parser.add_argument('-c', '--creators', default=2, type=int,
+                        help='threads creating transactions of the node')
+    parser.add_argument('-t', '--transactions', default=100, type=int,
+                        help='transactions per sender and per creator')
+    parser.add_argument('--serialized', action='store_true',
+                        help='serialize all calls with one lock')
+    args = parser.parse_args()
+
+    senders = [make_wallet(i + 1, funds=FUNDS) for i in range(args.senders)]
+    node = make_node(senders)
+    chains = [make_chain(sender, node.my_wallet().public_key, args.transactions) \
+        for sender in senders]
+
+    tps, results = run(node, chains, args.creators, args.transactions, args.serialized)
+
+    print(f'{"mode":<12}{"threads":>8}{"calls":>8}{"accepted":>10}{"tx/s":>10}')
+    print(f'{"serialized" if args.serialized else "concurrent":<12}'
+          f'{args.senders + args.creators:>8}{len(results):>8}{sum(results):>10}{tps:>10.1f}')
+
+if __name__ == '__main__':
+    main()
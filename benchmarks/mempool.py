@@ -0,0 +1,71 @@
+'''Cost of the operations of `TransactionQueue` on large
+mempools: appending, taking a block template, removing
+the transactions of a mined block, evicting
+chains of dependent transactions and lookups.
+
+Usage:
+
+python -m benchmarks.mempool [-n SIZE] [-c CAPACITY] [-r REPEAT]'''
+
+import time
+from argparse import ArgumentParser
+
+from noobcash.transaction import Transaction
+from noobcash.transaction_queue import TransactionQueue
+
+from benchmarks.common import measure
+
+def make_stubs(count: int):
+    '''Create `count` (unsigned, empty) transactions that
+    only have an ID, enough for the queue.
+
+    Returns:
+
+    * `list` of `Transaction`s.'''
+
+    stubs = []
+    for i in range(count):
+        transaction = Transaction.__new__(Transaction)
+        transaction.transaction_id = f'{i:040x}'
+        # chains of ten, each spending the change of the previous one
+        transaction.transaction_inputs = [f'{i - 1:040x}'] if i % 10 else []
+        stubs.append(transaction)
+    return stubs
+
+def main():
+    '''Run the benchmark.'''
+
+    parser = ArgumentParser()
+    parser.add_argument('-n', '--size', default=100000, type=int,
+                        help='number of transactions in the mempool')
+    parser.add_argument('-c', '--capacity', default=10, type=int,
+                        help='number of transactions in a block')
+    parser.add_argument('-r', '--repeat', default=1000, type=int,
+                        help='repetitions of every measurement')
+    args = parser.parse_args()
+
+    transactions = make_stubs(args.size + args.capacity * args.repeat)
+    queue = TransactionQueue()
+
+    t_0 = time.perf_counter()
+    queue.extend(transactions[:args.size])
+    print(f'{"append":<16}{args.size / (time.perf_counter() - t_0):>14.1f} ops/s')
+
+    print(f'{"template":<16}'
+          f'{measure(lambda: queue.template(args.capacity), args.repeat):>14.1f} ops/s')
+    print(f'{"contains":<16}'
+          f'{measure(lambda: transactions[-1].transaction_id in queue, args.repeat):>14.1f} ops/s')
+
+    # keep the size steady: a block leaves from the start, new transactions arrive
+    arriving = iter(transactions[args.size:])
+    def mined_block():
+        block = queue.template(args.capacity)
+        queue.remove_many(tra.transaction_id for tra in block)
+        queue.extend(next(arriving) for _ in range(args.capacity))
+    print(f'{"mined block":<16}{measure(mined_block, args.repeat):>14.1f} ops/s')
+    def evict():
+        return queue.evict(queue.head(1)[0].transaction_id)
+    print(f'{"evict":<16}{measure(evict, args.repeat):>14.1f} ops/s')
+
+if __name__ == '__main__':
+    main()
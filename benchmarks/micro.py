@@ -0,0 +1,178 @@
+'''Operations per second and memory allocated per operation of the
+primitives the node is built on: creating (coin selection and
+signing), serializing and validating transactions, hashing and
+deserializing blocks and chains, copying the ring and selecting
+utxos. Results can be written to a .csv or .json file and later
+given as `--baseline` to flag regressions (exit status 1).
+
+Usage:
+
+python -m benchmarks.micro [-r REPEAT] [-b BLOCKS] [-c CAPACITY] [-w WALLETS] [-u UTXOS]
+                           [-k CASE ...] [-o OUTPUT] [--baseline BASELINE]
+                           [--tolerance TOLERANCE]'''
+
+import sys
+import json
+from argparse import ArgumentParser
+
+from noobcash import signatures
+from noobcash.helpers import object_dict_deepcopy
+from noobcash.transaction import Transaction
+from noobcash.transaction_output import TransactionOutput
+from noobcash.block import Block
+from noobcash.blockchain import Blockchain
+
+from benchmarks.common import (
+    make_wallet, make_transactions, make_blockchain, measure, measure_memory,
+    write_results, load_results, compare
+)
+from benchmarks.lock_contention import FUNDS, make_node, make_chain
+
+# columns identifying a case and compared against the baseline (higher is better?),
+# retained bytes are too small to compare relatively
+KEYS = ('case',)
+COMPARED = dict(ops=True, peak_bytes=False)
+
+def make_ring(wallets: int, utxos: int, scheme: str):
+    '''Create a ring of `wallets` `Wallet`s (sharing a key)
+    with `utxos` utxos each.
+
+    Returns:
+
+    * `dict` of index -> `Wallet`.'''
+
+    template = make_wallet(0, scheme=scheme)
+    ring = {}
+    for i in range(wallets):
+        wallet = template.deepcopy()
+        wallet.address = f'127.0.0.1:{5000 + i}'
+        for j in range(utxos):
+            wallet.add_utxo(TransactionOutput(f'{i:020x}{j:020x}', wallet.public_key, 1))
+        ring[i] = wallet
+    return ring
+
+def cases(args):
+    '''Build the benchmarks. Every one is a function that, given
+    the number of calls, does the setup of all of them and returns
+    the function of a call, so that only the operation is measured.
+
+    Returns:
+
+    * `dict` of name -> function.'''
+
+    wallets = [make_wallet(i, funds=10 ** 6, scheme=args.signature) for i in range(2)]
+    transactions = make_transactions(wallets, args.capacity * 10)
+    transaction = transactions[0]
+
+    # chain of `blocks` blocks, repeating transactions (never validated)
+    chain_transactions = (transactions * (args.blocks // 10 + 1))[:args.blocks * args.capacity]
+    blockchain = make_blockchain(chain_transactions, args.capacity)
+    block = blockchain.chain[-1]
+
+    senders = [make_wallet(1, funds=FUNDS, scheme=args.signature)]
+    node = make_node(senders)
+    receiver_pubk = node.my_wallet().public_key
+
+    ring = make_ring(args.wallets, args.utxos, args.signature)
+    utxo_wallet = make_ring(1, args.utxos, args.signature)[0]
+    all_utxos = dict(utxo_wallet.utxos)
+
+    def from_dict(cls, obj):
+        # from_dict() resolves keys in place, so every call needs its own dict
+        payload = json.dumps(obj.to_dict())
+        def make(repeat):
+            dicts = iter([json.loads(payload) for _ in range(repeat)])
+            return lambda: cls.from_dict(next(dicts))
+        return make
+
+    def create(_repeat):
+        # change goes back to the sender, which can spend it next, nothing to prepare
+        return lambda: make_transactions(wallets, 1)
+
+    def validate(repeat):
+        chain = iter(make_chain(senders[0], receiver_pubk, repeat))
+        return lambda: node.validate_transaction(next(chain), node.ring)
+
+    def select_utxos(repeat):
+        copies = iter([dict(all_utxos) for _ in range(repeat)])
+        def select():
+            # half of the utxos, the least recently added first
+            utxo_wallet.utxos, utxo_wallet.balance = next(copies), len(all_utxos)
+            return utxo_wallet.get_sufficient_utxos(args.utxos // 2)
+        return select
+
+    return {
+        'Transaction.__init__': create,
+        'Transaction.to_dict': lambda repeat: transaction.to_dict,
+        'Transaction.from_dict': from_dict(Transaction, transaction),
+        'Node.validate_transaction': validate,
+        'Block.message': lambda repeat: block.message,
+        'Block.my_hash': lambda repeat: block.my_hash,
+        'Block.from_dict': from_dict(Block, block),
+        'Blockchain.from_dict': from_dict(Blockchain, blockchain),
+        'object_dict_deepcopy': lambda repeat: lambda: object_dict_deepcopy(ring),
+        'Wallet.get_sufficient_utxos': select_utxos,
+    }
+
+# relative number of calls of every case, so that each takes a similar time
+WEIGHTS = {
+    'Transaction.__init__': 0.5,
+    'Node.validate_transaction': 0.5,
+    'Block.message': 20,
+    'Block.my_hash': 20,
+    'Transaction.to_dict': 20,
+    'Transaction.from_dict': 5,
+    'Blockchain.from_dict': 0.01,
+    'object_dict_deepcopy': 0.02,
+    'Wallet.get_sufficient_utxos': 0.5,
+}
+
+def main():
+    '''Run the benchmarks.'''
+
+    parser = ArgumentParser(description='Microbenchmarks of the primitives of noobcash.')
+    parser.add_argument('-r', '--repeat', default=200, type=int,
+                        help='calls per measurement (scaled per case)')
+    parser.add_argument('-R', '--rounds', default=3, type=int,
+                        help='measurements per case, the fastest is kept')
+    parser.add_argument('-b', '--blocks', default=1000, type=int,
+                        help='blocks of the chain of Blockchain.from_dict')
+    parser.add_argument('-c', '--capacity', default=10, type=int,
+                        help='number of transactions in a block')
+    parser.add_argument('-w', '--wallets', default=100, type=int,
+                        help='wallets of the ring of object_dict_deepcopy')
+    parser.add_argument('-u', '--utxos', default=1000, type=int,
+                        help='utxos of every wallet')
+    parser.add_argument('-g', '--signature', default=signatures.DEFAULT_SCHEME,
+                        choices=signatures.SCHEMES)
+    parser.add_argument('-k', '--case', default=None, type=str, nargs='+',
+                        help='run only these cases')
+    parser.add_argument('-o', '--output', default=None, type=str,
+                        help='write results to this .json or .csv file')
+    parser.add_argument('--baseline', default=None, type=str,
+                        help='results (.json or .csv) of a previous run to compare with')
+    parser.add_argument('--tolerance', default=0.2, type=float,
+                        help='relative change considered a regression')
+    args = parser.parse_args()
+
+    print(f'{"case":<30}{"ops/s":>14}{"peak B/op":>14}{"retained B/op":>16}')
+    results = []
+    for name, make in cases(args).items():
+        if args.case is not None and name not in args.case:
+            continue
+        repeat = max(int(args.repeat * WEIGHTS.get(name, 1)), 1)
+        ops = max(measure(make(repeat), repeat) for _ in range(args.rounds))
+        peak, retained = measure_memory(make(repeat), repeat)
+        results.append(dict(case=name, ops=ops, peak_bytes=peak, retained_bytes=retained))
+        print(f'{name:<30}{ops:>14.1f}{peak:>14.0f}{retained:>16.0f}', flush=True)
+
+    if args.output is not None:
+        write_results(args.output, results)
+
+    if args.baseline is not None:
+        print()
+        if compare(results, load_results(args.baseline), KEYS, COMPARED, args.tolerance):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''Compare the signature schemes of `noobcash.signatures`: key
+generation, signing and verification throughput, and the size of
+signatures, public keys and transactions on the wire.
+
+Usage:
+
+python -m benchmarks.signatures [-r REPEAT] [-k KEYGEN_REPEAT]'''
+
+import json
+from argparse import ArgumentParser
+
+from noobcash import signatures, wire
+from noobcash.helpers import pubk_to_dict
+
+from benchmarks.common import make_wallet, make_transactions, measure
+
+def main():
+    '''Run the benchmark.'''
+
+    parser = ArgumentParser()
+    parser.add_argument('-r', '--repeat', default=200, type=int,
+                        help='repetitions of signing and verification')
+    parser.add_argument('-k', '--keygen_repeat', default=5, type=int,
+                        help='repetitions of key generation')
+    args = parser.parse_args()
+
+    print(f'{"scheme":<10}{"keygen/s":>12}{"sign/s":>12}{"verify/s":>12}'
+          f'{"sig B":>8}{"key B":>8}{"tx json B":>12}{"tx bin B":>12}')
+    for scheme in signatures.SCHEMES:
+        # loop variables are bound as defaults of the measured functions
+        keygen = measure(lambda scheme=scheme: signatures.generate_key(scheme),
+                         args.keygen_repeat)
+
+        wallets = [make_wallet(i, funds=10 ** 6, scheme=scheme) for i in range(2)]
+        transaction, = make_transactions(wallets, 1)
+        hash_obj = transaction.make_hash(as_str=False)
+        private_key = wallets[0].private_key
+        public_key = wallets[0].public_key
+        sign = measure(lambda key=private_key, obj=hash_obj: signatures.sign(key, obj),
+                       args.repeat)
+        verify = measure(lambda key=public_key, obj=hash_obj, sig=transaction.signature:
+                         signatures.verify(key, obj, sig), args.repeat)
+
+        key_size = len(json.dumps(pubk_to_dict(public_key)))
+        json_size = len(json.dumps(transaction.to_dict()))
+        binary_size = len(wire.encode(transaction, 'binary')[0])
+        print(f'{scheme:<10}{keygen:>12.1f}{sign:>12.1f}{verify:>12.1f}'
+              f'{len(transaction.signature):>8}{key_size:>8}{json_size:>12}{binary_size:>12}')
+
+if __name__ == '__main__':
+    main()
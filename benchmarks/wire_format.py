@@ -0,0 +1,60 @@
+'''Compare encode/decode throughput and payload size of
+the binary wire format (`noobcash.wire`) against JSON.
+
+Usage:
+
+python -m benchmarks.wire_format [-t TRANSACTIONS] [-c CAPACITY] [-r REPEAT]'''
+
+import json
+from argparse import ArgumentParser
+
+from noobcash import wire
+from noobcash.transaction import Transaction
+from noobcash.block import Block
+from noobcash.blockchain import Blockchain
+
+from benchmarks.common import make_wallet, make_transactions, make_blockchain, measure
+
+def compare(name: str, obj, from_dict, decoder, repeat: int):
+    '''Print a row of the comparison for `obj`.'''
+
+    json_payload = json.dumps(obj.to_dict()).encode('utf-8')
+    binary_payload = wire.encode(obj, 'binary')[0]
+
+    rows = [
+        ('json', len(json_payload),
+         measure(lambda: json.dumps(obj.to_dict()).encode('utf-8'), repeat),
+         measure(lambda: from_dict(json.loads(json_payload)), repeat)),
+        ('binary', len(binary_payload),
+         measure(lambda: wire.encode(obj, 'binary'), repeat),
+         measure(lambda: decoder(binary_payload), repeat)),
+    ]
+    for fmt, size, enc, dec in rows:
+        print(f'{name:<12}{fmt:<8}{size:>12}{enc:>14.1f}{dec:>14.1f}')
+
+def main():
+    '''Run the benchmark.'''
+
+    parser = ArgumentParser()
+    parser.add_argument('-t', '--transactions', default=500, type=int,
+                        help='number of transactions in the chain')
+    parser.add_argument('-c', '--capacity', default=10, type=int,
+                        help='number of transactions in a block')
+    parser.add_argument('-r', '--repeat', default=50, type=int,
+                        help='repetitions of every measurement')
+    args = parser.parse_args()
+
+    wallets = [make_wallet(i, funds=10 ** 6) for i in range(5)]
+    transactions = make_transactions(wallets, args.transactions)
+    blockchain = make_blockchain(transactions, args.capacity)
+
+    print(f'{"object":<12}{"format":<8}{"bytes":>12}{"encode/s":>14}{"decode/s":>14}')
+    compare('transaction', transactions[0], Transaction.from_dict,
+            wire.decode_transaction, args.repeat * 20)
+    compare('block', blockchain.chain[-1], Block.from_dict,
+            wire.decode_block, args.repeat * 2)
+    compare('blockchain', blockchain, Blockchain.from_dict,
+            wire.decode_blockchain, max(args.repeat // 10, 1))
+
+if __name__ == '__main__':
+    main()
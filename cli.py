@@ -3,7 +3,9 @@
 Usage:
 
 python cli.py [-c CAPACITY] [-n NODES] [-d DIFFICULTY] [-a BOOTSTRAP_ADDRESS]
-              [-p PORT] [-b] [-s SCRIPT]'''
+              [-p PORT] [-b] [-s SCRIPT] [-S {waitress,dev}] [-W WORKERS]
+              [-B BLOCK_WAIT] [-I BLOCK_INTERVAL] [-k BATCH_SIZE]
+              [-g {rsa,ecdsa,ed25519}] [--hash {sha1,sha256,blake2b}]'''
 
 import argparse
 import subprocess
@@ -64,10 +66,25 @@ PARSER.add_argument('-b', '--bootstrap', default=False, action='store_true',
 PARSER.add_argument('-c', '--capacity', default=10, type=int,
                     help='number of transactions in a block')
 PARSER.add_argument('-n', '--nodes', default=5, type=int, help='number of nodes in the network')
-PARSER.add_argument('-d', '--difficulty', default=3, type=int, help='difficulty of mining')
+PARSER.add_argument('-d', '--difficulty', default=3, type=int,
+                    help='(initial) difficulty of mining')
 PARSER.add_argument('-a', '--bootstrap_address', default='', type=str,
                     help='Bootstrap\'s ip+port')
 PARSER.add_argument('-s', '--script', type=str, help='directory of transactions to execute')
+PARSER.add_argument('-S', '--server', default='waitress', choices=['waitress', 'dev'],
+                    help='HTTP server of the node')
+PARSER.add_argument('-W', '--workers', default=16, type=int,
+                    help='threads serving requests of the node')
+PARSER.add_argument('-B', '--block_wait', default=10, type=float,
+                    help='seconds after which the node mines a partial block, 0 to disable')
+PARSER.add_argument('-I', '--block_interval', default=0, type=float,
+                    help='target seconds per block to retarget difficulty, 0 to keep it fixed')
+PARSER.add_argument('-g', '--signature', default='rsa', choices=['rsa', 'ecdsa', 'ed25519'],
+                    help='signature scheme of the network (bootstrap only)')
+PARSER.add_argument('--hash', default='sha1', choices=['sha1', 'sha256', 'blake2b'],
+                    help='hash function of the network (bootstrap only)')
+PARSER.add_argument('-k', '--batch_size', default=20, type=int,
+                    help='transactions of the script sent per request')
 
 ARGS = PARSER.parse_args()
 
@@ -86,7 +103,9 @@ BOOTSTRAP_URL = ARGS.bootstrap_address
 CMD_NODE = 'python noobcash/rest.py' + \
            f' -p {PORT}' + (' -b' if BOOTSTRAP else '') + \
            f' -c {CAPACITY} -n {NODES} -d {DIFFICULTY}' + \
-           f' -a \'{BOOTSTRAP_URL}\''
+           f' -a \'{BOOTSTRAP_URL}\'' + \
+           f' -S {ARGS.server} -W {ARGS.workers} -B {ARGS.block_wait}' + \
+           f' -I {ARGS.block_interval} -g {ARGS.signature} --hash {ARGS.hash}'
 
 # suppress output of flask app
 with open(os.devnull, 'w') as fp:
@@ -126,35 +145,39 @@ if ARGS.script is not None:
     SCRIPT = os.path.join(ARGS.script, f'{NODES}nodes', f'transactions{MY_ID}.txt')
 
     lines = open(SCRIPT).readlines()
-    rows = map(get_row, lines)
+    rows = list(map(get_row, lines))
     
     timestamp = time.time()
     line_id = 0
 
-    for row in rows:
-        idx, amount = row
-        line_id += 1
+    # Uncomment next line to run given scripts with <5 / <10 nodes
+    #rows = [(idx, amount) for idx, amount in rows if idx < NODES]
 
-        # Uncomment next 2 lines to run given scripts with <5 / <10 nodes
-        #if idx >= NODES:
-        #    continue
+    for start in range(0, len(rows), ARGS.batch_size):
+        batch = rows[start:start + ARGS.batch_size]
 
-        transaction = {'receiver_idx': idx, 'amount': amount}
-        print(nbc_cmd('Trx') +  str(line_id) + nbc_cmd(': Sending ') + str(amount) + \
-              nbc_cmd(f' NBC coin{"s" if amount > 1 else ""} to node ') + str(idx))
+        for idx, amount in batch:
+            line_id += 1
+            print(nbc_cmd('Trx') +  str(line_id) + nbc_cmd(': Sending ') + str(amount) + \
+                  nbc_cmd(f' NBC coin{"s" if amount > 1 else ""} to node ') + str(idx))
+
+        purchases = {
+            'purchases': [{'receiver_idx': idx, 'amount': amount} for idx, amount in batch],
+            'black_hat': True
+        }
 
         while True:
             try:
-                status = HTTP.request('POST', f'{URL}/black_hat_purchase',
+                status = HTTP.request('POST', f'{URL}/purchase_batch',
                                       headers={'Content-Type': 'application/json'},
-                                      body=json.dumps(transaction)).status
+                                      body=json.dumps(purchases)).status
             except Exception:
                 status = 200 # avoid "Remote end closed connection without response"
 
             if status == 200:
                 break
 
-            print(error('Error while executing transaction!'))
+            print(error('Error while executing transactions!'))
 
     duration = time.time() - timestamp
 
@@ -170,7 +193,10 @@ if ARGS.script is not None:
 HELP = '''This is the NOOBCASH command line interface.
 
 To launch shell, execute cli.py [-h] [-p PORT] [-b] [-c CAPACITY] [-n NODES] [-d DIFFICULTY]
-                                [-a BOOTSTRAP_ADDRESS] [-s SCRIPT]
+                                [-a BOOTSTRAP_ADDRESS] [-s SCRIPT] [-S {waitress,dev}]
+                                [-W WORKERS] [-B BLOCK_WAIT] [-I BLOCK_INTERVAL]
+                                [-k BATCH_SIZE] [-g {rsa,ecdsa,ed25519}]
+                                [--hash {sha1,sha256,blake2b}]
 
 optional arguments:
   -h, --help            show this help message and exit
@@ -181,11 +207,30 @@ optional arguments:
   -n NODES, --nodes NODES
                         number of nodes in the network
   -d DIFFICULTY, --difficulty DIFFICULTY
-                        difficulty of mining
+                        (initial) difficulty of mining
   -a BOOTSTRAP_ADDRESS, --bootstrap_address BOOTSTRAP_ADDRESS
                         Bootstrap's ip+port
   -s SCRIPT, --script SCRIPT
                         directory of transactions to execute
+  -S {waitress,dev}, --server {waitress,dev}
+                        HTTP server of the node
+  -W WORKERS, --workers WORKERS
+                        threads serving requests of the node
+  -B BLOCK_WAIT, --block_wait BLOCK_WAIT
+                        seconds after which the node mines a
+                        partial block, 0 to disable
+  -I BLOCK_INTERVAL, --block_interval BLOCK_INTERVAL
+                        target seconds per block to retarget
+                        difficulty, 0 to keep it fixed
+  -g {rsa,ecdsa,ed25519}, --signature {rsa,ecdsa,ed25519}
+                        signature scheme of the network
+                        (bootstrap only)
+  --hash {sha1,sha256,blake2b}
+                        hash function of the network
+                        (bootstrap only)
+  -k BATCH_SIZE, --batch_size BATCH_SIZE
+                        transactions of the script sent
+                        per request
 
 While using the shell, use following commands:
   help                  show this help message
@@ -0,0 +1,71 @@
+'''Block assembly scheduler. Mining normally starts once `capacity`
+transactions are queued. The scheduler also starts it, on a partial
+block, when the oldest queued transaction has waited for `max_wait`
+seconds, so that transactions are confirmed under light load too.'''
+
+import threading
+
+class BlockAssembler:
+    '''Block assembly scheduler. Mining normally starts once `capacity`
+    transactions are queued. The scheduler also starts it, on a partial
+    block, when the oldest queued transaction has waited for `max_wait`
+    seconds, so that transactions are confirmed under light load too.'''
+
+    def __init__(self, node, max_wait: float, interval=None):
+        '''Initialize `BlockAssembler` object.
+
+        Arguments:
+
+        * `node`: `Node` whose queue is mined.
+
+        * `max_wait`: seconds a transaction may wait before
+        a partial block is mined, 0 to disable.
+
+        * `interval`: seconds between checks. Default: a
+        quarter of `max_wait`, up to 1 second.'''
+
+        self.node = node
+        self.max_wait = max_wait
+        self.interval = interval if interval is not None else min(max_wait / 4, 1)
+
+        self.checks = 0
+        self.partial_blocks = 0 # times mining started because of max_wait
+
+        self._stop = threading.Event()
+        self._worker = None
+
+    def start(self):
+        '''Start the (daemon) scheduler, if enabled.'''
+
+        if self._worker is None and self.max_wait > 0:
+            self._worker = threading.Thread(target=self._work, name='assembly', daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        '''Stop the scheduler.'''
+        self._stop.set()
+
+    def _work(self):
+        '''Main loop of the scheduler.'''
+
+        while not self._stop.wait(self.interval):
+            self.checks += 1
+            if self.node.mine_overdue_block(self.max_wait):
+                self.partial_blocks += 1
+
+    def stats(self):
+        '''Get configuration and counters of the scheduler, along
+        with the confirmation latency of the node.
+
+        Returns:
+
+        * `dict`.'''
+
+        return dict(
+            max_wait=self.max_wait,
+            capacity=self.node.capacity,
+            checks=self.checks,
+            partial_blocks=self.partial_blocks,
+            block_sizes=self.node.block_sizes.summary(),
+            confirmation_latency=self.node.latency.sample.summary()
+        )
@@ -1,20 +1,28 @@
 '''Block of a blockchain. Contains integer `index`,
 `previous_hash` of previous in the blockchain block and `hash` as strings,
-integer `nonce` when it is mined, list `list_of_transactions` of "valid"
-Transaction objects and `timestamp` of creation.'''
+integer `nonce` when it is mined, integer `difficulty` it was mined with,
+list `list_of_transactions` of "valid" Transaction objects and `timestamp`
+of creation.'''
 
 import time
 import json
 import numpy as np
-from Crypto.Hash import SHA
 
 from noobcash.transaction import Transaction
+from noobcash import hashing
+
+# nonces are 32-bit
+NONCE_RANGE = 2 ** 32
+# nonces tried per call of `search_nonce()` by `mine()`, which never
+# stops by itself (the miner process is killed, see `noobcash.mining`)
+MINING_CHUNK = 2 ** 16
 
 class Block:
     '''Block of a blockchain. Contains integer `index`,
     `previous_hash` of previous in the blockchain block and `hash` as strings,
-    integer `nonce` when it is mined, list `list_of_transactions` of "valid"
-    Transaction objects and `timestamp` of creation.'''
+    integer `nonce` when it is mined, integer `difficulty` it was mined with,
+    list `list_of_transactions` of "valid" Transaction objects and `timestamp`
+    of creation.'''
 
     def __init__(self, blockchain, genesis_transaction=None):
         '''Initialize `Block` object.
@@ -31,7 +39,6 @@ class Block:
         # NOTE: hashes are kept as (hex) strings since
         # their only purposes are comparison and mining
 
-        self._hash_bits = SHA.digest_size * 8 # bytes -> bits
         if blockchain is None:
             # if blockchain is None => GENESIS block
             assert genesis_transaction is not None
@@ -40,10 +47,12 @@ class Block:
             self.nonce = 0
             self.list_of_transactions = [genesis_transaction]
             self.hash = '0'
+            self.difficulty = 0 # not mined
         else:
             self.index = len(blockchain)
             self.previous_hash = blockchain.get_block_hash(-1)
             self.list_of_transactions = []
+            self.difficulty = 0 # set by mine()
 
         self.timestamp = time.time()
 
@@ -64,6 +73,7 @@ class Block:
         inst.previous_hash = block['previous_hash']
         inst.hash = block['hash']
         inst.nonce = block['nonce']
+        inst.difficulty = block['difficulty']
         inst.list_of_transactions = [
             Transaction.from_dict(t) for t in block['list_of_transactions']
         ]
@@ -71,23 +81,38 @@ class Block:
 
         return inst
 
-    def message(self):
-        '''"Arbitrary" choice of form of data to pass to hash function
-        to produce `hash` of block, used for mining and validating.
+    def message_prefix(self):
+        '''Everything of `message()` but the nonce, hashed
+        once per block while mining.
 
         Returns:
 
-        * `str` that somehow contains block's transactions,
-        previous_hash, nonce [and index].'''
+        * `bytes`.'''
 
+        # difficulty and timestamp are covered by the proof-of-work
+        # as the difficulty of later blocks is based on them
         return json.dumps(dict(
             index=self.index,
             previous_hash=self.previous_hash,
-            nonce=self.nonce,
+            difficulty=self.difficulty,
+            timestamp=self.timestamp,
             list_of_transactions=[
                 t.to_dict() for t in self.list_of_transactions
             ]
-        ))
+        )).encode('utf-8')
+
+    def message(self):
+        '''"Arbitrary" choice of form of data to pass to hash function
+        to produce `hash` of block, used for mining and validating.
+        The nonce comes last, so that the hash state of the rest
+        can be reused for every nonce.
+
+        Returns:
+
+        * `bytes` that somehow contain block's transactions,
+        previous_hash, difficulty, timestamp, index and nonce.'''
+
+        return self.message_prefix() + str(self.nonce).encode('utf-8')
 
     def to_dict(self):
         '''Transform attributes to `dict` for
@@ -101,6 +126,7 @@ class Block:
             index=self.index,
             previous_hash=self.previous_hash,
             nonce=self.nonce,
+            difficulty=self.difficulty,
             list_of_transactions=[
                 t.to_dict() for t in self.list_of_transactions
             ],
@@ -117,7 +143,7 @@ class Block:
         * Hexadecimal number in the form of a `str`
         of hashed `message()` of block.'''
 
-        self.hash = SHA.new(data=self.message().encode('utf-8')).hexdigest()
+        self.hash = hashing.hexdigest(self.message())
         return self.hash
 
     def __len__(self):
@@ -151,17 +177,62 @@ class Block:
 
         Arguments:
 
-        * `difficulty`: the difficulty of mining.'''
+        * `difficulty`: the difficulty of mining.
+
+        Returns:
 
+        * `int` number of nonces tried.'''
+
+        self.difficulty = difficulty
+        prefix = hashing.new(self.message_prefix())
+        first = start = np.random.randint(NONCE_RANGE)
         while True:
-            self.nonce = np.random.randint(2 ** 32)
-            if self.validate_hash(difficulty):
+            nonce = self.search_nonce(prefix, difficulty, start, MINING_CHUNK)
+            if nonce is not None:
                 break
+            start += MINING_CHUNK
+        self.nonce = nonce
+        self.my_hash()
+        return (nonce - first) % NONCE_RANGE + 1
+
+    @staticmethod
+    def search_nonce(prefix, difficulty: int, start: int, tries: int):
+        '''Try consecutive nonces for Proof-of-work.
+
+        Arguments:
+
+        * `prefix`: hash object of `message_prefix()`.
+
+        * `difficulty`: the difficulty of mining.
+
+        * `start`: first nonce to try.
+
+        * `tries`: number of nonces to try.
+
+        Returns:
+
+        * `int` nonce if found, else `None`.'''
+
+        target = 2 ** (prefix.digest_size * 8 - difficulty)
+        for nonce in range(start, start + tries):
+            nonce %= NONCE_RANGE
+            _hash = prefix.copy()
+            _hash.update(str(nonce).encode('utf-8'))
+            if int.from_bytes(_hash.digest(), 'big') < target:
+                return nonce
+        return None
+
+    def validate_hash(self, difficulty=None):
+        '''Return whether nonce constitutes Proof-of-work.
+
+        Arguments:
 
-    def validate_hash(self, difficulty: int):
-        '''Return whether nonce constitutes Proof-of-work.'''
+        * `difficulty`: the difficulty to check against. Default:
+        `None`, the block's `difficulty`.'''
 
-        return int(self.my_hash(), 16) < 2 ** (self._hash_bits - difficulty)
+        if difficulty is None:
+            difficulty = self.difficulty
+        return int(self.my_hash(), 16) < 2 ** (hashing.digest_bits() - difficulty)
 
     def __str__(self):
         '''Used for debugging, returns a `json.dumps`'d `dict`.'''
@@ -23,6 +23,8 @@ class Blockchain:
 
         self.chain = []
         self.hashes_set = set()
+        # ID -> `Transaction` for all transactions in chain
+        self.transaction_index = dict()
 
         if genesis_transaction is not None:
             self.append_block(Block(None, genesis_transaction))
@@ -71,13 +73,50 @@ class Blockchain:
         return self.chain[i].hash
 
     def append_block(self, block: Block):
-        '''Append block to chain and renew `hashes_set`.
+        '''Append block to chain and renew `hashes_set`
+        and `transaction_index`.
 
         Arguments:
 
         * `block`: `Block` to append.'''
         self.chain.append(block)
         self.hashes_set.add(block.hash)
+        self.transaction_index.update(
+            (tra.transaction_id, tra) for tra in block.list_of_transactions)
+
+    def __contains__(self, transaction_id: str):
+        '''Check if transaction with `transaction_id` is in the chain.'''
+        return transaction_id in self.transaction_index
+
+    def get_transaction(self, transaction_id: str):
+        '''Get transaction of the chain by ID.
+
+        Arguments:
+
+        * `transaction_id`: hex digest.
+
+        Returns:
+
+        * `Transaction` or `None` if not in the chain.'''
+
+        return self.transaction_index.get(transaction_id)
+
+    def fork_point(self, blockchain):
+        '''Find where this chain and `blockchain` diverge.
+
+        Arguments:
+
+        * `blockchain`: another `Blockchain`.
+
+        Returns:
+
+        * Index of the first block that differs (or length
+        of the shortest chain if one extends the other).'''
+
+        for i, (mine, theirs) in enumerate(zip(self.chain, blockchain.chain)):
+            if mine.hash != theirs.hash:
+                return i
+        return min(len(self), len(blockchain))
 
     def __len__(self):
         '''Returns number of (validated) blocks.'''
@@ -0,0 +1,435 @@
+'''Acceptance of blocks by the `Node`, mined by itself or received,
+validation of blocks and blockchains and resolution of conflicts
+by adopting the longest blockchain of the network.'''
+
+from typing import Union
+import wrapt
+import urllib3
+import numpy as np
+
+from noobcash.block import Block
+from noobcash.wallet import Wallet
+from noobcash.blockchain import Blockchain
+from noobcash.helpers import pubk_to_key, object_dict_deepcopy
+from noobcash.transaction_queue import TransactionQueue
+from noobcash.locks import BLOCK_LOCK, TRANSACTION_LOCK
+from noobcash.tracing import TRACER
+from noobcash import metrics
+
+class ConsensusMixin:
+    '''Consensus methods of `Node` (uses its blockchain, rings, queues and miner).'''
+
+    def confirm_transactions(self, block: Block):
+        '''Remove the transactions of `block` from the queue
+        (their confirmation latency is recorded by `latency`).
+
+        Arguments:
+
+        * `block`: `Block` appended to the blockchain.
+
+        Returns:
+
+        * `list` of removed `Transaction`s.'''
+
+        return self.transaction_queue.remove_many(
+            [tra.transaction_id for tra in block.list_of_transactions])
+
+    @wrapt.synchronized(BLOCK_LOCK)
+    @wrapt.synchronized(TRANSACTION_LOCK.shared) # no evictions meanwhile
+    def check_my_mined_block(self, block_dict: Union[dict, Block]):
+        '''Check block returned from miner and its coherence
+        with the current blockchain. Append if everything
+        is proper. Renew miner. NOTE: block is not broadcasted.
+
+        Arguments:
+
+        * `block_dict`: `dict` directly from `to_dict()` or `Block`.
+
+        Returns:
+
+        * The mined block or `None` if not appended.'''
+
+        block = block_dict
+        if isinstance(block_dict, dict):
+            block = Block.from_dict(block_dict)
+
+        if block.previous_hash == self.blockchain.get_block_hash(-1) and \
+            all(tra in self.transaction_queue for tra in block.list_of_transactions):
+
+            self.confirm_transactions(block)
+            self.block_sizes.add(len(block.list_of_transactions))
+            # allow miner to be recalled now that the transaction queue is up-to-date
+            self.miner_done()
+
+            for tra in block.list_of_transactions:
+                self.add_utxos(tra.transaction_outputs, ring=self.ring_bak)
+                self.ring_bak[self.pubk2ind[pubk_to_key(tra.sender_pubk)]]\
+                    .remove_utxos(tra.transaction_inputs)
+
+            # NOTE: broadcast block from API so not inside lock
+            # self.broadcast_block(block)
+
+            self.seen_blocks.add(block.hash)
+            self.record_block(block, 'mined')
+            self.latency.included(tra.transaction_id for tra in block.list_of_transactions)
+            self.blockchain.append_block(block)
+
+        else:
+            # new blockchain/block received (or transactions evicted) and miner
+            # was not killed in time, enable to recall, but transaction queue
+            # is new so dont meddle
+            self.miner_done()
+            block = None
+
+        if len(self.transaction_queue) >= self.capacity:
+            self.mine_block()
+
+        return block
+
+    def record_block(self, block: Block, source: str):
+        '''Record metrics of `block` before it is appended.
+
+        Arguments:
+
+        * `block`: `Block` extending our blockchain.
+
+        * `source`: 'mined' or 'received'.'''
+
+        metrics.BLOCKS.labels(source).inc()
+        metrics.BLOCK_INTERVAL_SECONDS.observe(
+            block.timestamp - self.blockchain.chain[-1].timestamp)
+
+    def valid_proof(self, block: Block, ring: dict, chain=None):
+        '''Validate `block` and renew wallets of `ring` based
+        on it. Revert `ring` if block is not valid.
+
+        Arguments:
+
+        * `block`: `Block` to be validated.
+
+        * `ring`: ring of `Wallet`s.
+
+        * `chain`: `list` of `Block`s `block` extends, to get the
+        expected difficulty. Default: `None`, our blockchain.
+
+        Return:
+
+        * Whether `block` is valid.'''
+
+        with metrics.VALID_PROOF_SECONDS.time():
+            return self._valid_proof(block, ring, chain)
+
+    def _valid_proof(self, block: Block, ring: dict, chain):
+        '''`valid_proof()` without timing.'''
+
+        if chain is None:
+            chain = self.blockchain.chain
+        if block.difficulty != self.retarget.expected(chain) or \
+            not self.retarget.valid_timestamp(chain, block.timestamp) or \
+            not block.validate_hash():
+            return False
+
+        ring_bak_bak = object_dict_deepcopy(ring)
+
+        try:
+            for tra in block.list_of_transactions:
+                if not self.validate_transaction(tra, ring):
+                    raise ValueError
+                self.add_utxos(tra.transaction_outputs, ring)
+        except ValueError:
+            for k in ring: # change values, not pointer
+                           # no deepcopy for efficiency
+                ring[k] = ring_bak_bak[k]
+            return False
+
+        return True
+
+    def valid_chain(self, blockchain):
+        '''Validate `blockchain` and renew both rings along
+        with it.
+
+        Arguments:
+
+        * `blockchain`: `Blockchain` to be validated.
+
+        Returns:
+
+        * Whether `blockchain` is valid.'''
+
+        validated = self.valid_blocks(blockchain.chain)
+        if validated is None:
+            return None
+        return validated[0]
+
+    def valid_blocks(self, blocks):
+        '''Validate blocks one by one as they become available
+        (e.g. while a blockchain is being downloaded) and build
+        the ring and the `Blockchain` along with them. Stops
+        consuming `blocks` at the first invalid one.
+
+        Arguments:
+
+        * `blocks`: iterable of `Block`s, starting from genesis.
+
+        Returns:
+
+        * (new ring, `Blockchain`) if valid, else `None`.'''
+
+        # includes the time to download `blocks` if they are streamed
+        with metrics.VALID_CHAIN_SECONDS.time():
+            return self._valid_blocks(blocks)
+
+    def _valid_blocks(self, blocks):
+        '''`valid_blocks()` without timing.'''
+
+        # check for the longer chain across all nodes
+        new_ring = {k: Wallet.from_dict(self.ring[k].to_dict()) for k in self.ring}
+        new_ring[self.my_id].private_key = self.my_wallet().private_key
+
+        blockchain = Blockchain()
+
+        for block in blocks:
+            if len(blockchain) == 0:
+                # add genesis transaction
+                genesis_tra = block.list_of_transactions[0]
+                self.add_utxos(genesis_tra.transaction_outputs, new_ring)
+            elif block.previous_hash != blockchain.get_block_hash(-1) or \
+                not self.valid_proof(block, new_ring, blockchain.chain):
+                return None
+            blockchain.append_block(block)
+
+        if len(blockchain) == 0:
+            return None
+
+        return new_ring, blockchain
+
+    def longest_blockchain_info(self):
+        '''Get length and index of node with the longest blockchain.'''
+
+        blockchain_lengths = self.transport.map(
+            self.transport.blockchain_length,
+            [self.ring[idx].address for idx in self.ring if idx != self.my_id]
+        )
+
+        # NOTE: Consider returning the whole list to be able to loop in case of lying
+
+        node_with_longest_chain = np.argmax(blockchain_lengths)
+        max_blockchain_len = blockchain_lengths[node_with_longest_chain]
+
+        if node_with_longest_chain >= self.my_id:
+            # renew index because ours is not included in the list returned
+            node_with_longest_chain += 1
+
+        return node_with_longest_chain, max_blockchain_len
+
+    def resolve_conflicts(self):
+        '''Try and get longest chain from the network. If
+        new blockchain is indeed found, renew rings and
+        transaction queues.
+
+        Returns:
+
+        * `True` is new blockchain is embraced.'''
+
+        node_with_longest_chain, max_blockchain_len = self.longest_blockchain_info()
+
+        if len(self.blockchain) > max_blockchain_len:
+            return False
+
+        if len(self.blockchain) == max_blockchain_len and \
+            self.my_id < node_with_longest_chain:
+            return False
+
+        # stream the blockchain block by block and validate while downloading
+        blocks = self.transport.stream_blockchain(self.ring[node_with_longest_chain].address,
+                                                  self.wire_format)
+        try:
+            # renews both rings
+            validated = self.valid_blocks(blocks)
+        except (ValueError, KeyError, TypeError, urllib3.exceptions.HTTPError):
+            validated = None
+        finally:
+            blocks.close()
+
+        if validated is None:
+            return False
+        new_ring, blockchain = validated
+
+        # acquire TRANSACTION_LOCK.exclusive
+        self.accept_foreign_blockchain(new_ring, blockchain)
+
+        return True
+
+    @wrapt.synchronized(BLOCK_LOCK) # redundant as this function was specifically designed
+                                    # to be used inside a BLOCK_LOCK to get TRANSACTION_LOCK
+                                    # include for consistency (and lock order)
+    @wrapt.synchronized(TRANSACTION_LOCK.exclusive)
+    def accept_foreign_blockchain(self, new_ring, blockchain):
+        '''Wrapper around commands that require the TRANSACTION_LOCK
+        (exclusively, rings and queues are replaced) when a new
+        blockchain is accepted.
+
+        Arguments:
+
+        * `new_ring`: the state of the ring of the newly
+        received `blockchain`.
+
+        * `blockchain`: the newly received `Blockchain`.'''
+
+        # keep transactions that have been sent to us
+        # but do not exist in the received blockchain
+
+        self.kill_miner()
+
+        self.ring_bak = object_dict_deepcopy(new_ring)
+        self.ring = object_dict_deepcopy(new_ring)
+
+        # blocks before the fork point are common, so only
+        # the transactions of ours after it can be missing
+        fork_point = self.blockchain.fork_point(blockchain)
+        metrics.ORPHANED_BLOCKS.inc(len(self.blockchain) - fork_point)
+        orphaned = []
+        for blck in self.blockchain.chain[fork_point:]:
+            orphaned.extend(blck.list_of_transactions)
+        self.latency.reorged_out(
+            tra.transaction_id for tra in orphaned if tra.transaction_id not in blockchain)
+        for blck in blockchain.chain[fork_point:]:
+            self.latency.included(tra.transaction_id for tra in blck.list_of_transactions)
+        orphaned.extend(self.transaction_queue.transactions())
+
+        self.unprocessed_transaction_queue.set(
+            tra for tra in self.unprocessed_transaction_queue \
+                if tra.transaction_id not in blockchain)
+        self.transaction_queue.empty()
+
+        self.blockchain = blockchain
+        metrics.REORGS.inc()
+
+        # renew ring to be able to receive new transactions
+        # based on the ones we have already received
+        self.reinsert_transactions(
+            tra for tra in orphaned if tra.transaction_id not in blockchain)
+        # also evicts transactions if necessary
+        self.process_transactions()
+
+    def reinsert_transactions(self, transactions):
+        '''Apply authentic transactions (e.g. of the queue and of orphaned
+        blocks after a new blockchain) to `ring` and queue them again, in
+        order. Signatures are not checked again. A transaction that is no
+        longer valid is dropped along with its descendants, which are not
+        validated at all. Requires TRANSACTION_LOCK.exclusive.
+
+        Arguments:
+
+        * `transactions`: iterable of `Transaction`s, parents before children.
+
+        Returns:
+
+        * `list` of dropped `Transaction`s.'''
+
+        candidates = TransactionQueue(transactions)
+        dropped = []
+
+        for tra in candidates:
+            if tra not in candidates: # descendant of a dropped one
+                continue
+            try:
+                valid = self.validate_transaction(tra, self.ring, check_signature=False)
+            except KeyError: # unknown sender
+                valid = False
+            if valid:
+                self.transaction_queue.append(tra)
+                self.add_utxos(tra.transaction_outputs, self.ring)
+            else:
+                dropped.extend(candidates.evict(tra.transaction_id))
+
+        return dropped
+
+    def receive_block(self, block_dict: Union[dict, Block]):
+        '''Check if block is redundant to handle, proper to append
+        to the blockchain (and kill miner) or ask for new blockchain.
+
+        Arguments:
+
+        * `block_dict`: `dict` directly from `to_dict()` or `Block`.
+
+        Returns:
+
+        * `True` if new block is accepted (even if it requires a new blockchain).'''
+
+        # waiting for the BLOCK_LOCK is traced apart from handling the block
+        with TRACER.span('lock'):
+            BLOCK_LOCK.acquire()
+        try:
+            return self._receive_block(block_dict)
+        finally:
+            BLOCK_LOCK.release()
+
+    def _receive_block(self, block_dict: Union[dict, Block]):
+        '''`receive_block()` holding the BLOCK_LOCK.'''
+
+        block = block_dict
+        if isinstance(block_dict, dict):
+            block = Block.from_dict(block_dict)
+        # NOTE: check capacity?
+
+        if block.hash in self.blockchain.hashes_set:
+            return False
+
+        if block.previous_hash in self.blockchain.hashes_set and \
+            block.previous_hash != self.blockchain.get_block_hash(-1):
+            # remember stale block only if its hash is authentic
+            claimed_hash = block.hash
+            if block.my_hash() == claimed_hash:
+                self.seen_blocks.add(claimed_hash)
+                metrics.STALE_BLOCKS.inc()
+            return False
+
+        if block.previous_hash != self.blockchain.get_block_hash(-1):
+            with TRACER.span('resolve_conflicts'), metrics.RESOLVE_SECONDS.time():
+                accepted = self.resolve_conflicts()
+            metrics.RESOLVES.labels('adopted' if accepted else 'kept').inc()
+            if block.hash in self.blockchain.hashes_set:
+                self.seen_blocks.add(block.hash)
+            return accepted
+
+        with TRACER.span('validate'):
+            valid = self.valid_proof(block, self.ring_bak) # use bak to validate
+                                                           # if valid, ring_bak is updated
+        if valid:
+            self.seen_blocks.add(block.hash)
+            # acquire TRANSACTION_LOCK.exclusive
+            with TRACER.span('apply'):
+                self.accept_foreign_block(block)
+
+            return True
+
+        return False
+
+    @wrapt.synchronized(TRANSACTION_LOCK.exclusive)
+    def accept_foreign_block(self, block):
+        '''Wrapper around commands that require the TRANSACTION_LOCK
+        (exclusively, the queue is rebuilt) when a new block is
+        accepted (not a new blockchain).
+
+        Arguments:
+
+        * `block`: the newly accepted `Block`.'''
+
+        # logic: removed transactions of block from queue
+        # & update ring wrt transactions never seen before
+        # without adding them to the queue, in the order of the block
+
+        self.kill_miner()
+        self.record_block(block, 'received')
+        self.blockchain.append_block(block)
+        self.latency.included(tra.transaction_id for tra in block.list_of_transactions)
+        known = {tra.transaction_id for tra in self.confirm_transactions(block)}
+
+        unknown_tra = [tra for tra in block.list_of_transactions \
+            if tra.transaction_id not in known]
+        for tra in unknown_tra:
+            # add to ring but do not append to queue
+            # they already in blockchain, signature checked by valid_proof
+            self.validate_transaction(tra, self.ring, check_signature=False)
+            self.add_utxos(tra.transaction_outputs, self.ring)
@@ -0,0 +1,132 @@
+'''Difficulty retargeting. Every block carries the difficulty it was
+mined with. Every `window` blocks, the difficulty is adjusted from the
+timestamps of the last `window` blocks toward `interval` seconds per
+block. Since the expected work doubles with each difficulty bit, the
+adjustment is log2(target interval / observed interval) bits, rounded
+and clamped to `max_step`. All nodes must use the same parameters.
+
+As the timestamps steer the difficulty, a block is only valid if its
+timestamp is after the median of the last `MEDIAN_TIME_BLOCKS` blocks
+and at most `MAX_FUTURE_SECONDS` ahead of the local clock, so that
+a miner cannot pick times to push the difficulty where it wants.'''
+
+import math
+import time
+
+from noobcash import hashing
+
+# blocks whose median timestamp a new block must be after
+MEDIAN_TIME_BLOCKS = 11
+# seconds a timestamp may be ahead of the local clock
+MAX_FUTURE_SECONDS = 120
+
+class Retarget:
+    '''Computes the expected difficulty of a block from the
+    blocks before it.'''
+
+    def __init__(self, initial: int, interval=0.0, window=10, max_step=2,
+                 minimum=1, maximum=None):
+        '''Initialize `Retarget` object.
+
+        Arguments:
+
+        * `initial`: difficulty of the first blocks.
+
+        * `interval`: target seconds per block, 0 to keep
+        `initial` forever.
+
+        * `window`: number of blocks between adjustments (and
+        blocks whose timestamps are used), at least 2.
+
+        * `max_step`: maximum change of difficulty per adjustment.
+
+        * `minimum`, `maximum`: bounds of difficulty. Default maximum:
+        bits of the hash of the network minus one, as a block hash
+        must keep at least one bit free.'''
+
+        assert window >= 2
+        self.initial = initial
+        self.interval = interval
+        self.window = window
+        self.max_step = max_step
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def is_retarget_height(self, height: int):
+        '''Whether the difficulty may change at block `height`
+        (the genesis block has height 0).'''
+
+        return self.interval > 0 and height > self.window and \
+            (height - 1) % self.window == 0
+
+    def expected(self, chain: list):
+        '''Get the difficulty of the block extending `chain`.
+
+        Arguments:
+
+        * `chain`: `list` of `Block`s, starting from genesis.
+
+        Returns:
+
+        * `int` difficulty.'''
+
+        height = len(chain)
+        if height <= 1:
+            # the genesis block is not mined
+            return self.initial
+        previous = chain[-1].difficulty
+        if not self.is_retarget_height(height):
+            return previous
+
+        # timestamps of the last `window` blocks (genesis excluded)
+        span = chain[-1].timestamp - chain[-self.window].timestamp
+        observed = span / (self.window - 1)
+        step = self.max_step if observed <= 0 else \
+            round(math.log2(self.interval / observed))
+        step = max(-self.max_step, min(self.max_step, step))
+
+        maximum = self.maximum if self.maximum is not None else hashing.digest_bits() - 1
+        return max(self.minimum, min(maximum, previous + step))
+
+    @staticmethod
+    def valid_timestamp(chain: list, timestamp: float, now=None):
+        '''Whether a block extending `chain` may have `timestamp`.
+
+        Arguments:
+
+        * `chain`: `list` of `Block`s, starting from genesis.
+
+        * `timestamp`: of the block.
+
+        * `now`: local time. Default: `None`, `time.time()`.
+
+        Returns:
+
+        * `True` if `timestamp` is after the median of the last
+        `MEDIAN_TIME_BLOCKS` blocks and not too far in the future.'''
+
+        if now is None:
+            now = time.time()
+        if timestamp > now + MAX_FUTURE_SECONDS:
+            return False
+        last = sorted(block.timestamp for block in chain[-MEDIAN_TIME_BLOCKS:])
+        return not last or timestamp > last[len(last) // 2]
+
+    @classmethod
+    def from_dict(cls, params: dict):
+        '''Create `Retarget` from `to_dict()`, e.g. those
+        of the network a node joins.'''
+
+        return cls(**params)
+
+    def to_dict(self):
+        '''Parameters as a `dict`.'''
+
+        return dict(
+            initial=self.initial,
+            interval=self.interval,
+            window=self.window,
+            max_step=self.max_step,
+            minimum=self.minimum,
+            maximum=self.maximum
+        )
@@ -0,0 +1,93 @@
+'''Eviction of transactions when the queues of the `Node`
+exceed their bounds (see `TransactionQueue.trim()`) and
+reverting their effect on the ring of `Wallet`s.'''
+
+import wrapt
+
+from noobcash.transaction import Transaction
+from noobcash.helpers import pubk_to_key
+from noobcash.locks import TRANSACTION_LOCK
+
+class EvictionMixin:
+    '''Eviction methods of `Node` (uses its `ring`, queues and miner).'''
+
+    def transaction_priority(self, transaction: Transaction):
+        '''Priority of `transaction` when evicting (see `mempool_policy`).
+
+        Arguments:
+
+        * `transaction`: `Transaction`.
+
+        Returns:
+
+        * 2 if we are the sender, 1 if we are a receiver, else 0.'''
+
+        my_key = pubk_to_key(self.my_wallet().public_key)
+        if pubk_to_key(transaction.sender_pubk) == my_key:
+            return 2
+        if any(pubk_to_key(tro.receiver_public_key) == my_key \
+            for tro in transaction.transaction_outputs):
+            return 1
+        return 0
+
+    def is_my_transaction(self, transaction: Transaction):
+        '''Whether we are the sender of `transaction`.'''
+        return pubk_to_key(transaction.sender_pubk) == pubk_to_key(self.my_wallet().public_key)
+
+    def trim_queues(self):
+        '''Evict transactions if the queues exceed their bounds.'''
+
+        if self.transaction_queue.over_limit() or \
+            self.unprocessed_transaction_queue.over_limit():
+            self._trim_queues()
+
+    @wrapt.synchronized(TRANSACTION_LOCK.exclusive)
+    def _trim_queues(self):
+        '''Evict transactions from the queues, revert their
+        effect on `ring` and restart the miner if it was
+        mining any of them.'''
+
+        # not reflected in ring, just drop them
+        self.unprocessed_transaction_queue.trim()
+
+        evicted = self.transaction_queue.trim()
+        if not evicted:
+            return
+
+        self.revert_transactions(evicted)
+
+        if self.mining_ids.intersection(tra.transaction_id for tra in evicted):
+            self.kill_miner()
+            if len(self.transaction_queue) >= self.capacity:
+                self.mine_block()
+
+    def revert_transactions(self, transactions: list):
+        '''Undo the effect of queued `transactions` on `ring`: remove their
+        outputs and give their inputs back to the senders. Requires
+        TRANSACTION_LOCK.exclusive, or the sender's wallet lock if
+        `transactions` were never queued.
+
+        Arguments:
+
+        * `transactions`: `list` of `Transaction`s removed from the queue
+        along with all of their descendants, parents before children.'''
+
+        for tra in reversed(transactions):
+            for tro in tra.transaction_outputs:
+                try:
+                    self.ring[self.pubk2ind[pubk_to_key(tro.receiver_public_key)]]\
+                        .remove_utxos([tro.transaction_id])
+                except KeyError: # e.g. payment to self, key used by the other output
+                    pass
+
+            sender_key = pubk_to_key(tra.sender_pubk)
+            sender = self.ring[self.pubk2ind[sender_key]]
+            for utxo_id in tra.transaction_inputs:
+                # utxos are keyed by the ID of the transaction producing them
+                parent = self.transaction_queue.get(utxo_id) or \
+                    self.blockchain.get_transaction(utxo_id)
+                if parent is None:
+                    continue
+                for tro in parent.transaction_outputs:
+                    if pubk_to_key(tro.receiver_public_key) == sender_key:
+                        sender.add_utxo(tro)
@@ -0,0 +1,62 @@
+'''Hash function of the network, used for transaction IDs, block
+hashes (i.e. proof-of-work) and the hashes that are signed. It is
+chosen by the bootstrap, 'sha1', 'sha256' or 'blake2b', and set once
+per process with `use()` before any object is hashed.
+
+`hashlib` objects are used for IDs and mining, as they are faster to
+create and their state can be copied (see `Block.mine()`). Signatures
+need the `Crypto.Hash` object of the same function.'''
+
+import hashlib
+
+from Crypto.Hash import SHA1, SHA256, BLAKE2b
+
+HASHES = ('sha1', 'sha256', 'blake2b')
+DEFAULT_HASH = 'sha1'
+
+# name -> (`hashlib` constructor, `Crypto.Hash` constructor)
+_BACKENDS = dict(
+    sha1=(hashlib.sha1, SHA1.new),
+    sha256=(hashlib.sha256, SHA256.new),
+    blake2b=(hashlib.blake2b, lambda data: BLAKE2b.new(data=data, digest_bits=512))
+)
+
+class _InUse:
+    '''Hash function in use, one per process (see `use()`).'''
+
+    def __init__(self, hash_name: str):
+        self.name = hash_name
+        self.new, self.new_signable = _BACKENDS[hash_name]
+
+_IN_USE = _InUse(DEFAULT_HASH)
+
+def use(hash_name: str):
+    '''Set the hash function of the network.
+
+    Arguments:
+
+    * `hash_name`: one of `HASHES`.'''
+
+    _IN_USE.new, _IN_USE.new_signable = _BACKENDS[hash_name]
+    _IN_USE.name = hash_name
+
+def name():
+    '''Get the name of the hash function in use.'''
+    return _IN_USE.name
+
+def new(data=b''):
+    '''Get a (`hashlib`) hash object of `data`.'''
+    return _IN_USE.new(data)
+
+def hexdigest(data: bytes):
+    '''Get the hash of `data` as a hexadecimal `str`.'''
+    return _IN_USE.new(data).hexdigest()
+
+def signable(data: bytes):
+    '''Get a `Crypto.Hash` object of `data`, as
+    needed by `noobcash.signatures`.'''
+    return _IN_USE.new_signable(data)
+
+def digest_bits():
+    '''Get the size of the hash in bits.'''
+    return _IN_USE.new().digest_size * 8
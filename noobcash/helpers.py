@@ -1,55 +1,104 @@
 '''Auxiliary functions used throughout `noobcash`.'''
 
 import json
+import time
+import zlib
 import urllib3
-from Crypto.PublicKey import RSA
+
+from noobcash import signatures
+from noobcash.keys import REGISTRY, KeyRef
+from noobcash import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None # optional, only gzip is supported
+
+# Content-Encodings we can produce, in order of preference
+COMPRESSIONS = (['zstd'] if zstandard is not None else []) + ['gzip']
 
 def pubk_to_dict(pubk):
-    '''Transform RSA public key to a dictionary
+    '''Transform public key to a dictionary
     so it can be recovered afterwards.
 
     Arguments:
 
-    * `pubk`: RSA public key.
+    * `pubk`: public key (see `noobcash.signatures`).
 
     Returns:
 
-    * `dict` with keys ['n', 'e'].'''
-    try:
-        return dict(n=pubk.n, e=pubk.e)
-    except AttributeError:
+    * `dict` with keys ['n', 'e'] (RSA) or ['curve', 'x', 'y'].'''
+    if isinstance(pubk, int):
         # genesis wallet
         return pubk
+    return signatures.public_key_to_dict(pubk)
 
 def pubk_from_dict(pubk_dict):
-    '''Retrieve RSA public key from `dict`
-    containing `n` and `e`
+    '''Retrieve public key from `dict`
+    of `pubk_to_dict()`.
 
     Arguments:
 
-    * `pubk_dict`: `dict` containing keys ['n', 'e'].
+    * `pubk_dict`: `dict` containing keys ['n', 'e'] or ['curve', 'x', 'y'].
 
     Returns:
 
-    * RSA public key.'''
+    * public key.'''
 
     try:
-        return RSA.construct((pubk_dict['n'], pubk_dict['e']))
+        return signatures.public_key_from_dict(pubk_dict)
     except TypeError:
         return pubk_dict
 
+def pubk_to_ref(pubk):
+    '''Get the reference to public key used by transactions and
+    their outputs, i.e. its fingerprint (see `noobcash.keys`). The
+    key is registered if need be.
+
+    Arguments:
+
+    * `pubk`: public key (or `KeyRef`).
+
+    Returns:
+
+    * Hexadecimal `str` fingerprint.'''
+    if isinstance(pubk, int):
+        # genesis wallet
+        return pubk
+    if isinstance(pubk, KeyRef):
+        return pubk.fingerprint
+    return REGISTRY.register(pubk)
+
+def pubk_from_ref(pubk_ref):
+    '''Resolve reference of `pubk_to_ref()` through the registry.
+
+    Arguments:
+
+    * `pubk_ref`: Hexadecimal `str` fingerprint.
+
+    Returns:
+
+    * public key (`KeyRef` if unknown).'''
+
+    if isinstance(pubk_ref, int):
+        return pubk_ref
+    return REGISTRY.resolve(pubk_ref)
+
 def pubk_to_key(pubk):
-    '''Get hashable info from RSA public key
+    '''Get hashable info from public key
 
     Arguments:
 
-    * `pubk`: RSA public key.
+    * `pubk`: public key.
 
     Returns:
 
-    * `tuple` of (`n`, `e`).'''
+    * `tuple` of (`n`, `e`) (RSA) or (curve, `x`, `y`)
+    (or ('ref', fingerprint) for an unknown key).'''
 
-    return (pubk.n, pubk.e)
+    if isinstance(pubk, KeyRef):
+        return ('ref', pubk.fingerprint)
+    return signatures.public_key_id(pubk)
 
 def sign_to_dict(signature):
     '''Transform signature to recoverable form. Name is
@@ -57,7 +106,7 @@ def sign_to_dict(signature):
 
     Arguments:
 
-    * `signature`: signature as returned from `PKCS1_v5_1.new(*).sign()`.
+    * `signature`: signature as returned from `signatures.sign()`.
 
     Returns:
 
@@ -92,19 +141,24 @@ def object_dict_deepcopy(dct):
         new_dct[k] = dct[k].deepcopy()
     return new_dct
 
-def get_len_from_address(url: str):
+def get_len_from_address(url: str, headers=None, http=None):
     '''Request `url` for length of its blockchain.
 
     Arguments:
 
     * `url`: `str` ip+port.
 
+    * `headers`: `dict` of extra headers. Default: `None`.
+
+    * `http`: `urllib3.PoolManager` (or `ProxyManager`). Default: `None`, a new one.
+
     Returns:
 
     * Blockchain length of node if valid, else 0.'''
 
-    http = urllib3.PoolManager()
-    response = http.request('GET', url, headers={'Accept': 'application/json'})
+    http = http or urllib3.PoolManager()
+    response = http.request('GET', url,
+                            headers=dict(headers or {}, Accept='application/json'))
 
     if response.status != 200:
         return 0
@@ -117,22 +171,98 @@ def get_len_from_address(url: str):
 
     return blockchain_len
 
-def send_dict_to_address(request_params):
+def send_dict_to_address(request_params, headers=None, http=None):
     '''Send specified dict to an address.
 
     Arguments:
 
     * `request_params`: `tuple` of `dict` and `str` URL.
 
+    * `headers`: `dict` of extra headers. Default: `None`.
+
+    * `http`: `urllib3.PoolManager` (or `ProxyManager`). Default: `None`, a new one.
+
     Returns:
 
     * `True` is response status code is 200, else `False`.'''
 
 
     dict_to_broadcast, url = request_params
-    http = urllib3.PoolManager()
+    http = http or urllib3.PoolManager()
     response = http.request('POST', url,
-                            headers={'Content-Type': 'application/json'},
+                            headers=dict(headers or {}, **{'Content-Type': 'application/json'}),
                             body=json.dumps(dict_to_broadcast))
 
     return response.status == 200
+
+def send_payload_to_address(request_params, headers=None, http=None):
+    '''Send already encoded payload to an address. The latency
+    is recorded per peer (see `metrics.BROADCAST_SECONDS`).
+
+    Arguments:
+
+    * `request_params`: `tuple` of (`bytes` body, `str` content type) and `str` URL.
+
+    * `headers`: `dict` of extra headers. Default: `None`.
+
+    * `http`: `urllib3.PoolManager` (or `ProxyManager`). Default: `None`, a new one.
+
+    Returns:
+
+    * `True` is response status code is 200, else `False`.'''
+
+    url = request_params[1]
+    peer, _, path = url.split('://')[-1].partition('/')
+    t_0 = time.perf_counter()
+    ok = False
+    try:
+        ok = post_payload(request_params, headers=headers, http=http)
+    finally:
+        metrics.BROADCAST_SECONDS.labels(peer, f'/{path}').observe(time.perf_counter() - t_0)
+        if not ok:
+            metrics.BROADCAST_FAILURES.labels(peer, f'/{path}').inc()
+
+    return ok
+
+def post_payload(request_params, headers=None, http=None):
+    '''`send_payload_to_address()` without metrics, for forked
+    processes (e.g. the miner), where the locks of the metrics
+    may have been held by another thread while forking.
+
+    Returns:
+
+    * `True` is response status code is 200, else `False`.'''
+
+    (body, content_type), url = request_params
+    http = http or urllib3.PoolManager()
+    response = http.request('POST', url,
+                            headers=dict(headers or {}, **{'Content-Type': content_type}),
+                            body=body)
+    return response.status == 200
+
+def compress_chunks(chunks, encoding: str):
+    '''Compress a stream of chunks on the fly.
+
+    Arguments:
+
+    * `chunks`: iterable of `bytes`.
+
+    * `encoding`: 'gzip', 'zstd' or `None` (no compression).
+
+    Yields:
+
+    * Compressed `bytes`.'''
+
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(wbits=31) # gzip container
+    elif encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        yield from chunks
+        return
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,148 @@
+'''Bounded queue of received transactions. The API only decodes
+transactions and puts them in the queue, a worker drains it in
+batches, verifies their signatures in parallel and hands them
+to the `Node` in order of arrival.'''
+
+import time
+import queue
+import threading
+from multiprocessing.dummy import Pool as ThreadPool
+
+from noobcash.tracing import TRACER
+
+class IngestQueue:
+    '''Bounded queue of received transactions. The API only decodes
+    transactions and puts them in the queue, a worker drains it in
+    batches, verifies their signatures in parallel and hands them
+    to the `Node` in order of arrival.'''
+
+    def __init__(self, node, maxsize=10000, batch_size=64, verifiers=4):
+        '''Initialize `IngestQueue` object.
+
+        Arguments:
+
+        * `node`: `Node` that receives the transactions.
+
+        * `maxsize`: maximum number of queued transactions.
+
+        * `batch_size`: maximum number of transactions handled at once.
+
+        * `verifiers`: threads verifying signatures of a batch.'''
+
+        self.node = node
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.verifiers = verifiers
+
+        self.enqueued = 0
+        self.dropped = 0 # rejected because the queue was full
+        self.accepted = 0
+        self.rejected = 0 # invalid transactions
+        self.batches = 0
+
+        self._counter_lock = threading.Lock()
+        self._worker = None
+
+    def start(self):
+        '''Start the (daemon) worker.'''
+
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, name='ingest', daemon=True)
+            self._worker.start()
+
+    def put(self, transaction, trace=None):
+        '''Queue `transaction` without blocking.
+
+        Arguments:
+
+        * `transaction`: decoded `Transaction`.
+
+        * `trace`: `TraceContext` of `transaction`, if traced.
+
+        Returns:
+
+        * `False` if the queue is full (and `transaction`
+        was dropped), else `True`.'''
+
+        try:
+            self.queue.put_nowait((transaction, trace, time.time() if trace else None))
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+            return False
+
+        with self._counter_lock:
+            self.enqueued += 1
+        return True
+
+    def __len__(self):
+        '''Return (approximate) number of queued transactions.'''
+        return self.queue.qsize()
+
+    def next_batch(self):
+        '''Block until a transaction is available and get it
+        along with whatever else is queued, up to `batch_size`.
+
+        Returns:
+
+        * `list` of (`Transaction`, `TraceContext` or `None`, time queued).'''
+
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        '''Main loop of the worker.'''
+
+        pool = ThreadPool(self.verifiers)
+        while True:
+            items = self.next_batch()
+            batch = [tra for tra, _, _ in items]
+            traces = [trace for _, trace, _ in items]
+            now = time.time()
+            for _, trace, queued in items:
+                if trace is not None:
+                    TRACER.record('queue', trace, queued, now - queued)
+            verified = pool.map(self._verify, zip(batch, traces))
+            try:
+                results = self.node.receive_transactions(batch, verified, traces)
+            except Exception: # pylint: disable=broad-except
+                # e.g. unknown sender, keep draining
+                results = [False] * len(batch)
+
+            with self._counter_lock:
+                self.batches += 1
+                self.accepted += sum(results)
+                self.rejected += len(results) - sum(results)
+
+            for _ in batch:
+                self.queue.task_done()
+
+    def _verify(self, item):
+        '''Verify signature of (transaction, trace).'''
+
+        transaction, trace = item
+        with TRACER.span('verify', trace):
+            return self.node.verify_signature(transaction)
+
+    def stats(self):
+        '''Get counters of the queue.
+
+        Returns:
+
+        * `dict` of counters.'''
+
+        with self._counter_lock:
+            return dict(
+                depth=len(self),
+                maxsize=self.queue.maxsize,
+                enqueued=self.enqueued,
+                dropped=self.dropped,
+                accepted=self.accepted,
+                rejected=self.rejected,
+                batches=self.batches
+            )
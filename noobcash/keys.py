@@ -0,0 +1,99 @@
+'''Registry of the public keys of the network. Keys are only sent
+in full when nodes join (see `Wallet.to_dict()`). Transactions and
+their outputs refer to them by a short fingerprint, both on the wire
+and in the hashed `message()`, and fingerprints are resolved to keys
+through the registry. Every process has one registry, `REGISTRY`.'''
+
+import json
+import threading
+
+from noobcash import signatures, hashing
+
+# bytes of a fingerprint (sent raw in the binary wire format)
+FINGERPRINT_SIZE = 16
+
+class KeyRef:
+    '''Fingerprint of a key missing from the registry. It stands
+    in for the key, but it is never a valid sender or receiver.'''
+
+    __slots__ = ('fingerprint',)
+
+    def __init__(self, fpr: str):
+        self.fingerprint = fpr
+
+    def __eq__(self, o):
+        return isinstance(o, KeyRef) and self.fingerprint == o.fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    def __repr__(self):
+        return f'KeyRef({self.fingerprint!r})'
+
+def fingerprint(pubk):
+    '''Compute the fingerprint of public key `pubk` with the hash
+    function of the network (see `noobcash.hashing`).
+
+    Returns:
+
+    * Hexadecimal `str` of `FINGERPRINT_SIZE` bytes.'''
+
+    data = json.dumps(signatures.public_key_to_dict(pubk), sort_keys=True).encode('utf-8')
+    return hashing.hexdigest(data)[:2 * FINGERPRINT_SIZE]
+
+class KeyRegistry:
+    '''Public keys by fingerprint.'''
+
+    def __init__(self):
+        '''Initialize `KeyRegistry` object.'''
+
+        self.keys = {} # fingerprint -> key
+        self.fingerprints = {} # `public_key_id()` -> fingerprint
+        self.misses = 0 # fingerprints that could not be resolved
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, fpr: str):
+        return fpr in self.keys
+
+    def register(self, pubk):
+        '''Add `pubk` to the registry (if not already there).
+
+        Returns:
+
+        * `str` fingerprint of `pubk`.'''
+
+        key_id = signatures.public_key_id(pubk)
+        fpr = self.fingerprints.get(key_id)
+        if fpr is None:
+            fpr = fingerprint(pubk)
+            with self._lock:
+                self.keys.setdefault(fpr, pubk)
+                self.fingerprints[key_id] = fpr
+        return fpr
+
+    def resolve(self, fpr: str):
+        '''Get the key of fingerprint `fpr`.
+
+        Returns:
+
+        * Public key if registered, else `KeyRef`.'''
+
+        try:
+            return self.keys[fpr]
+        except KeyError:
+            self.misses += 1
+            return KeyRef(fpr)
+
+    def stats(self):
+        '''Get size and counters of the registry.
+
+        Returns:
+
+        * `dict`.'''
+
+        return dict(keys=len(self.keys), misses=self.misses)
+
+REGISTRY = KeyRegistry()
@@ -0,0 +1,151 @@
+'''End-to-end confirmation latency of transactions. Every transaction
+is timestamped when this node creates or first receives it, when it
+is included in a block (mined or accepted) and when a reorg takes it
+out of the blockchain. Confirmations are summarized by percentiles
+(see `noobcash.stats`) over all of them and by percentiles and
+throughput over sliding windows. This is the one measure of
+confirmation latency of the node (`/latency` and `/assembly`).'''
+
+import time
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from noobcash.stats import Sample, percentiles
+
+# seconds of the sliding windows of `LatencyTracker.summary()`
+WINDOWS = (10, 60, 300)
+
+class LatencyTracker:
+    '''Bounded in-memory store of timestamps of transactions.'''
+
+    def __init__(self, max_transactions=100000, max_confirmations=100000, windows=WINDOWS):
+        '''Initialize `LatencyTracker` object.
+
+        Arguments:
+
+        * `max_transactions`: number of (latest) transactions
+        whose timestamps are kept.
+
+        * `max_confirmations`: number of (latest) confirmations
+        kept for the windows and percentiles.
+
+        * `windows`: seconds of the sliding windows.'''
+
+        self.max_transactions = max_transactions
+        self.windows = windows
+        # transaction_id -> `dict` of timestamps
+        self.records = OrderedDict()
+        # (time of inclusion, latency, whether created by this node)
+        self.confirmations = deque(maxlen=max_confirmations)
+        # latencies of all confirmations
+        self.sample = Sample(maxlen=max_confirmations)
+        self.reorged = 0
+        self._lock = threading.Lock()
+
+    def _record(self, transaction_id: str):
+        record = self.records.get(transaction_id)
+        if record is None:
+            record = self.records[transaction_id] = {}
+            if len(self.records) > self.max_transactions:
+                self.records.popitem(last=False)
+        return record
+
+    def created(self, transaction_id: str, timestamp=None):
+        '''Our transaction `transaction_id` was created.'''
+
+        with self._lock:
+            self._record(transaction_id)['created'] = timestamp or time.time()
+
+    def received(self, transaction_id: str, timestamp=None):
+        '''Transaction `transaction_id` was received
+        (only the first receipt is kept).'''
+
+        with self._lock:
+            self._record(transaction_id).setdefault('received', timestamp or time.time())
+
+    def included(self, transaction_ids, timestamp=None):
+        '''Transactions `transaction_ids` were included in a block
+        appended to our blockchain. Their confirmation latency is
+        measured from their creation or first receipt.'''
+
+        timestamp = timestamp or time.time()
+        with self._lock:
+            for tid in transaction_ids:
+                record = self._record(tid)
+                if 'included' in record and 'reorged' not in record:
+                    continue
+                record['included'] = timestamp
+                record.pop('reorged', None)
+                start = record.get('created', record.get('received'))
+                if start is not None:
+                    self.confirmations.append((timestamp, timestamp - start,
+                                               'created' in record))
+                    self.sample.add(timestamp - start)
+
+    def reorged_out(self, transaction_ids, timestamp=None):
+        '''Transactions `transaction_ids` were in blocks
+        that are no longer in our blockchain.'''
+
+        timestamp = timestamp or time.time()
+        with self._lock:
+            for tid in transaction_ids:
+                self._record(tid)['reorged'] = timestamp
+                self.reorged += 1
+
+    def get(self, transaction_id: str):
+        '''Get the timestamps of `transaction_id`.
+
+        Returns:
+
+        * `dict` (empty if unknown), with 'latency' if included.'''
+
+        with self._lock:
+            record = dict(self.records.get(transaction_id, {}))
+        start = record.get('created', record.get('received'))
+        if 'included' in record and start is not None:
+            record['latency'] = record['included'] - start
+        return record
+
+    def summary(self, now=None, windows=None, local=False, since=None, until=None):
+        '''Get percentiles of confirmation latency and throughput
+        (confirmations per second) over every window, and count, mean
+        and percentiles over all confirmations (`all`).
+
+        Arguments:
+
+        * `windows`: seconds of the windows. Default: `None`, those of the tracker.
+
+        * `local`: whether to only count transactions created by this node
+        (latency from creation rather than receipt).
+
+        * `since`, `until`: only count transactions created (or received)
+        from `since` until before `until` (`time.time()`). Default: `None`, any.
+
+        Returns:
+
+        * `dict`.'''
+
+        now = now or time.time()
+        lengths = windows or self.windows
+        with self._lock:
+            confirmations = np.array(self.confirmations, dtype=float).reshape(-1, 3)
+            tracked, reorged = len(self.records), self.reorged
+        if local:
+            confirmations = confirmations[confirmations[:, 2] > 0]
+        started = confirmations[:, 0] - confirmations[:, 1]
+        if since is not None:
+            confirmations = confirmations[started >= since]
+            started = started[started >= since]
+        if until is not None:
+            confirmations = confirmations[started < until]
+
+        windows = {}
+        for window in lengths:
+            latencies = confirmations[confirmations[:, 0] >= now - window, 1]
+            stats = dict(count=len(latencies), tps=len(latencies) / window)
+            stats.update(percentiles(latencies))
+            windows[f'{window:g}s'] = stats
+
+        return dict(tracked=tracked, reorged=reorged, all=self.sample.summary(), windows=windows)
@@ -0,0 +1,411 @@
+'''Synchronization primitives used by the `Node` in addition to the
+per-object locks of `wrapt.synchronized`, profiling of the wait
+and hold times of locks by call site (`ProfiledLock`) and the
+global locks of the `Node`.'''
+
+import os
+import sys
+import time
+import threading
+
+import wrapt
+
+# whether `ProfiledLock`s record anything, only set before using them
+PROFILING = True
+# uncontended acquisitions are recorded one in `SAMPLE_EVERY` (weighted by
+# it), as finding their call site costs more than the lock itself;
+# contended ones are always recorded
+SAMPLE_EVERY = 16
+
+# frames of these are skipped to find the call site of an acquire
+_SKIPPED_PATHS = (os.path.abspath(__file__), os.path.dirname(os.path.abspath(wrapt.__file__)))
+
+# code object -> whether its frames are skipped
+_SKIPPED_CODES = {}
+# (code object, line) of the call site -> `str` of `_call_site()`
+_SITES = {}
+
+def _call_site():
+    '''Get the first frame outside of this module and `wrapt`,
+    and the function about to be called if the lock is acquired
+    by `wrapt.synchronized`. The name is only built the first time
+    a call site is seen (reading `f_locals` is slow), the walk up
+    the stack only looks at code objects.
+
+    Returns:
+
+    * `str` like 'node.py:123 (receive_block)' or
+    'rest.py:45 (get_block) -> Node.receive_block'.'''
+
+    frame = sys._getframe(1) # pylint: disable=protected-access
+    first = frame
+    while frame is not None:
+        code = frame.f_code
+        skipped = _SKIPPED_CODES.get(code)
+        if skipped is None:
+            skipped = _SKIPPED_CODES[code] = code.co_filename.startswith(_SKIPPED_PATHS)
+        if not skipped:
+            break
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+
+    key = (frame.f_code, frame.f_lineno)
+    site = _SITES.get(key)
+    if site is None:
+        callee = ''
+        skipped = first
+        while skipped is not frame:
+            wrapped = skipped.f_locals.get('wrapped')
+            if wrapped is not None:
+                callee = ' -> ' + getattr(wrapped, '__qualname__', '?')
+            skipped = skipped.f_back
+        code = frame.f_code
+        site = _SITES[key] = \
+            f'{os.path.basename(code.co_filename)}:{frame.f_lineno} ({code.co_name}){callee}'
+    return site
+
+class LockProfile:
+    '''Wait and hold times of the locks of the same name
+    (e.g. of every `Wallet`), by call site.'''
+
+    def __init__(self, name: str):
+        '''Initialize `LockProfile` object.
+
+        Arguments:
+
+        * `name`: name of the lock(s).'''
+
+        self.name = name
+        # call site -> [acquisitions, contended, wait total, wait max, hold total, hold max]
+        self.sites = {}
+        # (id of lock, thread ident) -> (call site, time acquired) of current holders
+        self.holders = {}
+        self._lock = threading.Lock()
+
+    def record(self, site: str, wait: float, hold: float, contended: bool, weight=1):
+        '''Record an acquisition (after its release), standing for
+        `weight` acquisitions if sampled.'''
+
+        with self._lock:
+            stats = self.sites.get(site)
+            if stats is None:
+                stats = self.sites[site] = [0, 0, 0.0, 0.0, 0.0, 0.0]
+            stats[0] += weight
+            stats[1] += contended
+            stats[2] += wait * weight
+            stats[3] = max(stats[3], wait)
+            stats[4] += hold * weight
+            stats[5] = max(stats[5], hold)
+
+    def stats(self):
+        '''Get totals and stats by call site (most waited first)
+        and current holders. Uncontended acquisitions and their
+        hold times are estimated from samples (see `SAMPLE_EVERY`),
+        holders are those of recorded acquisitions.
+
+        Returns:
+
+        * `dict`.'''
+
+        now = time.perf_counter()
+        with self._lock:
+            sites = {site: list(stats) for site, stats in self.sites.items()}
+            holders = list(self.holders.values())
+
+        by_site = [
+            dict(site=site, acquisitions=acq, contended=cont, wait_total=wait,
+                 wait_max=wait_max, wait_mean=wait / acq, hold_total=hold,
+                 hold_max=hold_max, hold_mean=hold / acq)
+            for site, (acq, cont, wait, wait_max, hold, hold_max) in sites.items()
+        ]
+        by_site.sort(key=lambda stats: stats['wait_total'], reverse=True)
+
+        return dict(
+            acquisitions=sum(stats['acquisitions'] for stats in by_site),
+            contended=sum(stats['contended'] for stats in by_site),
+            wait_total=sum(stats['wait_total'] for stats in by_site),
+            hold_total=sum(stats['hold_total'] for stats in by_site),
+            holders=[dict(site=site, held_for=now - since) for site, since in holders],
+            sites=by_site
+        )
+
+# name -> `LockProfile`
+PROFILES = {}
+_PROFILES_LOCK = threading.Lock()
+
+def get_profile(name: str):
+    '''Get the `LockProfile` of `name`, creating it if need be.'''
+
+    with _PROFILES_LOCK:
+        if name not in PROFILES:
+            PROFILES[name] = LockProfile(name)
+        return PROFILES[name]
+
+def lock_stats():
+    '''Get the stats of every profile.
+
+    Returns:
+
+    * `dict` of name -> `LockProfile.stats()`.'''
+
+    return {name: profile.stats() for name, profile in list(PROFILES.items())}
+
+class ProfiledLock:
+    '''Wraps a lock (e.g. `threading.RLock`, a side of `RWLock`) to
+    record how long threads wait for it and hold it, and where it
+    is acquired from, in the `LockProfile` of its name. Only the
+    outermost acquisition of a reentrant lock is recorded, and only
+    a sample of the uncontended ones (see `SAMPLE_EVERY`). Can be
+    passed to `wrapt.synchronized`, used with `with` or set as the
+    `_synchronized_lock` of an object.'''
+
+    def __init__(self, lock, name: str):
+        '''Initialize `ProfiledLock` object.
+
+        Arguments:
+
+        * `lock`: the lock, with `acquire()` and `release()`.
+
+        * `name`: name of the profile.'''
+
+        self._wrapped = lock
+        self.profile = get_profile(name)
+        # thread ident -> [depth, call site, wait, time acquired, contended]
+        # of the holders (faster than a `threading.local`), call site
+        # `None` if not sampled
+        self._held = {}
+        # uncontended acquisitions until the next sampled one
+        self._countdown = SAMPLE_EVERY
+
+    def acquire(self, blocking=True, timeout=-1):
+        '''Acquire the lock (see `threading.Lock.acquire`).'''
+
+        ident = threading.get_ident()
+        held = self._held.get(ident)
+        if held is not None or not PROFILING:
+            acquired = self._wrapped.acquire(blocking, timeout)
+            if acquired and held is not None:
+                held[0] += 1
+            return acquired
+
+        # contended if it cannot be acquired right away
+        contended = not self._wrapped.acquire(False)
+        if contended:
+            t_0 = time.perf_counter()
+            if not self._wrapped.acquire(blocking, timeout):
+                return False
+            wait = time.perf_counter() - t_0
+        else:
+            # racy for shared locks, which only skews the sampling
+            self._countdown -= 1
+            if self._countdown > 0:
+                self._held[ident] = [1, None]
+                return True
+            self._countdown = SAMPLE_EVERY
+            wait = 0.0
+
+        site = _call_site()
+        # held from after the bookkeeping, so that it is not counted
+        t_1 = time.perf_counter()
+        self._held[ident] = [1, site, wait, t_1, contended]
+        self.profile.holders[(id(self), ident)] = (site, t_1)
+        return True
+
+    def release(self):
+        '''Release the lock.'''
+
+        ident = threading.get_ident()
+        held = self._held.get(ident)
+        if held is not None:
+            if held[0] > 1:
+                held[0] -= 1
+            else:
+                del self._held[ident]
+                if held[1] is not None:
+                    _, site, wait, t_1, contended = held
+                    hold = time.perf_counter() - t_1
+                    self.profile.holders.pop((id(self), ident), None)
+                    self.profile.record(site, wait, hold, contended,
+                                        1 if contended else SAMPLE_EVERY)
+        self._wrapped.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class RWLock:
+    '''Readers-writer lock. Any number of threads can hold it `shared`,
+    one can hold it `exclusive`. Waiting writers block new readers so
+    they are not starved. Both sides are reentrant and a writer may also
+    acquire the shared side, but a reader cannot upgrade to exclusive.
+
+    The sides can be passed to `wrapt.synchronized` or used with `with`.'''
+
+    def __init__(self, name=None):
+        '''Initialize `RWLock` object.
+
+        Arguments:
+
+        * `name`: if given, the sides are profiled (see `ProfiledLock`)
+        as '`name`.shared' and '`name`.exclusive'.'''
+
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = {} # thread ident -> times acquired
+        self._writer = None
+        self._writer_count = 0
+        self._writers_waiting = 0
+
+        self.shared = _Side(self.acquire_shared, self.release_shared)
+        self.exclusive = _Side(self.acquire_exclusive, self.release_exclusive)
+        if name is not None:
+            self.shared = ProfiledLock(self.shared, f'{name}.shared')
+            self.exclusive = ProfiledLock(self.exclusive, f'{name}.exclusive')
+
+    def acquire_shared(self, blocking=True, timeout=-1):
+        '''Acquire the shared side (see `threading.Lock.acquire`).'''
+
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return True
+
+            def free():
+                return self._writer is None and not self._writers_waiting
+
+            if not blocking:
+                if not free():
+                    return False
+            elif not self._cond.wait_for(free, timeout=None if timeout < 0 else timeout):
+                return False
+            self._readers[me] = 1
+            return True
+
+    def release_shared(self):
+        '''Release the shared side.'''
+
+        me = threading.get_ident()
+        with self._cond:
+            count = self._readers.pop(me) - 1
+            if count:
+                self._readers[me] = count
+            elif not self._readers:
+                self._cond.notify_all()
+
+    def acquire_exclusive(self, blocking=True, timeout=-1):
+        '''Acquire the exclusive side (see `threading.Lock.acquire`).'''
+
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_count += 1
+                return True
+            if me in self._readers:
+                raise RuntimeError('Cannot upgrade shared lock to exclusive')
+            if not blocking and (self._writer is not None or self._readers):
+                return False
+            self._writers_waiting += 1
+            try:
+                if not self._cond.wait_for(
+                        lambda: self._writer is None and not self._readers,
+                        timeout=None if timeout < 0 else timeout):
+                    return False
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_count = 1
+            return True
+
+    def release_exclusive(self):
+        '''Release the exclusive side.'''
+
+        with self._cond:
+            self._writer_count -= 1
+            if self._writer_count == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+class _Side:
+    '''One side of a `RWLock`, with the interface of a `threading.Lock`.'''
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class OrderedCommit:
+    '''Lets threads do work concurrently (e.g. signing) but commit
+    its results in the order they got their tickets.'''
+
+    def __init__(self):
+        '''Initialize `OrderedCommit` object.'''
+
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._next_commit = 0
+
+    def ticket(self):
+        '''Get next ticket. Every ticket MUST be passed
+        to `turn()` eventually.
+
+        Returns:
+
+        * `int` ticket.'''
+
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            return ticket
+
+    def turn(self, ticket: int):
+        '''Context manager that waits until every previous
+        ticket has been committed.
+
+        Arguments:
+
+        * `ticket`: as returned from `ticket()`.'''
+
+        return _Turn(self, ticket)
+
+    def _wait(self, ticket):
+        with self._cond:
+            self._cond.wait_for(lambda: self._next_commit == ticket)
+
+    def _done(self):
+        with self._cond:
+            self._next_commit += 1
+            self._cond.notify_all()
+
+class _Turn:
+    '''Context of `OrderedCommit.turn()`.'''
+
+    def __init__(self, order, ticket):
+        self.order = order
+        self.ticket = ticket
+
+    def __enter__(self):
+        self.order._wait(self.ticket) # pylint: disable=protected-access
+        return self
+
+    def __exit__(self, *exc_info):
+        self.order._done() # pylint: disable=protected-access
+
+# locks of the `Node`, here as `wrapt.synchronized` decorates with
+# them the methods of its mixins too (e.g. `noobcash.eviction`)
+
+# serializes changes of the blockchain and `ring_bak`
+BLOCK_LOCK = ProfiledLock(threading.RLock(), 'BLOCK_LOCK')
+# `shared` for anything working on single transactions (wallets and
+# queues have their own locks), `exclusive` when `ring` or the
+# transaction queues are replaced/rebuilt as a whole
+TRANSACTION_LOCK = RWLock(name='TRANSACTION_LOCK')
@@ -0,0 +1,323 @@
+'''Counters, gauges and histograms of the node, rendered in the
+Prometheus text exposition format (served at `/metrics`). Metrics are
+registered once per process in `REGISTRY`, the ones of the node are
+defined at the end of this module. They assume one `Node` per process:
+with more (e.g. in tests), counters add up over all of them and gauges
+read from a function (`set_function()`) report the last one created.'''
+
+import time
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# upper bounds (seconds) of the buckets of histograms
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_value(value: float):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _format_labels(labels: dict):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+class _Metric(ABC):
+    '''A metric, possibly with labels. Every combination of
+    label values is a child of the same type without labels.'''
+
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        '''Initialize metric.
+
+        Arguments:
+
+        * `name`: name of the metric.
+
+        * `documentation`: help text of the metric.
+
+        * `labelnames`: names of its labels, if any.'''
+
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        '''Get the child of label values `values` (in the
+        order of `labelnames`), creating it if need be.'''
+
+        assert len(values) == len(self.labelnames)
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        '''Create a child (of the type of this metric without labels).'''
+
+    def _samples(self):
+        '''Yield (suffix, `dict` of labels, value) of every child.'''
+
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            for suffix, extra, value in child.samples():
+                yield suffix, dict(labels, **extra), value
+
+    def render(self):
+        '''Get the metric in the text format.
+
+        Returns:
+
+        * `list` of lines.'''
+
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for suffix, labels, value in self._samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+class _CounterChild:
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        '''Increase by `amount` (non-negative).'''
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        yield '', {}, self.value
+
+class _GaugeChild:
+
+    def __init__(self):
+        self.value = 0
+        self._function = None
+
+    def set(self, value: float):
+        '''Set to `value`.'''
+        self.value = value
+
+    def inc(self, amount=1):
+        '''Increase by `amount`.'''
+        self.value += amount
+
+    def set_function(self, function):
+        '''Get the value from calling `function` when rendered.'''
+        self._function = function
+
+    def samples(self):
+        yield '', {}, self._function() if self._function is not None else self.value
+
+class _HistogramChild:
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last: +Inf
+        self.sum = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        '''Record `value`.'''
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        '''Context manager observing the seconds spent in it.'''
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield '_bucket', dict(le=_format_value(bound)), cumulative
+        yield '_sum', {}, total
+        yield '_count', {}, cumulative
+
+class _Timer:
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.t_0 = None
+
+    def __enter__(self):
+        self.t_0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.t_0)
+        return False
+
+class Counter(_Metric):
+    '''Monotonically increasing value (name should end in `_total`).'''
+
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        '''Increase (unlabeled counter) by `amount`.'''
+        self.labels().inc(amount)
+
+class Gauge(_Metric):
+    '''Value that can go up and down.'''
+
+    kind = 'gauge'
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        '''Set (unlabeled gauge) to `value`.'''
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        '''Increase (unlabeled gauge) by `amount`.'''
+        self.labels().inc(amount)
+
+    def set_function(self, function):
+        '''Get the value of (unlabeled gauge) from `function`.'''
+        self.labels().set_function(function)
+
+class Histogram(_Metric):
+    '''Distribution of values (e.g. durations) in buckets.'''
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        '''Initialize `Histogram`, see `_Metric`.
+
+        Arguments:
+
+        * `buckets`: ascending upper bounds of buckets
+        (+Inf is implied).'''
+
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        '''Record `value` (unlabeled histogram).'''
+        self.labels().observe(value)
+
+    def time(self):
+        '''Context manager observing the seconds spent in it (unlabeled histogram).'''
+        return self.labels().time()
+
+class Registry:
+    '''Collection of metrics to be rendered together.'''
+
+    def __init__(self):
+        '''Initialize `Registry` object.'''
+        self.metrics = {}
+
+    def register(self, metric: _Metric):
+        '''Add `metric`.
+
+        Returns:
+
+        * `metric`.'''
+
+        assert metric.name not in self.metrics, f'{metric.name} already registered'
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()):
+        '''Create and register a `Counter`.'''
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()):
+        '''Create and register a `Gauge`.'''
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        '''Create and register a `Histogram`.'''
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        '''Get all metrics in the text format.
+
+        Returns:
+
+        * `str`.'''
+
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+###########################################################
+###################### node metrics #######################
+###########################################################
+
+TRANSACTIONS_RECEIVED = REGISTRY.counter(
+    'noobcash_transactions_received_total',
+    'Transactions received from other nodes (duplicates excluded)')
+TRANSACTIONS_VALIDATED = REGISTRY.counter(
+    'noobcash_transactions_validated_total', 'Received transactions accepted into the queue')
+TRANSACTIONS_REJECTED = REGISTRY.counter(
+    'noobcash_transactions_rejected_total', 'Received transactions rejected', ['reason'])
+VALIDATE_SECONDS = REGISTRY.histogram(
+    'noobcash_validate_transaction_seconds', 'Time of validate_transaction')
+
+MINE_SECONDS = REGISTRY.histogram(
+    'noobcash_mine_seconds', 'Time the miner spent on a block',
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300))
+MINE_HASHES = REGISTRY.counter('noobcash_mine_hashes_total', 'Nonces tried by the miner')
+HASH_RATE = REGISTRY.gauge('noobcash_hash_rate', 'Hashes per second of the last mined block')
+BLOCKS = REGISTRY.counter(
+    'noobcash_blocks_total', 'Blocks appended to the blockchain', ['source'])
+BLOCK_INTERVAL_SECONDS = REGISTRY.histogram(
+    'noobcash_block_interval_seconds', 'Time between the timestamps of consecutive blocks',
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600))
+
+VALID_PROOF_SECONDS = REGISTRY.histogram(
+    'noobcash_valid_proof_seconds', 'Time of valid_proof (validation of a block)')
+VALID_CHAIN_SECONDS = REGISTRY.histogram(
+    'noobcash_valid_chain_seconds', 'Time of validating a whole blockchain')
+REORGS = REGISTRY.counter(
+    'noobcash_reorgs_total', 'Blockchains of other nodes that replaced ours')
+ORPHANED_BLOCKS = REGISTRY.counter(
+    'noobcash_orphaned_blocks_total',
+    'Blocks of our blockchain dropped by reorgs (after the fork point)')
+STALE_BLOCKS = REGISTRY.counter(
+    'noobcash_stale_blocks_total', 'Received blocks extending a block before our last one')
+MINERS_KILLED = REGISTRY.counter(
+    'noobcash_miners_killed_total', 'Miners killed before finding a block (work wasted)')
+RESOLVES = REGISTRY.counter(
+    'noobcash_resolve_conflicts_total', 'Runs of resolve_conflicts by outcome', ['result'])
+RESOLVE_SECONDS = REGISTRY.histogram(
+    'noobcash_resolve_conflicts_seconds',
+    'Time of resolve_conflicts (lengths, download, validation)',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60))
+
+BROADCAST_SECONDS = REGISTRY.histogram(
+    'noobcash_broadcast_seconds', 'Latency of sending a message to a peer', ['peer', 'path'])
+BROADCAST_FAILURES = REGISTRY.counter(
+    'noobcash_broadcast_failures_total', 'Messages not accepted by a peer', ['peer', 'path'])
+
+MEMPOOL_DEPTH = REGISTRY.gauge(
+    'noobcash_mempool_transactions', 'Transactions in the transaction queues', ['queue'])
+CHAIN_HEIGHT = REGISTRY.gauge('noobcash_chain_height', 'Blocks in the blockchain')
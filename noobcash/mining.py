@@ -0,0 +1,178 @@
+'''Mining of blocks by the `Node` in forked processes and
+management of its miner.'''
+
+import os
+import signal
+import time
+import threading
+import wrapt
+
+from noobcash.block import Block
+from noobcash.helpers import post_payload
+from noobcash.locks import TRANSACTION_LOCK
+from noobcash import wire, metrics
+
+# headers with which the miner reports its metrics
+MINE_SECONDS_HEADER = 'X-Noobcash-Mine-Seconds'
+MINE_HASHES_HEADER = 'X-Noobcash-Mine-Hashes'
+
+class MiningMixin:
+    '''Mining methods of `Node` (uses its blockchain, queue and `miner_lock`).'''
+
+    def miner(self, transactions: list):
+        '''Function that mines `transactions`. Meant to operate as separate
+        process. Sends the mined block through the API. Commits
+        suicide so as not to continue the process.
+
+        Arguments:
+
+        * `transactions`: the first `capacity` transactions in the
+        `transaction_queue`, taken before forking (another thread
+        may have held the lock of the queue while forking).'''
+
+        status = 1
+        try:
+            block = Block(self.blockchain)
+
+            block.add_transactions(transactions)
+            t_0 = time.perf_counter()
+            hashes = block.mine(self.retarget.expected(self.blockchain.chain))
+            seconds = time.perf_counter() - t_0
+
+            # metrics of this process are lost (and their locks may be held
+            # forever), so report them along with the block, uninstrumented
+            post_payload((wire.encode(block, self.wire_format),
+                          f'127.0.0.1:{self.my_wallet().address.split(":")[-1]}' + \
+                              '/mined_block'),
+                         headers={MINE_SECONDS_HEADER: str(seconds),
+                                  MINE_HASHES_HEADER: str(hashes)})
+            status = 0
+        finally:
+            # su-su-suicide even on errors, sys.exit (or unwinding) would
+            # only end the thread of the request that forked us (e.g. under
+            # waitress) and leave a copy of the server running
+            os._exit(status)
+
+    def mine_block(self, partial=False):
+        '''High-level function to call when being ready
+        to mine.
+
+        Arguments:
+
+        * `partial`: whether to mine even if there are less
+        than `capacity` transactions (at least one).
+
+        Returns:
+
+        * `True` if a miner was started.'''
+
+        with self.miner_lock:
+            if self.miner_pid is not None:
+                # miner is already mining
+                return False
+
+            # ancestors of a transaction must be mined before (or with) it
+            transactions = self.transaction_queue.template(self.capacity)
+            if not transactions or len(transactions) < self.capacity and not partial:
+                return False
+
+            pid = self.start_miner(transactions)
+            if pid is None:
+                return False
+            self.miner_pid = pid
+            self.mining_ids = {tra.transaction_id for tra in transactions}
+            return True
+
+    def start_miner(self, transactions: list):
+        '''Fork a process running `miner()`.
+
+        Arguments:
+
+        * `transactions`: transactions of the block.
+
+        Returns:
+
+        * Process ID of the miner, `None` if it could not be started.'''
+
+        try:
+            pid = os.fork()
+        except OSError:
+            return None
+        if pid == 0: # child
+            self.miner(transactions)
+        return pid
+
+    def stop_miner(self, pid):
+        '''Kill the miner process `pid` (`SIGKILL`) and reap it.'''
+
+        os.kill(pid, signal.SIGKILL)
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
+
+    def reap_miner(self, pid):
+        '''Reap the miner process `pid`, which exits by itself after
+        sending its block (in the background, as it is waiting for
+        our response), so that it does not linger as a zombie and its
+        CPU time is added to ours.'''
+
+        def reap():
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+        threading.Thread(target=reap, daemon=True).start()
+
+    @wrapt.synchronized(TRANSACTION_LOCK.shared)
+    def mine_overdue_block(self, max_wait: float):
+        '''Mine a (possibly partial) block if the oldest queued
+        transaction has waited for `max_wait` seconds.
+
+        Arguments:
+
+        * `max_wait`: seconds.
+
+        Returns:
+
+        * `True` if a miner was started.'''
+
+        oldest = self.transaction_queue.oldest_arrival()
+        if oldest is None or time.monotonic() - oldest < max_wait:
+            return False
+        return self.mine_block(partial=True)
+
+    def kill_miner(self):
+        '''If miner is active, kill it (`SIGKILL`).'''
+
+        with self.miner_lock:
+            if self.miner_pid is not None:
+                self.stop_miner(self.miner_pid)
+                metrics.MINERS_KILLED.inc()
+                self.miner_pid = None
+                self.mining_ids = set()
+
+    def miner_done(self):
+        '''Allow the miner to be forked again.'''
+
+        with self.miner_lock:
+            if self.miner_pid is not None:
+                self.reap_miner(self.miner_pid)
+            self.miner_pid = None
+            self.mining_ids = set()
+
+    def record_mining(self, seconds: float, hashes: int):
+        '''Record metrics of a block our miner mined (whether
+        or not it was appended).
+
+        Arguments:
+
+        * `seconds`: time spent mining.
+
+        * `hashes`: number of nonces tried.'''
+
+        metrics.MINE_SECONDS.observe(seconds)
+        metrics.MINE_HASHES.inc(hashes)
+        if seconds > 0:
+            metrics.HASH_RATE.set(hashes / seconds)
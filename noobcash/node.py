@@ -1,39 +1,45 @@
 '''Cryptocurrency transaction handler of a node in the network.'''
 
-import os
-import sys
-import signal
-import json
+import time
 from typing import Union
 from multiprocessing.dummy import Pool as ThreadPool
 import threading
 import wrapt
-import urllib3
-import numpy as np
-from Crypto.Signature import PKCS1_v1_5
-
-from ordered_set import OrderedSet
 
 from noobcash.block import Block
 from noobcash.wallet import Wallet
 from noobcash.transaction import Transaction
 from noobcash.blockchain import Blockchain
 from noobcash.helpers import (
-    pubk_to_key, object_dict_deepcopy, get_len_from_address, send_dict_to_address
+    pubk_to_key, pubk_to_dict, pubk_from_dict, object_dict_deepcopy
 )
 from noobcash.transaction_queue import TransactionQueue
-
-BLOCK_LOCK = threading.RLock()
-TRANSACTION_LOCK = threading.RLock()
-
-NUM_OF_THREADS = 2
+from noobcash.seen_cache import SeenCache
+from noobcash.stats import Sample
+from noobcash.latency import LatencyTracker
+from noobcash.difficulty import Retarget
+from noobcash.locks import OrderedCommit, ProfiledLock, TRANSACTION_LOCK
+from noobcash.eviction import EvictionMixin
+from noobcash.mining import MiningMixin
+from noobcash.consensus import ConsensusMixin
+from noobcash.keys import REGISTRY
+from noobcash.tracing import TRACER
+from noobcash.transport import HttpTransport
+from noobcash import wire, signatures, hashing, metrics
+
+# threads signing a batch of our transactions
+NUM_OF_SIGNERS = 4
 
 # @wrapt.synchronized
-class Node:
+class Node(EvictionMixin, MiningMixin, ConsensusMixin):
     '''Cryptocurrency transaction handler of a node in the network.'''
 
     def __init__(self, bootstrap_address: str, capacity: int,
-                 difficulty: int, port: int, nodes=0, is_bootstrap=False):
+                 difficulty: int, port: int, nodes=0, is_bootstrap=False,
+                 wire_format='json', seen_cache_size=100000, mempool_size=0,
+                 mempool_bytes=0, mempool_policy='oldest', block_interval=0,
+                 retarget_window=10, signature_scheme=signatures.DEFAULT_SCHEME,
+                 hash_name=hashing.DEFAULT_HASH, transport=None):
         '''Initialize `Node` object.
 
         Arguments:
@@ -42,35 +48,108 @@ class Node:
 
         * `capacity`: capacity of a block in blockchain.
 
-        * `difficulty`: difficulty of mining a block.
+        * `difficulty`: (initial) difficulty of mining a block.
 
         * `port`: port listening to.
 
         * `nodes`: number of nodes in the network (considered known a priori).
 
-        * `is_bootstrap`: if this node is the bootstrap.'''
+        * `is_bootstrap`: if this node is the bootstrap.
+
+        * `wire_format`: format of transactions and blocks sent to other
+        nodes, 'json' or 'binary' (see `noobcash.wire`). Both are accepted.
+
+        * `seen_cache_size`: number of IDs of transactions (and of hashes of
+        blocks) remembered to drop duplicates.
+
+        * `mempool_size`: maximum number of transactions in each transaction
+        queue, 0 for no limit.
+
+        * `mempool_bytes`: maximum size of each transaction queue (with
+        transactions in binary wire format), 0 for no limit.
+
+        * `mempool_policy`: which transactions are evicted first when a
+        queue is full, 'oldest' or 'priority' (see `transaction_priority()`,
+        oldest first among equals). Our own transactions are never evicted,
+        as they have been broadcast and their inputs cannot be spent again.
+
+        * `block_interval`: target seconds per block the difficulty is
+        retargeted toward, 0 to keep `difficulty` fixed. Like `difficulty`,
+        only used by the bootstrap (see `signature_scheme`).
+
+        * `retarget_window`: number of blocks between retargets, likewise.
+
+        * `signature_scheme`: signature scheme of the network (see
+        `noobcash.signatures`). Only used by the bootstrap, other nodes
+        get it from the bootstrap (see `network_params()`).
+
+        * `hash_name`: hash function of the network (see `noobcash.hashing`),
+        like `signature_scheme`.
+
+        * `transport`: how to reach the other nodes (see `noobcash.transport`).
+        Default: `None`, `HttpTransport`.'''
+
+        self.transport = transport if transport is not None else HttpTransport()
+        # difficulty of every block (see `noobcash.difficulty`)
+        self.retarget = Retarget(difficulty, interval=block_interval, window=retarget_window)
+        if not is_bootstrap:
+            params = self.transport.network_params(bootstrap_address)
+            signature_scheme, hash_name = params['signature_scheme'], params['hash']
+            self.retarget = Retarget.from_dict(params['retarget'])
+        self.signature_scheme = signature_scheme
+        # must be set before anything is hashed
+        hashing.use(hash_name)
 
-        wallet = generate_wallet(port)
+        wallet = generate_wallet(port, signature_scheme)
 
         # validated transactions
-        self.transaction_queue = TransactionQueue()
+        self.transaction_queue = TransactionQueue(
+            max_count=mempool_size, max_bytes=mempool_bytes,
+            priority=self.transaction_priority if mempool_policy == 'priority' else None,
+            protected=self.is_my_transaction
+        )
         # transactions not reflected in wallets of ring
-        self.unprocessed_transaction_queue = TransactionQueue()
+        self.unprocessed_transaction_queue = TransactionQueue(
+            max_count=mempool_size, max_bytes=mempool_bytes
+        )
 
         self.miner_pid = None
+        # IDs of the transactions the miner is working on
+        self.mining_ids = set()
+        # guards miner_pid so that only one miner is forked
+        self.miner_lock = ProfiledLock(threading.Lock(), 'miner_lock')
+        # our transactions are signed concurrently but queued in order of creation
+        self.commit_order = OrderedCommit()
 
         self.capacity = capacity
 
-        self.difficulty = difficulty
+        self.difficulty = self.retarget.initial
 
         self.nodes = nodes
 
+        self.wire_format = wire_format
+
+        # transactions in blocks we mined
+        self.block_sizes = Sample()
+        # timestamps of transactions from creation/receipt to inclusion,
+        # confirmation latency (see `/latency` and `/assembly`)
+        self.latency = LatencyTracker()
+
+        # already processed (and authentic) messages
+        self.seen_transactions = SeenCache(seen_cache_size)
+        self.seen_blocks = SeenCache(seen_cache_size)
+
+        # process-wide gauges, they follow the last `Node` created
+        metrics.MEMPOOL_DEPTH.labels('validated').set_function(lambda: len(self.transaction_queue))
+        metrics.MEMPOOL_DEPTH.labels('unprocessed').set_function(
+            lambda: len(self.unprocessed_transaction_queue))
+        metrics.CHAIN_HEIGHT.set_function(lambda: len(self.blockchain))
 
         if is_bootstrap:
             self.my_id = 0
             # information for every node (its address (ip:port),
             # its public key, its balance, its utxos)
-            # should be modified with TRANSACTION_LOCK
+            # should be replaced with TRANSACTION_LOCK.exclusive
             self.ring = {
                 self.my_id: wallet
             }
@@ -82,7 +161,8 @@ class Node:
             self.blockchain = self.init_bootstrap_blockchain()
         else:
             self.bootstrap_address = bootstrap_address
-            self.my_id, self.blockchain = first_contact_data(self.bootstrap_address, wallet)
+            self.my_id, self.blockchain = first_contact_data(self.bootstrap_address, wallet,
+                                                             self.transport)
             # information for every node (its address (ip:port),
             # its public key, its balance, its utxos)
             self.ring = {
@@ -99,6 +179,17 @@ class Node:
         * `Wallet` w/ private key.'''
         return self.ring[self.my_id]
 
+    def network_params(self):
+        '''Get the parameters of the network that nodes
+        need before joining it.
+
+        Returns:
+
+        * `dict`.'''
+
+        return dict(signature_scheme=self.signature_scheme, hash=hashing.name(),
+                    retarget=self.retarget.to_dict())
+
     def init_bootstrap_blockchain(self):
         '''Initialize the blockchain of the bootstrap node.'''
 
@@ -108,6 +199,7 @@ class Node:
         self.add_utxos(genesis_transaction.transaction_outputs, self.ring_bak)
         return Blockchain(genesis_transaction=genesis_transaction)
 
+    @wrapt.synchronized(TRANSACTION_LOCK.exclusive)
     def register_node_to_ring(self, wallet_dict: dict):
         '''Handle request to enter the network. The bootstrap node
         should register the node in `ring` and respond with index and
@@ -119,9 +211,18 @@ class Node:
 
         Returns:
 
-        * `dict` with ['id', 'blockchain'].'''
+        * `dict` with ['id', 'blockchain', 'keys'], where `keys` are
+        the public keys of `ring`, needed to resolve the fingerprints
+        in `blockchain` (see `noobcash.keys`).
+
+        Raises:
+
+        * `ValueError` if the keys of the node are of another
+        signature scheme than the network's.'''
 
         node_wallet = Wallet.from_dict(wallet_dict)
+        if signatures.key_scheme(node_wallet.public_key) != self.signature_scheme:
+            raise ValueError(f'Network uses {self.signature_scheme} signatures')
         # if node has already contacted before to register
         # do not produce new index, ...
         index = self.pubk2ind.get(pubk_to_key(node_wallet.public_key), len(self.pubk2ind))
@@ -131,7 +232,8 @@ class Node:
 
         info = dict(
             blockchain=self.blockchain.to_dict(),
-            id=index
+            id=index,
+            keys=[pubk_to_dict(wallet.public_key) for wallet in self.ring.values()]
         )
 
         return info
@@ -165,17 +267,15 @@ class Node:
             k: self.ring[k].to_dict() for k in self.ring
         }
 
-        pool = ThreadPool(NUM_OF_THREADS)
-        request_params_list = [
-            (broadcast_message, f'{self.ring[receiver_idx].address}/wallets') \
-                for receiver_idx in self.ring if receiver_idx != self.my_id
-        ]
-        results = pool.map(send_dict_to_address, request_params_list)
-        pool.close()
-        pool.join()
+        results = self.transport.map(
+            lambda idx: self.transport.send_dict(self.ring[idx].address, 'wallets',
+                                                 broadcast_message),
+            [idx for idx in self.ring if idx != self.my_id]
+        )
 
         return all(results)
 
+    @wrapt.synchronized(TRANSACTION_LOCK.exclusive)
     def receive_wallets(self, wallet_dict: dict):
         '''Receive all wallets from the bootstrap and
         copy to ring and backup. Also, process all transactions
@@ -204,7 +304,7 @@ class Node:
                 break
             else:
                 self.my_id, self.blockchain = first_contact_data(self.bootstrap_address,
-                                                                 self.my_wallet())
+                                                                 self.my_wallet(), self.transport)
 
         # process transactions received before wallets
         self.process_transactions()
@@ -234,9 +334,9 @@ class Node:
 
         return transaction
 
-    @wrapt.synchronized(TRANSACTION_LOCK)
     def create_transaction(self, receiver_idx: int, amount: int):
-        '''Create transaction, update wallets and queue.
+        '''Create transaction, update wallets and queue. Evict
+        transactions if the queue is full.
         NOTE: sender is this node, transaction is not broadcasted.
 
         Arguments:
@@ -250,455 +350,357 @@ class Node:
 
         * `Transaction` if succesfully created, else `None`.'''
 
-        receiver_wallet = self.ring[receiver_idx]
-        try:
-            # here we also update our wallet
-            transaction = Transaction(recipient_pubk=receiver_wallet.public_key,
-                                      value=amount, my_wallet=self.my_wallet())
-        except TypeError: # Reject transaction, not enough cash
-            return None
-
-        # NOTE: broadcast transaction from API so not inside lock
-        # self.broadcast_transaction(transaction)
-        self.add_utxos(transaction.transaction_outputs, self.ring)
-        self.transaction_queue.append(transaction)
-
-        if len(self.transaction_queue) >= self.capacity:
-            self.mine_block()
-
+        transaction, = self._create_transactions([(receiver_idx, amount)])
+        self.trim_queues()
         return transaction
 
-    def add_utxos(self, transaction_outputs: list, ring: dict):
-        '''Add unspent transactions to respective wallets.
+    def create_transactions(self, orders: list):
+        '''Create a batch of transactions, update wallets and queue.
+        Utxos are picked for all of them at once, then they are signed
+        in parallel. Evict transactions if the queue is full.
+        NOTE: sender is this node, transactions are not broadcasted.
 
         Arguments:
 
-        * `transaction_outputs`: iterable of `TransactionOutput` objects.
-
-        * `ring`: `Wallet` of nodes.'''
-
-        for tro in transaction_outputs:
-            ring[self.pubk2ind[pubk_to_key(tro.receiver_public_key)]].add_utxo(tro)
-
-    def broadcast_transaction(self, transaction: Transaction):
-        '''Broadcast transaction to everyone (but self).
-
-        Arguments:
-
-        `transaction`: `Transaction` to be broadcasted.
+        * `orders`: `list` of (receiver index in `ring`, amount) pairs.
 
         Returns:
 
-        * `True` is send successfully to every node.'''
-
-        broadcast_message = transaction.to_dict()
-        pool = ThreadPool(NUM_OF_THREADS)
-        request_params_list = [
-            (broadcast_message, f'{self.ring[receiver_idx].address}/transaction') \
-                for receiver_idx in self.ring if receiver_idx != self.my_id
-        ]
-        results = pool.map(send_dict_to_address, request_params_list)
-        pool.close()
-        pool.join()
+        * `list` with a `Transaction` for every successful order (in
+        order), else `None` (not enough cash or unknown receiver).'''
 
-        return all(results)
+        transactions = self._create_transactions(orders)
+        self.trim_queues()
+        return transactions
 
-    @wrapt.synchronized(TRANSACTION_LOCK)
-    def receive_transaction(self, transaction: Union[dict, Transaction]):
-        '''Validate `transaction`, update `ring` and add to queue. Call
-        miner if necessary and possible.
+    @wrapt.synchronized(TRANSACTION_LOCK.shared)
+    def _create_transactions(self, orders: list):
+        '''Create transactions, update wallets and queue. Only picking
+        the utxos is serialized (by our wallet), signing happens
+        concurrently and transactions are queued in order of creation.
+        NOTE: sender is this node, transactions are not broadcasted.
 
         Arguments:
 
-        `transaction`: `dict` directly from `to_dict()` or `Transaction`.'''
+        * `orders`: `list` of (receiver index in `ring`, amount) pairs.
 
-        if isinstance(transaction, dict):
-            transaction = Transaction.from_dict(transaction)
+        Returns:
 
-        # if ring is incomplete and not bootstrap
-        # append to unprocessed
-        if len(self.ring) < self.nodes and self.my_id != 0:
-            self.unprocessed_transaction_queue.append(transaction)
-            return
+        * `list` with a `Transaction` for every successful order, else `None`.'''
 
-        if not self.validate_transaction(transaction, self.ring):
-            return
+        transactions = []
+        my_wallet = self.my_wallet()
+        with wrapt.synchronized(my_wallet):
+            for receiver_idx, amount in orders:
+                try:
+                    # here we also update our wallet
+                    transaction = Transaction(recipient_pubk=self.ring[receiver_idx].public_key,
+                                              value=amount, my_wallet=my_wallet, sign=False)
+                except (TypeError, KeyError): # Reject transaction, not enough cash
+                    transactions.append(None)
+                    continue
+                # change is available to the next transaction right away,
+                # which is queued after this one thanks to the ticket
+                self.add_utxos(transaction.transaction_outputs, self.ring)
+                transactions.append(transaction)
+            ticket = self.commit_order.ticket()
 
-        self.add_utxos(transaction.transaction_outputs, self.ring)
-        self.transaction_queue.append(transaction)
+        created = [tra for tra in transactions if tra is not None]
+        signed = False
+        try:
+            if len(created) > 1:
+                with ThreadPool(min(NUM_OF_SIGNERS, len(created))) as pool:
+                    sigs = pool.map(lambda tra: tra.sign_transaction(my_wallet.private_key),
+                                    created)
+            else:
+                sigs = [tra.sign_transaction(my_wallet.private_key) for tra in created]
+            for tra, signature in zip(created, sigs):
+                tra.signature = signature
+            signed = True
+        finally:
+            # every ticket must take its turn, else later transactions wait forever
+            with self.commit_order.turn(ticket):
+                if not signed:
+                    # nothing gets queued, give the inputs back and take the outputs away
+                    with wrapt.synchronized(my_wallet):
+                        self.revert_transactions(created)
+                for tra in created:
+                    if tra.signature is not None:
+                        # NOTE: broadcast transaction from API so not inside lock
+                        # self.broadcast_transaction(transaction)
+                        self.seen_transactions.add(tra.transaction_id)
+                        self.transaction_queue.append(tra)
+                        self.latency.created(tra.transaction_id)
 
         if len(self.transaction_queue) >= self.capacity:
             self.mine_block()
 
-    @wrapt.synchronized(TRANSACTION_LOCK)
-    def process_transactions(self):
-        '''Process transaction in the `unprocessed_transaction_queue`.'''
-
-        for tra in self.unprocessed_transaction_queue:
-            if not self.validate_transaction(tra, self.ring):
-                continue
-            self.add_utxos(tra.transaction_outputs, self.ring)
-            self.transaction_queue.append(tra)
-
-        self.unprocessed_transaction_queue.empty()
-
-        if len(self.transaction_queue) >= self.capacity:
-            self.mine_block()
+        return transactions
 
-    def validate_transaction(self, transaction: Transaction, ring: dict):
-        '''Validate received transaction.
+    def add_utxos(self, transaction_outputs: list, ring: dict):
+        '''Add unspent transactions to respective wallets.
 
         Arguments:
 
-        * `transaction`: [Reconstructed from `dict`] `Transaction`.
-
-        * `ring`: ring of `Wallet`s the validation is based upon.
+        * `transaction_outputs`: iterable of `TransactionOutput` objects.
 
-        Returns:
+        * `ring`: `Wallet` of nodes.'''
 
-        * `True` if valid.'''
+        for tro in transaction_outputs:
+            ring[self.pubk2ind[pubk_to_key(tro.receiver_public_key)]].add_utxo(tro)
 
-        # signature
-        if not PKCS1_v1_5.new(transaction.sender_pubk).\
-            verify(transaction.make_hash(as_str=False), transaction.signature):
-            return False
+    def broadcast_transaction(self, transaction: Transaction):
+        '''Broadcast transaction to everyone (but self).
 
-        # double spending
-        if len(set(transaction.transaction_inputs)) < len(transaction.transaction_inputs):
-            return False
+        Arguments:
 
-        # check ids are the same, note that utxos can be 1 or 2
-        if not all([utxo.transaction_id == transaction.transaction_id \
-            for utxo in transaction.transaction_outputs]):
-            return False
+        `transaction`: `Transaction` to be broadcasted.
 
-        # check if transaction inputs exist
-        amount = 0
-        for utxo in transaction.transaction_outputs:
-            if utxo.amount < 0:
-                return False
-            amount += utxo.amount
+        Returns:
 
-        return ring[self.pubk2ind[pubk_to_key(transaction.sender_pubk)]]\
-            .check_and_remove_utxos(transaction.transaction_inputs, amount)
+        * `True` is send successfully to every node.'''
 
-    def miner(self):
-        '''Function that mines the first `capacity` transactions
-        in the `transaction_queue`. Meant to operate as separate
-        process. Sends the mined block through the API. Commits
-        suicide so as not to continue the process.'''
+        trace = TRACER.new_context('transaction', transaction.transaction_id)
+        with TRACER.span('encode', trace):
+            broadcast_message = wire.encode(transaction, self.wire_format)
+        return self.broadcast_payload(broadcast_message, 'transaction', trace)
 
-        block = Block(self.blockchain)
+    def broadcast_transactions(self, transactions: list):
+        '''Broadcast a batch of transactions to everyone (but self),
+        with one request per node.
 
-        block.add_transactions(self.transaction_queue[:self.capacity])
-        block.mine(self.difficulty)
+        Arguments:
 
-        send_dict_to_address((block.to_dict(),
-                              f'127.0.0.1:{self.my_wallet().address.split(":")[-1]}' + \
-                                  '/mined_block'))
+        `transactions`: `list` of `Transaction`s to be broadcasted.
 
-        # su-su-suicide
-        sys.exit(0)
+        Returns:
 
-    def mine_block(self):
-        '''High-level function to call when being ready
-        to mine.'''
+        * `True` is send successfully to every node.'''
 
-        if self.miner_pid is not None:
-            # miner is already mining
-            return
+        trace = TRACER.new_context('transactions')
+        with TRACER.span('encode', trace, items=len(transactions)):
+            broadcast_message = wire.encode(transactions, self.wire_format)
+        return self.broadcast_payload(broadcast_message, 'transactions', trace)
 
-        try:
-            pid = os.fork()
-        except:
-            return
-        if pid == 0: # child
-            self.miner()
-        else: # father
-            self.miner_pid = pid
-
-    def kill_miner(self):
-        '''If miner is active, kill it (`SIGKILL`).'''
-
-        if self.miner_pid is not None:
-            os.kill(self.miner_pid, signal.SIGKILL)
-            self.miner_pid = None
-
-    @wrapt.synchronized(BLOCK_LOCK)
-    def check_my_mined_block(self, block_dict: dict):
-        '''Check block returned from miner and its coherence
-        with the current blockchain. Append if everything
-        is proper. Renew miner. NOTE: block is not broadcasted.
+    def broadcast_payload(self, broadcast_message: tuple, path: str, trace=None):
+        '''Send an encoded message to everyone (but self).
 
         Arguments:
 
-        * `block_dict`: `dict` directly from `to_dict()`.
-
-        Returns:
+        * `broadcast_message`: (`bytes` body, `str` content type) from `wire.encode()`.
 
-        * The mined block or `None` if not appended.'''
+        * `path`: endpoint of the nodes, e.g. 'block'.
 
-        block = Block.from_dict(block_dict)
+        * `trace`: `TraceContext` of the message, sent along if given.
 
-        if block.previous_hash == self.blockchain.get_block_hash(-1):
-
-            block_transactions, _ = self.transaction_queue.split(self.capacity, assign=1)
-            # allow miner to be recalled now that the transaction queue is up-to-date
-            self.miner_pid = None
-
-            for tra in block_transactions:
-                self.add_utxos(tra.transaction_outputs, ring=self.ring_bak)
-                self.ring_bak[self.pubk2ind[pubk_to_key(tra.sender_pubk)]]\
-                    .remove_utxos(tra.transaction_inputs)
+        Returns:
 
-            # NOTE: broadcast block from API so not inside lock
-            # self.broadcast_block(block)
+        * `True` is send successfully to every node.'''
 
-            self.blockchain.append_block(block)
+        headers = TRACER.headers(trace)
 
-        else:
-            # new blockchain/block received and miner was not killed in time
-            # enable to recall, but transaction queue is new so dont meddle
-            self.miner_pid = None
-            block = None
+        def send(receiver_idx):
+            with TRACER.span('send', trace, peer=receiver_idx):
+                return self.transport.send(self.ring[receiver_idx].address, path,
+                                           broadcast_message, headers)
 
-        if len(self.transaction_queue) >= self.capacity:
-            self.mine_block()
+        results = self.transport.map(send, [idx for idx in self.ring if idx != self.my_id])
 
-        return block
+        return all(results)
 
-    def broadcast_block(self, block: Block):
-        '''Broadcast mined block to all nodes.
+    def receive_transaction(self, transaction: Union[dict, Transaction], verified=False):
+        '''Validate `transaction`, update `ring` and add to queue. Call
+        miner if necessary and possible. Evict transactions if the
+        queue is full.
 
         Arguments:
 
-        * `block`: `Block` with proof-of-work.'''
-
-        broadcast_message = block.to_dict()
-        pool = ThreadPool(NUM_OF_THREADS)
-        request_params_list = [
-            (broadcast_message, f'{self.ring[receiver_idx].address}/block') \
-                 for receiver_idx in self.ring if receiver_idx != self.my_id
-        ]
-        results = pool.map(send_dict_to_address, request_params_list)
-        pool.close()
-        pool.join()
+        * `transaction`: `dict` directly from `to_dict()` or `Transaction`.
 
-        return all(results)
+        * `verified`: whether the signature has already been checked
+        with `verify_signature()`.
 
-    def valid_proof(self, block: Block, ring: dict):
-        '''Validate `block` and renew wallets of `ring` based
-        on it. Revert `ring` if block is not valid.
+        Returns:
 
-        Arguments:
+        * `False` if `transaction` was rejected, else `True` (even if it
+        was evicted right away).'''
 
-        * `block`: `Block` to be validated.
+        accepted = self._receive_transaction(transaction, verified)
+        self.trim_queues()
+        return accepted
 
-        * `ring`: ring of `Wallet`s.
+    @wrapt.synchronized(TRANSACTION_LOCK.shared)
+    def _receive_transaction(self, transaction: Union[dict, Transaction], verified=False):
+        '''`receive_transaction()` without evictions.'''
 
-        Return:
+        if isinstance(transaction, dict):
+            transaction = Transaction.from_dict(transaction)
 
-        * Whether `block` is valid.'''
+        # if ring is incomplete and not bootstrap
+        # append to unprocessed
+        if len(self.ring) < self.nodes and self.my_id != 0:
+            self.unprocessed_transaction_queue.append(transaction)
+            return True
 
-        if not block.validate_hash(self.difficulty):
+        if not verified and not self.verify_signature(transaction):
+            metrics.TRANSACTIONS_REJECTED.labels('signature').inc()
             return False
 
-        ring_bak_bak = object_dict_deepcopy(ring)
+        # authentic, so no need to process it again even if it is rejected
+        self.seen_transactions.add(transaction.transaction_id)
+        self.latency.received(transaction.transaction_id)
 
         try:
-            for tra in block.list_of_transactions:
-                if not self.validate_transaction(tra, ring):
-                    raise ValueError
-                self.add_utxos(tra.transaction_outputs, ring)
-        except ValueError:
-            for k in ring: # change values, not pointer
-                           # no deepcopy for efficiency
-                ring[k] = ring_bak_bak[k]
+            with TRACER.span('validate'):
+                valid = self.validate_transaction(transaction, self.ring, check_signature=False)
+        except KeyError:
+            metrics.TRANSACTIONS_REJECTED.labels('unknown_sender').inc()
+            raise
+        if not valid:
+            metrics.TRANSACTIONS_REJECTED.labels('invalid').inc()
             return False
+        metrics.TRANSACTIONS_VALIDATED.inc()
+
+        # queue before the outputs can be spent, so that a transaction
+        # spending them is always queued after this one
+        with TRACER.span('apply'):
+            self.transaction_queue.append(transaction)
+            self.add_utxos(transaction.transaction_outputs, self.ring)
+
+        if len(self.transaction_queue) >= self.capacity:
+            self.mine_block()
 
         return True
 
-    def valid_chain(self, blockchain):
-        '''Validate `blockchain` and renew both rings along
-        with it.
+    def receive_transactions(self, transactions: list, verified: list, traces=None):
+        '''Receive a batch of transactions in order, acquiring
+        the TRANSACTION_LOCK only once (and evicting once).
 
         Arguments:
 
-        * `blockchain`: `Blockchain` to be validated.
+        * `transactions`: `list` of `Transaction`s.
 
-        Returns:
-
-        * Whether `blockchain` is valid.'''
+        * `verified`: `list` of results of `verify_signature()`
+        for `transactions`.
 
-        # check for the longer chain across all nodes
-        new_ring = {k: Wallet.from_dict(self.ring[k].to_dict()) for k in self.ring}
-        new_ring[self.my_id].private_key = self.my_wallet().private_key
+        * `traces`: `list` of `TraceContext`s (or `None`s) of
+        `transactions`. Default: `None`, not traced.
 
-        # add genesis transaction
-        genesis_tra = blockchain.chain[0].list_of_transactions[0]
-        self.add_utxos(genesis_tra.transaction_outputs, new_ring)
+        Returns:
 
-        for block in blockchain.chain[1:]:
-            if not self.valid_proof(block, new_ring):
-                return None
+        * `list` of results of `receive_transaction()`.'''
+
+        traces = traces or [None] * len(transactions)
+        results = []
+        start, t_0 = time.time(), time.perf_counter()
+        with TRANSACTION_LOCK.shared:
+            waited = time.perf_counter() - t_0
+            for tra, valid, trace in zip(transactions, verified, traces):
+                TRACER.record('lock', trace, start, waited)
+                try:
+                    with TRACER.context(trace):
+                        results.append(valid and self._receive_transaction(tra, verified=True))
+                except KeyError: # unknown sender or receiver
+                    results.append(False)
+        self.trim_queues()
+        return results
+
+    @wrapt.synchronized(TRANSACTION_LOCK.exclusive)
+    def process_transactions(self):
+        '''Process transaction in the `unprocessed_transaction_queue`.'''
 
-        return new_ring
+        self.unprocessed_transaction_queue.trim()
 
-    def longest_blockchain_info(self):
-        '''Get length and index of node with the longest blockchain.'''
+        for tra in self.unprocessed_transaction_queue:
+            if not self.validate_transaction(tra, self.ring):
+                continue
+            self.add_utxos(tra.transaction_outputs, self.ring)
+            self.transaction_queue.append(tra)
 
-        pool = ThreadPool(NUM_OF_THREADS)
-        urls = [
-            f'{self.ring[receiver_idx].address}/length' \
-                for receiver_idx in self.ring if receiver_idx != self.my_id
-        ]
-        blockchain_lengths = pool.map(get_len_from_address, urls)
-        pool.close()
-        pool.join()
+        self.unprocessed_transaction_queue.empty()
 
-        # NOTE: Consider returning the whole list to be able to loop in case of lying
+        self._trim_queues()
 
-        node_with_longest_chain = np.argmax(blockchain_lengths)
-        max_blockchain_len = blockchain_lengths[node_with_longest_chain]
+        if len(self.transaction_queue) >= self.capacity:
+            self.mine_block()
 
-        if node_with_longest_chain >= self.my_id:
-            # renew index because ours is not included in the list returned
-            node_with_longest_chain += 1
+    def verify_signature(self, transaction: Transaction):
+        '''Check signature of `transaction`. Does not depend on
+        any state, so it can run outside of any lock.
 
-        return node_with_longest_chain, max_blockchain_len
+        Arguments:
 
-    def resolve_conflicts(self):
-        '''Try and get longest chain from the network. If
-        new blockchain is indeed found, renew rings and
-        transaction queues.
+        * `transaction`: [Reconstructed from `dict`] `Transaction`.
 
         Returns:
 
-        * `True` is new blockchain is embraced.'''
-
-        node_with_longest_chain, max_blockchain_len = self.longest_blockchain_info()
+        * `True` if the signature is valid.'''
 
-        if len(self.blockchain) > max_blockchain_len:
-            return False
-
-        if len(self.blockchain) == max_blockchain_len and \
-            self.my_id < node_with_longest_chain:
-            return False
-
-        url = f'{self.ring[node_with_longest_chain].address}/blockchain'
-
-        http = urllib3.PoolManager()
-        response = http.request('GET', url, headers={'Accept': 'application/json'})
-
-        blockchain = Blockchain.from_dict(json.loads(response.data))
-
-        # renews both rings
-        new_ring = self.valid_chain(blockchain)
-        if new_ring is None:
+        try:
+            return signatures.verify(transaction.sender_pubk,
+                                     transaction.make_hash(as_str=False), transaction.signature)
+        except (TypeError, ValueError, AttributeError): # e.g. not a key
             return False
 
-        # acquire TRANSACTION_LOCK
-        self.accept_foreign_blockchain(new_ring, blockchain)
-
-        return True
-
-    @wrapt.synchronized(TRANSACTION_LOCK)
-    @wrapt.synchronized(BLOCK_LOCK) # redundant as this function was specifically designed
-                                    # to be used inside a BLOCK_LOCK to get TRANSACTION_LOCK
-                                    # include for consistency
-    def accept_foreign_blockchain(self, new_ring, blockchain):
-        '''Wrapper around commands that require the TRANSACTION_LOCK
-        when a new blockchain is accepted.
+    def validate_transaction(self, transaction: Transaction, ring: dict,
+                             check_signature=True):
+        '''Validate received transaction.
 
         Arguments:
 
-        * `new_ring`: the state of the ring of the newly
-        received `blockchain`.
-
-        * `blockchain`: the newly received `Blockchain`.'''
-
-        # keep transactions that have been sent to us
-        # but do not exist in the received blockchain
-
-        self.kill_miner()
-
-        self.ring_bak = object_dict_deepcopy(new_ring)
-        self.ring = object_dict_deepcopy(new_ring)
-
-        transactions_dif = self.blockchain.set_of_transactions()\
-            .union(OrderedSet(self.transaction_queue.transactions()))\
-            .union(OrderedSet(self.unprocessed_transaction_queue.transactions())) - \
-            blockchain.set_of_transactions()
-
-        self.unprocessed_transaction_queue.set(list(transactions_dif))
-        self.transaction_queue.empty()
-
-        self.blockchain = blockchain
-
-        # renew ring to be able to receive new transactions
-        # based on the ones we have already received
-        self.process_transactions()
-
-    @wrapt.synchronized(BLOCK_LOCK)
-    def receive_block(self, block_dict: dict):
-        '''Check if block is redundant to handle, proper to append
-        to the blockchain (and kill miner) or ask for new blockchain.
+        * `transaction`: [Reconstructed from `dict`] `Transaction`.
 
-        Arguments:
+        * `ring`: ring of `Wallet`s the validation is based upon.
 
-        * `block_dict`: `dict` directly from `to_dict()`.
+        * `check_signature`: whether to verify the signature, set to
+        `False` if already done with `verify_signature()`.
 
         Returns:
 
-        * `True` if new block is accepted (even if it requires a new blockchain).'''
+        * `True` if valid.'''
+
+        with metrics.VALIDATE_SECONDS.time():
+            return self._validate_transaction(transaction, ring, check_signature)
 
-        block = Block.from_dict(block_dict)
-        # NOTE: check capacity?
+    def _validate_transaction(self, transaction: Transaction, ring: dict, check_signature):
+        '''`validate_transaction()` without timing.'''
 
-        if block.previous_hash in self.blockchain.hashes_set and \
-            block.previous_hash != self.blockchain.get_block_hash(-1):
+        # signature
+        if check_signature and not self.verify_signature(transaction):
             return False
 
-        if block.previous_hash != self.blockchain.get_block_hash(-1):
-            return self.resolve_conflicts()
+        # double spending
+        if len(set(transaction.transaction_inputs)) < len(transaction.transaction_inputs):
+            return False
 
-        if self.valid_proof(block, self.ring_bak): # use bak to validate
-                                                   # if valid, ring_bak is updated
-            # acquire TRANSACTION_LOCK
-            self.accept_foreign_block(block)
+        # check ids are the same, note that utxos can be 1 or 2
+        if not all([utxo.transaction_id == transaction.transaction_id \
+            for utxo in transaction.transaction_outputs]):
+            return False
 
-            return True
+        # check if transaction inputs exist
+        amount = 0
+        for utxo in transaction.transaction_outputs:
+            if utxo.amount < 0:
+                return False
+            amount += utxo.amount
 
-        return False
+        return ring[self.pubk2ind[pubk_to_key(transaction.sender_pubk)]]\
+            .check_and_remove_utxos(transaction.transaction_inputs, amount)
 
-    @wrapt.synchronized(TRANSACTION_LOCK)
-    def accept_foreign_block(self, block):
-        '''Wrapper around commands that require the TRANSACTION_LOCK
-        when a new block is accepted (not a new blockchain).
+    def broadcast_block(self, block: Block):
+        '''Broadcast mined block to all nodes.
 
         Arguments:
 
-        * `block`: the newly accepted `Block`.'''
-
-        # logic: removed transactions of block from queue
-        # & update ring wrt transactions never seen before
-        # without adding them to the queue, while preserving
-        # their order with OrderedSet
-
-        self.kill_miner()
-        self.blockchain.append_block(block)
-        tra_queue_set = OrderedSet(self.transaction_queue.transactions())
-        rec_tra_set = OrderedSet(block.list_of_transactions)
+        * `block`: `Block` with proof-of-work.'''
 
-        self.transaction_queue.set(list(tra_queue_set - rec_tra_set))
-        unknown_tra = list(rec_tra_set - tra_queue_set)
-        for tra in unknown_tra:
-            # add to ring but do not append to queue
-            # they already in blockchain
-            self.validate_transaction(tra, self.ring)
-            self.add_utxos(tra.transaction_outputs, self.ring)
+        trace = TRACER.new_context('block', block.hash)
+        with TRACER.span('encode', trace):
+            broadcast_message = wire.encode(block, self.wire_format)
+        return self.broadcast_payload(broadcast_message, 'block', trace)
 
-def first_contact_data(bootstrap_address: str, wallet: Wallet):
+def first_contact_data(bootstrap_address: str, wallet: Wallet, transport=None):
     '''Contact bootstrap to register into the network
     and handle the data in the response. MUST send wallet
     information and get index and current blockchain.
@@ -710,32 +712,32 @@ def first_contact_data(bootstrap_address: str, wallet: Wallet):
 
     * `wallet`: the node's `Wallet` (not set yet into `ring`),
 
+    * `transport`: see `noobcash.transport`. Default: `None`, `HttpTransport`.
+
     Returns:
 
     * ([ascending] ID of node in the network, [not validated] bootstrap's blockchain).'''
 
-    myinfo = wallet.to_dict()
-
-    http = urllib3.PoolManager()
+    transport = transport if transport is not None else HttpTransport()
+    response = transport.join(bootstrap_address, wallet.to_dict())
 
-    # we are contacting the bootstrap
-    # loop until we get proper chain
-    response = json.loads(http.request('POST', f'{bootstrap_address}/node',
-                                       headers={'Content-Type': 'application/json'},
-                                       body=json.dumps(myinfo)).data)
+    for pubk_dict in response['keys']:
+        REGISTRY.register(pubk_from_dict(pubk_dict))
 
     # blockchain in response is (ordered) list of blocks
     return response['id'], Blockchain.from_dict(response['blockchain'])
 
-def generate_wallet(port: int):
+def generate_wallet(port: int, scheme=signatures.DEFAULT_SCHEME):
     '''Generate node's wallet.
 
     Arguments:
 
     * `port`: integer port where node is listening.
 
+    * `scheme`: signature scheme of the network.
+
     Returns:
 
     * `Wallet`.'''
 
-    return Wallet(port=port, this_node=True)
+    return Wallet(port=port, this_node=True, scheme=scheme)
@@ -0,0 +1,248 @@
+'''On-demand profiling of a running node (served under `/profile`):
+a sampling CPU profiler of all threads producing collapsed stacks
+(the input of flamegraph.pl, speedscope, etc.), `tracemalloc`
+snapshots compared with the previous one, live objects by type and
+the deep size of the structures of the `Node` (rings, queues,
+blockchain, caches).'''
+
+import os
+import sys
+import gc
+import time
+import types
+import threading
+import tracemalloc
+from collections import Counter, deque
+
+from noobcash.keys import REGISTRY
+from noobcash.locks import ProfiledLock, LockProfile
+
+# upper limit of the duration of a CPU profile
+MAX_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+
+# never followed when computing deep sizes: shared by everything or
+# leading back to the whole node (e.g. bound methods as priorities)
+_OPAQUE_TYPES = (type, types.ModuleType, types.FunctionType, types.MethodType,
+                 types.BuiltinFunctionType, types.CodeType, types.FrameType,
+                 threading.Thread, type(threading.Lock()), type(threading.RLock()),
+                 threading.Condition, threading.local, ProfiledLock, LockProfile)
+
+# innermost frames of threads blocked waiting for work
+IDLE_FRAMES = frozenset((
+    'threading.py:wait', 'threading.py:wait_for', 'queue.py:get', 'thread.py:_worker',
+    'selectors.py:select', 'wasyncore.py:poll', 'pool.py:worker', 'pool.py:_handle_tasks',
+    'pool.py:_handle_results', 'pool.py:_handle_workers'
+))
+
+_CPU_LOCK = threading.Lock()
+_LAST_SNAPSHOT = None
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}'
+
+def sample_stacks(seconds: float, interval=DEFAULT_INTERVAL, idle=True):
+    '''Sample the stacks of all threads (but the calling one)
+    every `interval` seconds for `seconds` seconds.
+
+    Arguments:
+
+    * `seconds`: duration of the profile (at most `MAX_SECONDS`).
+
+    * `interval`: seconds between samples.
+
+    * `idle`: whether to keep samples of threads waiting
+    for work (see `IDLE_FRAMES`).
+
+    Returns:
+
+    * `collections.Counter` of collapsed stack ('thread;outer;...;inner')
+    -> number of samples, `None` if another profile is running.'''
+
+    if not _CPU_LOCK.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        stacks = Counter()
+        deadline = time.perf_counter() + min(seconds, MAX_SECONDS)
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items(): # pylint: disable=protected-access
+                if ident == me or (not idle and _frame_label(frame) in IDLE_FRAMES):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, str(ident)).replace(';', ':'))
+                stacks[';'.join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _CPU_LOCK.release()
+
+def collapsed(stacks: Counter):
+    '''Format stacks of `sample_stacks()` as collapsed
+    stacks, one 'stack count' per line (most samples first).
+
+    Returns:
+
+    * `str`.'''
+
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+def deep_sizeof(obj, seen=None):
+    '''Compute the size of `obj` and everything it refers to
+    (containers, attributes), each object counted once.
+
+    Arguments:
+
+    * `obj`: any object.
+
+    * `seen`: `set` of IDs of objects already counted, shared
+    between calls to count common objects once. Default: `None`.
+
+    Returns:
+
+    * (`int` bytes, `int` objects).'''
+
+    seen = set() if seen is None else seen
+    size, count = 0, 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _OPAQUE_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        count += 1
+
+        # list() of containers is atomic, they may change meanwhile
+        if isinstance(obj, dict):
+            for key, value in list(obj.items()):
+                stack.append(key)
+                stack.append(value)
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(list(obj))
+        elif isinstance(obj, (str, bytes, bytearray, int, float, bool)) or obj is None:
+            continue
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(vars(obj))
+            for slot in getattr(type(obj), '__slots__', ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return size, count
+
+def node_memory(node):
+    '''Attribute memory to the structures of `node`. Each is measured
+    on its own, so objects they share (e.g. public keys, transactions
+    both queued and in a block) are counted in every one of them.
+
+    Arguments:
+
+    * `node`: `Node`.
+
+    Returns:
+
+    * `dict` of structure -> `dict` with bytes and objects.'''
+
+    structures = dict(
+        ring=node.ring,
+        ring_bak=node.ring_bak,
+        transaction_queue=node.transaction_queue,
+        unprocessed_transaction_queue=node.unprocessed_transaction_queue,
+        blockchain=node.blockchain,
+        seen_transactions=node.seen_transactions,
+        seen_blocks=node.seen_blocks,
+        latency=node.latency,
+        keys=REGISTRY
+    )
+    memory = {}
+    for name, structure in structures.items():
+        size, count = deep_sizeof(structure)
+        memory[name] = dict(bytes=size, objects=count)
+    memory['blockchain']['blocks'] = len(node.blockchain)
+    memory['transaction_queue']['transactions'] = len(node.transaction_queue)
+    memory['unprocessed_transaction_queue']['transactions'] = \
+        len(node.unprocessed_transaction_queue)
+    return memory
+
+def objects_by_type(limit=20):
+    '''Count objects tracked by the garbage collector by type.
+
+    Arguments:
+
+    * `limit`: number of types returned (largest first).
+
+    Returns:
+
+    * `list` of `dict`s with type, count and (shallow) bytes.'''
+
+    counts, sizes = Counter(), Counter()
+    for obj in gc.get_objects():
+        name = type(obj).__qualname__
+        counts[name] += 1
+        sizes[name] += sys.getsizeof(obj)
+    return [dict(type=name, count=counts[name], bytes=size) \
+        for name, size in sizes.most_common(limit)]
+
+def tracemalloc_report(limit=20, frames=1):
+    '''Take a `tracemalloc` snapshot, starting tracing first if needed
+    (then only later allocations are traced). Allocations are grouped
+    by source line, and compared to the previous snapshot.
+
+    Arguments:
+
+    * `limit`: number of lines returned (largest first).
+
+    * `frames`: frames stored per allocation if tracing is started.
+
+    Returns:
+
+    * `dict`.'''
+
+    global _LAST_SNAPSHOT # pylint: disable=global-statement
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        _LAST_SNAPSHOT = None
+        return dict(tracing=True, started=True)
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    report = dict(
+        tracing=True,
+        started=False,
+        current=current,
+        peak=peak,
+        top=[dict(where=str(stat.traceback), bytes=stat.size, count=stat.count) \
+            for stat in snapshot.statistics('lineno')[:limit]]
+    )
+    if _LAST_SNAPSHOT is not None:
+        report['growth'] = [
+            dict(where=str(stat.traceback), bytes=stat.size_diff, count=stat.count_diff) \
+                for stat in snapshot.compare_to(_LAST_SNAPSHOT, 'lineno')[:limit]
+        ]
+    _LAST_SNAPSHOT = snapshot
+    return report
+
+def memory_report(node, limit=20):
+    '''Everything about memory: `tracemalloc_report()`,
+    `objects_by_type()`, `node_memory()` and the garbage collector.
+
+    Returns:
+
+    * `dict`.'''
+
+    return dict(
+        tracemalloc=tracemalloc_report(limit),
+        types=objects_by_type(limit),
+        node=node_memory(node),
+        gc=dict(counts=gc.get_count(), garbage=len(gc.garbage),
+                stats=gc.get_stats())
+    )
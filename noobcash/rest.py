@@ -3,10 +3,18 @@
 #import sys
 import time
 import json
-from flask import Flask, jsonify, request#, render_template
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, jsonify, request#, render_template
 
 from noobcash.node import Node
-from noobcash.helpers import pubk_to_key
+from noobcash.mining import MINE_SECONDS_HEADER, MINE_HASHES_HEADER
+from noobcash.ingest import IngestQueue
+from noobcash.assembly import BlockAssembler
+from noobcash.helpers import pubk_to_key, compress_chunks, COMPRESSIONS
+from noobcash.tracing import TRACER
+from noobcash.transport import HttpTransport
+from noobcash import wire, signatures, hashing, metrics, locks, profiling
 #from noobcash.transaction import Transaction
 #from flask_cors import CORS
 
@@ -15,13 +23,38 @@ app = Flask(__name__)
 #.......................................................................................
 
 
+def submit(executor: ThreadPoolExecutor, function, *args):
+    '''Run `function(*args)` in `executor` (`BROADCASTER` or
+    `CONSENSUS`), logging its exception if it raises one,
+    as no one waits for the result.'''
+
+    future = executor.submit(function, *args)
+    future.add_done_callback(log_failure)
+    return future
+
+def log_failure(future):
+    '''Log the exception of a finished task, if any.'''
+
+    exc = future.exception()
+    if exc is not None:
+        app.logger.error('Background task failed', exc_info=exc)
+
 @app.route('/node', methods=['POST'])
 def first_contact():
     '''Bootstrap: Respond to first contact.'''
     wallet_dict = json.loads(request.data)
-    first_contact_dict = NODE.register_node_to_ring(wallet_dict=wallet_dict)
+    try:
+        first_contact_dict = NODE.register_node_to_ring(wallet_dict=wallet_dict)
+    except ValueError as exc: # keys of another signature scheme
+        return jsonify(str(exc)), 400
     return jsonify(first_contact_dict), 200
 
+@app.route('/network', methods=['GET'])
+def get_network_params():
+    '''Bootstrap: Parameters of the network
+    needed before joining it.'''
+    return jsonify(NODE.network_params()), 200
+
 @app.route('/wallets', methods=['POST'])
 def get_wallets():
     '''Node:  Receive wallets from bootstrap.'''
@@ -31,40 +64,178 @@ def get_wallets():
 
 @app.route('/transaction', methods=['POST'])
 def receive_transaction():
-    '''Receive transaction.'''
+    '''Receive transaction. It is only decoded and queued
+    for validation, 429 is returned if the queue is full.
+    Duplicates are dropped before being decoded.'''
     global trxs_rec
 
+    trace = TRACER.from_headers(request.headers)
+    with TRACER.span('decode', trace):
+        _, transaction = wire.decode_unseen(request.data, request.content_type,
+                                            'transaction', NODE.seen_transactions)
+    if transaction is None:
+        return jsonify(None), 200
+
     trxs_rec += 1
-    transaction_dict = json.loads(request.data)
-    NODE.receive_transaction(transaction=transaction_dict)
+    metrics.TRANSACTIONS_RECEIVED.inc()
+    if not INGEST.put(transaction, trace):
+        return jsonify(None), 429
+    return jsonify(None), 200
+
+@app.route('/transactions', methods=['POST'])
+def receive_transactions():
+    '''Receive a batch of transactions. Like `/transaction`,
+    429 is returned if any of them did not fit in the queue.'''
+    global trxs_rec
+
+    trace = TRACER.from_headers(request.headers)
+    with TRACER.span('decode', trace):
+        transactions = wire.decode_unseen_transactions(request.data, request.content_type,
+                                                       NODE.seen_transactions)
+    trxs_rec += len(transactions)
+    metrics.TRANSACTIONS_RECEIVED.inc(len(transactions))
+    queued = [INGEST.put(tra, trace and trace.child(tra.transaction_id)) \
+        for tra in transactions]
+    if not all(queued):
+        return jsonify(None), 429
     return jsonify(None), 200
 
+@app.route('/ingest', methods=['GET'])
+def ingest_stats():
+    '''Get depth of transaction ingest queue and its counters.'''
+    return jsonify(INGEST.stats()), 200
+
 @app.route('/mined_block', methods=['POST'])
 def handle_miner():
-    '''Miner process sent a block.'''
+    '''Miner process sent a block, along with its metrics.'''
     global block_t0, block_tf
 
-    block_dict = json.loads(request.data)
+    if MINE_SECONDS_HEADER in request.headers:
+        NODE.record_mining(float(request.headers[MINE_SECONDS_HEADER]),
+                           int(request.headers[MINE_HASHES_HEADER]))
+    block_dict = wire.decode(request.data, request.content_type, wire.decode_block)
     block = NODE.check_my_mined_block(block_dict=block_dict)
     if block is not None:
         if block_t0 == 0:
             block_t0 = time.time()
         block_tf = time.time()
-        NODE.broadcast_block(block)
+        submit(BROADCASTER, NODE.broadcast_block, block)
     return jsonify(None), 200
 
 @app.route('/block', methods=['POST'])
 def receive_block():
-    '''Another node sent a block.'''
+    '''Another node sent a block. It is handled by the consensus
+    worker, as it may require fetching a whole blockchain.'''
+
+    trace = TRACER.from_headers(request.headers)
+    with TRACER.span('decode', trace):
+        _, block = wire.decode_unseen(request.data, request.content_type,
+                                      'block', NODE.seen_blocks)
+    if block is not None:
+        submit(CONSENSUS, process_block, block, trace, time.time())
+    return jsonify(None), 200
+
+def process_block(block_dict, trace=None, submitted=None):
+    '''Consensus worker: handle a block sent by another node.'''
     global block_t0, block_tf
 
-    block_dict = json.loads(request.data)
-    accepted = NODE.receive_block(block_dict=block_dict)
+    if trace is not None:
+        TRACER.record('queue', trace, submitted, time.time() - submitted)
+    with TRACER.context(trace):
+        accepted = NODE.receive_block(block_dict=block_dict)
     if accepted:
         if block_t0 == 0:
             block_t0 = time.time()
         block_tf = time.time()
-    return jsonify(None), 200
+
+@app.route('/seen', methods=['GET'])
+def seen_stats():
+    '''Get counters of the caches of seen transactions and blocks.'''
+    return jsonify(dict(
+        transactions=NODE.seen_transactions.stats(),
+        blocks=NODE.seen_blocks.stats()
+    )), 200
+
+@app.route('/mempool', methods=['GET'])
+def mempool_stats():
+    '''Get sizes of the transaction queues and their eviction counters.'''
+    return jsonify(dict(
+        transactions=NODE.transaction_queue.stats(),
+        unprocessed=NODE.unprocessed_transaction_queue.stats()
+    )), 200
+
+@app.route('/assembly', methods=['GET'])
+def assembly_stats():
+    '''Get counters of the block assembly scheduler, sizes
+    of mined blocks and confirmation latency percentiles.'''
+    return jsonify(ASSEMBLER.stats()), 200
+
+@app.route('/difficulty', methods=['GET'])
+def difficulty_stats():
+    '''Get retargeting parameters, difficulty of the next block
+    and difficulty and timestamp of the latest blocks.'''
+
+    chain = NODE.blockchain.chain
+    return jsonify(dict(
+        NODE.retarget.to_dict(),
+        next=NODE.retarget.expected(chain),
+        blocks=[dict(index=b.index, difficulty=b.difficulty, timestamp=b.timestamp) \
+            for b in chain[-2 * NODE.retarget.window:]]
+    )), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    '''Get metrics in the Prometheus text format.'''
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE), 200
+
+@app.route('/latency', methods=['GET'])
+def get_latency():
+    '''Get percentiles of confirmation latency and throughput over
+    sliding windows (or only the last `window` seconds, query
+    parameter), or the timestamps of transaction `txid` (query
+    parameter). With `local=1` only transactions created by this
+    node are counted, with `since` and `until` (`time.time()`)
+    only those created (or received) in between.'''
+
+    txid = request.args.get('txid')
+    if txid is not None:
+        return jsonify(NODE.latency.get(txid)), 200
+    window = request.args.get('window', type=float)
+    local = request.args.get('local', 0, type=int) != 0
+    return jsonify(NODE.latency.summary(windows=[window] if window else None, local=local,
+                                        since=request.args.get('since', type=float),
+                                        until=request.args.get('until', type=float))), 200
+
+@app.route('/locks', methods=['GET'])
+def get_locks():
+    '''Get wait and hold times of the locks of the node
+    by call site (most waited first) and their current holders.'''
+    return jsonify(locks.lock_stats()), 200
+
+@app.route('/profile/cpu', methods=['GET'])
+def profile_cpu():
+    '''Sample stacks of all threads for `seconds` (query parameter,
+    default 10) every `interval` seconds and return collapsed stacks
+    (for flamegraphs). Threads waiting for work are left out with
+    `idle=0`. 409 if another profile is running.'''
+
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = request.args.get('interval', profiling.DEFAULT_INTERVAL, type=float)
+    idle = request.args.get('idle', 1, type=int) != 0
+    stacks = profiling.sample_stacks(seconds, interval, idle)
+    if stacks is None:
+        return jsonify('A profile is already running'), 409
+    return Response(profiling.collapsed(stacks), mimetype='text/plain'), 200
+
+@app.route('/profile/memory', methods=['GET'])
+def profile_memory():
+    '''Get a `tracemalloc` snapshot (compared with the previous one,
+    the first request starts tracing), live objects by type and the
+    memory of the ring, the queues and the blockchain. `limit`
+    (query parameter, default 20) entries per list.'''
+
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify(profiling.memory_report(NODE, limit)), 200
 
 @app.route('/block_timer', methods=['GET'])
 def block_time():
@@ -79,7 +250,22 @@ def send_blockchain_length():
 
 @app.route('/blockchain', methods=['GET'])
 def send_blockchain():
-    '''Send blockchain.'''
+    '''Send blockchain, binary and/or streamed block by block
+    (optionally compressed) if requested.'''
+    content_type = request.accept_mimetypes.best_match([
+        wire.JSON_CONTENT_TYPE, wire.CONTENT_TYPE,
+        wire.STREAM_CONTENT_TYPE, wire.NDJSON_CONTENT_TYPE
+    ])
+    if content_type in (wire.STREAM_CONTENT_TYPE, wire.NDJSON_CONTENT_TYPE):
+        # snapshot of the list, blocks are never modified
+        blocks = list(NODE.blockchain.chain)
+        encoding = next((enc for enc in COMPRESSION if request.accept_encodings[enc]), None)
+        headers = {'Content-Encoding': encoding} if encoding is not None else {}
+        chunks = compress_chunks(wire.iter_encoded_blocks(blocks, content_type), encoding)
+        return Response(chunks, mimetype=content_type, headers=headers), 200
+    if content_type == wire.CONTENT_TYPE:
+        return Response(wire.encode_blockchain(NODE.blockchain),
+                        mimetype=wire.CONTENT_TYPE), 200
     blockchain_dict = NODE.blockchain.to_dict()
     return jsonify(blockchain_dict), 200
 
@@ -177,7 +363,7 @@ def create_transaction():
     amount = req_dict['amount']
     transaction = NODE.create_transaction(receiver_idx=receiver_idx, amount=amount)
     if transaction is not None:
-        NODE.broadcast_transaction(transaction)
+        submit(BROADCASTER, NODE.broadcast_transaction, transaction)
 
     return jsonify(transaction is not None), 200
 
@@ -195,10 +381,36 @@ def scripted_transaction():
         valid = False
         transaction = NODE.send_bogus_transaction(receiver_idx=receiver_idx, amount=amount)
 
-    try:
-        NODE.broadcast_transaction(transaction)
-    except:
-        pass
+    submit(BROADCASTER, NODE.broadcast_transaction, transaction)
+
+    return jsonify(valid), 200
+
+@app.route('/purchase_batch', methods=['POST'])
+def create_transactions():
+    '''Create a batch of transactions ordered from cli or
+    script, broadcasted with one request per node. Body:
+    {"purchases": [{"receiver_idx": ..., "amount": ...}, ...],
+    "black_hat": ...}, where `black_hat` sends a bogus transaction
+    for every failed purchase (like `/black_hat_purchase`).
+    Returns a list of whether each purchase was valid.'''
+
+    req_dict = json.loads(request.data)
+    orders = [(pur['receiver_idx'], pur['amount']) for pur in req_dict['purchases']]
+    transactions = NODE.create_transactions(orders)
+    valid = [tra is not None for tra in transactions]
+
+    if req_dict.get('black_hat', False):
+        # no bogus transaction to unknown receivers, the valid ones
+        # of the batch are already queued and must be broadcast
+        transactions = [
+            tra if tra is not None or receiver_idx not in NODE.ring else \
+                NODE.send_bogus_transaction(receiver_idx=receiver_idx, amount=amount)
+            for tra, (receiver_idx, amount) in zip(transactions, orders)
+        ]
+    transactions = [tra for tra in transactions if tra is not None]
+
+    if transactions:
+        submit(BROADCASTER, NODE.broadcast_transactions, transactions)
 
     return jsonify(valid), 200
 
@@ -220,6 +432,35 @@ def get_id():
     except AttributeError:
         return jsonify(0), 200
 
+def run_app(host: str, port: int, server: str, workers: int, timeout: int):
+    '''Serve `app`.
+
+    Arguments:
+
+    * `host`: interface to listen on.
+
+    * `port`: port to listen on.
+
+    * `server`: 'waitress' (multi-threaded production server)
+    or 'dev' (Flask's development server).
+
+    * `workers`: threads serving requests (waitress only).
+
+    * `timeout`: seconds after which idle connections are
+    closed (waitress only).'''
+
+    if server == 'waitress':
+        try:
+            import waitress
+        except ImportError:
+            print('waitress is not installed, falling back to Flask\'s server')
+        else:
+            waitress.serve(app, host=host, port=port, threads=workers,
+                           channel_timeout=timeout, connection_limit=max(100, 4 * workers))
+            return
+
+    app.run(host=host, port=port, threaded=True)
+
 # run it once for every node
 
 if __name__ == '__main__':
@@ -235,17 +476,70 @@ if __name__ == '__main__':
     PARSER.add_argument('-n', '--nodes', default=5, type=int, required=False,
                         help='number of nodes in the network')
     PARSER.add_argument('-d', '--difficulty', default=3, type=int, required=False,
-                        help='difficulty of mining')
+                        help='(initial) difficulty of mining (bootstrap only)')
+    PARSER.add_argument('-g', '--signature', default=signatures.DEFAULT_SCHEME,
+                        choices=signatures.SCHEMES, required=False,
+                        help='signature scheme of the network (bootstrap only)')
+    PARSER.add_argument('--hash', default=hashing.DEFAULT_HASH, choices=hashing.HASHES,
+                        required=False, help='hash function of the network (bootstrap only)')
+    PARSER.add_argument('-I', '--block_interval', default=0, type=float, required=False,
+                        help='target seconds per block to retarget difficulty, '
+                        '0 to keep it fixed (bootstrap only)')
+    PARSER.add_argument('--retarget_window', default=10, type=int, required=False,
+                        help='number of blocks between difficulty retargets (bootstrap only)')
     PARSER.add_argument('-a', '--bootstrap_address', default='', type=str, required=False,
                         help='Bootstrap\'s ip+port')
+    PARSER.add_argument('-w', '--wire_format', default='json', choices=['json', 'binary'],
+                        required=False, help='format of transactions and blocks sent to peers')
+    PARSER.add_argument('-z', '--compression', default=['zstd', 'gzip'], nargs='*',
+                        choices=['zstd', 'gzip'], required=False,
+                        help='encodings of streamed blockchains, in order of preference')
+    PARSER.add_argument('-S', '--server', default='waitress', choices=['waitress', 'dev'],
+                        required=False, help='HTTP server to serve the API with')
+    PARSER.add_argument('-W', '--workers', default=16, type=int, required=False,
+                        help='threads serving requests')
+    PARSER.add_argument('-T', '--timeout', default=120, type=int, required=False,
+                        help='seconds after which idle connections are closed')
+    PARSER.add_argument('--ingest_size', default=10000, type=int, required=False,
+                        help='maximum number of received transactions waiting for validation')
+    PARSER.add_argument('--ingest_batch', default=64, type=int, required=False,
+                        help='maximum number of received transactions validated at once')
+    PARSER.add_argument('--verifiers', default=4, type=int, required=False,
+                        help='threads verifying signatures of received transactions')
+    PARSER.add_argument('--seen_cache', default=100000, type=int, required=False,
+                        help='number of IDs of processed transactions/blocks remembered')
+    PARSER.add_argument('--mempool_size', default=100000, type=int, required=False,
+                        help='maximum number of queued transactions, 0 for no limit')
+    PARSER.add_argument('--mempool_bytes', default=0, type=int, required=False,
+                        help='maximum bytes of queued transactions, 0 for no limit')
+    PARSER.add_argument('--mempool_policy', default='oldest', choices=['oldest', 'priority'],
+                        required=False, help='which transactions to evict first when full')
+    PARSER.add_argument('-B', '--block_wait', default=10, type=float, required=False,
+                        help='seconds after which a partial block is mined, 0 to disable')
+    PARSER.add_argument('--trace_log', default=None, type=str, required=False,
+                        help='file to append spans of traced messages to '
+                        '(merge with python -m noobcash.tracing), default no tracing')
+    PARSER.add_argument('--tracemalloc', default=0, type=int, required=False,
+                        help='frames per allocation to trace from the start (see '
+                        '/profile/memory), default 0: from the first request, 1 frame')
+    PARSER.add_argument('--no_lock_profiling', action='store_true',
+                        help='do not record wait and hold times of locks (see /locks)')
+    PARSER.add_argument('--proxy', default=None, type=str, required=False,
+                        help='URL of an HTTP proxy for requests to other nodes '
+                        '(e.g. python -m benchmarks.faultproxy), default none')
 
     ARGS = PARSER.parse_args()
+    locks.PROFILING = not ARGS.no_lock_profiling
+    if ARGS.tracemalloc:
+        tracemalloc.start(ARGS.tracemalloc)
     PORT = ARGS.port
     IS_BOOTSTRAP = ARGS.bootstrap
     CAPACITY = ARGS.capacity
     N_NODES = ARGS.nodes
     DIFFICULTY = ARGS.difficulty
     BOOTSTRAP_ADDRESS = ARGS.bootstrap_address
+    WIRE_FORMAT = ARGS.wire_format
+    COMPRESSION = [enc for enc in ARGS.compression if enc in COMPRESSIONS]
 
     trxs_rec = 0 # record number of transactions to wait
                  # for all initial transactions to arrive
@@ -253,8 +547,29 @@ if __name__ == '__main__':
     block_t0 = 0 # time when initial block is accepted
     block_tf = 0 # time when last block is accepted
 
+    # slow operations are kept off the request-serving threads,
+    # single workers preserve the order of broadcasts and blocks
+    BROADCASTER = ThreadPoolExecutor(max_workers=1)
+    CONSENSUS = ThreadPoolExecutor(max_workers=1)
+
     # NOTE: init bootstrap before others
     NODE = Node(bootstrap_address=BOOTSTRAP_ADDRESS, capacity=CAPACITY, difficulty=DIFFICULTY,
-                port=PORT, nodes=N_NODES, is_bootstrap=IS_BOOTSTRAP)
+                port=PORT, nodes=N_NODES, is_bootstrap=IS_BOOTSTRAP, wire_format=WIRE_FORMAT,
+                seen_cache_size=ARGS.seen_cache, mempool_size=ARGS.mempool_size,
+                mempool_bytes=ARGS.mempool_bytes, mempool_policy=ARGS.mempool_policy,
+                block_interval=ARGS.block_interval, retarget_window=ARGS.retarget_window,
+                signature_scheme=ARGS.signature, hash_name=ARGS.hash,
+                transport=HttpTransport(proxy=ARGS.proxy, source=PORT))
+
+    if ARGS.trace_log is not None:
+        TRACER.configure(ARGS.trace_log, node=NODE.my_id)
+
+    INGEST = IngestQueue(NODE, maxsize=ARGS.ingest_size, batch_size=ARGS.ingest_batch,
+                         verifiers=ARGS.verifiers)
+    INGEST.start()
+
+    ASSEMBLER = BlockAssembler(NODE, max_wait=ARGS.block_wait)
+    ASSEMBLER.start()
 
-    app.run(host='0.0.0.0', port=PORT)
+    run_app(host='0.0.0.0', port=PORT, server=ARGS.server, workers=ARGS.workers,
+            timeout=ARGS.timeout)
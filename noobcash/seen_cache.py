@@ -0,0 +1,91 @@
+'''Bounded cache of IDs of messages (transactions, blocks) that
+have already been processed, so that duplicates (gossip, retries)
+can be dropped before doing any heavy work.'''
+
+import threading
+from collections import OrderedDict
+
+class SeenCache:
+    '''Bounded cache of IDs of messages (transactions, blocks) that
+    have already been processed, so that duplicates (gossip, retries)
+    can be dropped before doing any heavy work. Least recently
+    seen IDs are evicted first.'''
+
+    def __init__(self, maxsize=100000):
+        '''Initialize `SeenCache` object.
+
+        Arguments:
+
+        * `maxsize`: maximum number of IDs kept.'''
+
+        self.maxsize = maxsize
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0 # duplicates dropped
+        self.misses = 0
+        self.evictions = 0
+        self.saved_bytes = 0 # size of payloads of duplicates
+
+    def check(self, key, size=0):
+        '''Check if `key` has been seen and count the lookup.
+
+        Arguments:
+
+        * `key`: ID of message.
+
+        * `size`: size of the payload, counted as saved if seen.
+
+        Returns:
+
+        * `True` if seen.'''
+
+        with self.lock:
+            if key in self.ids:
+                self.ids.move_to_end(key)
+                self.hits += 1
+                self.saved_bytes += size
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        '''Mark `key` as seen. NOTE: only mark messages whose
+        authenticity has been verified, otherwise forged messages
+        could shadow legit ones.
+
+        Arguments:
+
+        * `key`: ID of message.'''
+
+        with self.lock:
+            self.ids[key] = None
+            self.ids.move_to_end(key)
+            while len(self.ids) > self.maxsize:
+                self.ids.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        '''Check if `key` has been seen, without counting.'''
+        return key in self.ids
+
+    def __len__(self):
+        '''Return number of IDs kept.'''
+        return len(self.ids)
+
+    def stats(self):
+        '''Get counters of the cache.
+
+        Returns:
+
+        * `dict` of counters.'''
+
+        with self.lock:
+            return dict(
+                size=len(self.ids),
+                maxsize=self.maxsize,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                saved_bytes=self.saved_bytes
+            )
@@ -0,0 +1,152 @@
+'''Signature schemes of transactions. The scheme of a network is
+chosen by the bootstrap, 'rsa' (RSA-2048, PKCS#1 v1.5), 'ecdsa'
+(NIST P-256) or 'ed25519', and every node generates its keys with it.
+Signing and verifying dispatch on the type of the key, so a public
+key carries its scheme along.'''
+
+from Crypto.PublicKey import RSA, ECC
+from Crypto.Hash import SHA256
+from Crypto.Signature import pkcs1_15, DSS, eddsa
+
+SCHEMES = ('rsa', 'ecdsa', 'ed25519')
+DEFAULT_SCHEME = 'rsa'
+
+RSA_BITS = 2048
+
+# `ECC` curve of every elliptic curve scheme
+_CURVES = dict(ecdsa='p256', ed25519='ed25519')
+# `EccKey.curve` -> scheme
+_CURVE_SCHEMES = {'NIST P-256': 'ecdsa', 'Ed25519': 'ed25519'}
+
+def generate_key(scheme: str):
+    '''Generate a private key.
+
+    Arguments:
+
+    * `scheme`: one of `SCHEMES`.
+
+    Returns:
+
+    * `RsaKey` or `EccKey`.'''
+
+    if scheme == 'rsa':
+        return RSA.generate(RSA_BITS)
+    return ECC.generate(curve=_CURVES[scheme])
+
+def key_scheme(key):
+    '''Get the scheme of (public or private) `key`.
+
+    Returns:
+
+    * One of `SCHEMES`, `None` if `key` is not a key.'''
+
+    if isinstance(key, RSA.RsaKey):
+        return 'rsa'
+    if isinstance(key, ECC.EccKey):
+        return _CURVE_SCHEMES.get(key.curve)
+    return None
+
+def public_key(private_key):
+    '''Get the public key of `private_key`.'''
+    return private_key.public_key()
+
+def sign(private_key, hash_obj):
+    '''Sign a hash.
+
+    Arguments:
+
+    * `private_key`: key from `generate_key()`.
+
+    * `hash_obj`: hash object (e.g. `SHA.new()`) of the message.
+
+    Returns:
+
+    * `bytes` signature.'''
+
+    scheme = key_scheme(private_key)
+    if scheme == 'rsa':
+        return pkcs1_15.new(private_key).sign(hash_obj)
+    if scheme == 'ecdsa':
+        # FIPS 186-3 requires a hash at least as strong as the curve
+        return DSS.new(private_key, 'fips-186-3').sign(SHA256.new(hash_obj.digest()))
+    return eddsa.new(private_key, 'rfc8032').sign(hash_obj.digest())
+
+def verify(pubk, hash_obj, signature: bytes):
+    '''Verify a signature of a hash (see `sign()`).
+
+    Arguments:
+
+    * `pubk`: public key of the signer.
+
+    * `hash_obj`: hash object of the message.
+
+    * `signature`: `bytes` signature.
+
+    Returns:
+
+    * `True` if the signature is valid.'''
+
+    scheme = key_scheme(pubk)
+    try:
+        if scheme == 'rsa':
+            pkcs1_15.new(pubk).verify(hash_obj, signature)
+        elif scheme == 'ecdsa':
+            DSS.new(pubk, 'fips-186-3').verify(SHA256.new(hash_obj.digest()), signature)
+        elif scheme == 'ed25519':
+            eddsa.new(pubk, 'rfc8032').verify(hash_obj.digest(), signature)
+        else:
+            return False
+    except (TypeError, ValueError): # ValueError if not authentic
+        return False
+    return True
+
+def public_key_to_dict(pubk):
+    '''Transform public key to a dictionary so it can be
+    recovered afterwards.
+
+    Arguments:
+
+    * `pubk`: public key.
+
+    Returns:
+
+    * `dict` with keys ['n', 'e'] (RSA) or ['curve', 'x', 'y'].'''
+
+    if isinstance(pubk, RSA.RsaKey):
+        return dict(n=pubk.n, e=pubk.e)
+    x, y = pubk.pointQ.xy
+    return dict(curve=_CURVES[key_scheme(pubk)], x=int(x), y=int(y))
+
+def public_key_from_dict(pubk_dict: dict):
+    '''Retrieve public key from `dict` of `public_key_to_dict()`.
+
+    Returns:
+
+    * Public key.'''
+
+    if 'curve' in pubk_dict:
+        return ECC.construct(curve=pubk_dict['curve'],
+                             point_x=pubk_dict['x'], point_y=pubk_dict['y'])
+    return RSA.construct((pubk_dict['n'], pubk_dict['e']))
+
+def public_key_id(pubk):
+    '''Get hashable info from public key.
+
+    Returns:
+
+    * `tuple` of (`n`, `e`) (RSA) or (curve, `x`, `y`).'''
+
+    if isinstance(pubk, RSA.RsaKey):
+        return (pubk.n, pubk.e)
+    x, y = pubk.pointQ.xy
+    return (_CURVES[key_scheme(pubk)], int(x), int(y))
+
+def copy_key(key):
+    '''Copy (public or private) `key`.'''
+
+    if isinstance(key, RSA.RsaKey):
+        if key.has_private():
+            return RSA.RsaKey(n=key.n, e=key.e, d=key.d, p=key.p, q=key.q, u=key.u)
+        return RSA.RsaKey(n=key.n, e=key.e)
+    # EccKeys are never modified
+    return key
@@ -0,0 +1,610 @@
+'''Discrete-event simulator of a `noobcash` network in one process.
+N `SimNode`s (real `Node`s: same validation, queues and consensus)
+are joined by an in-memory transport (`SimTransport`) whose links
+(`LinkModel`) have a latency, jitter and bandwidth, and everything
+happens in the virtual time of a `VirtualClock`. Mining takes virtual
+time (exponentially distributed for the hash rate and difficulty)
+instead of CPU time, so that runs are deterministic for a seed and
+take seconds, unless `real_pow` is set. The CPU time of handling
+messages can be charged to the nodes (`cpu_scale`), at the cost of
+determinism.
+
+The workloads of `transactions/` (or random ones for other numbers of
+nodes) are replayed like `cli.py` does, and throughput, block time
+and latency are reported. Every combination of the swept parameters
+runs in a fresh process, as keys, hashing and metrics are global:
+
+python -m noobcash.simulator [-n NODES ...] [-c CAPACITY ...] [-d DIFFICULTY ...]
+                             [--latency LATENCY] [--bandwidth BANDWIDTH] [--hash_rate HASH_RATE]
+                             [-P PROCESSES] [-o OUTPUT] ...'''
+
+import os
+import json
+import time
+import heapq
+import random
+import itertools
+import multiprocessing
+from argparse import ArgumentParser
+
+import numpy as np
+
+from noobcash import wire, signatures, hashing
+from noobcash.block import Block
+from noobcash.node import Node
+from noobcash.locks import TRANSACTION_LOCK
+
+# ports of the nodes (their addresses are the host's ip and these)
+BASE_PORT = 5000
+# transactions per node of random workloads
+SYNTHETIC_TRANSACTIONS = 100
+
+class VirtualClock:
+    '''Queue of events in virtual time.'''
+
+    def __init__(self):
+        '''Initialize `VirtualClock` object.'''
+
+        self.now = 0.0
+        self.events = 0 # processed
+        self._queue = []
+        self._seq = itertools.count() # keeps events of the same time in order
+
+    def schedule(self, at: float, callback, *args):
+        '''Call `callback(*args)` at virtual time `at`.
+
+        Returns:
+
+        * Event, can be passed to `cancel()`.'''
+
+        event = [max(at, self.now), next(self._seq), callback, args, False]
+        heapq.heappush(self._queue, event)
+        return event
+
+    @staticmethod
+    def cancel(event):
+        '''Cancel `event` (if it has not happened).'''
+        event[4] = True
+
+    def run(self, until=float('inf')):
+        '''Process events in order until there are no more
+        or the next one is after `until`.'''
+
+        while self._queue and self._queue[0][0] <= until:
+            at, _, callback, args, cancelled = heapq.heappop(self._queue)
+            if cancelled:
+                continue
+            self.now = at
+            self.events += 1
+            callback(*args)
+
+class LinkModel:
+    '''Links between every pair of nodes, each with a `latency` (plus
+    uniform `jitter`) and a `bandwidth`. Messages of a link are
+    serialized and delivered in order, like over a TCP connection.'''
+
+    def __init__(self, latency=0.01, jitter=0.0, bandwidth=12.5e6, seed=0):
+        '''Initialize `LinkModel` object.
+
+        Arguments:
+
+        * `latency`: one-way seconds.
+
+        * `jitter`: maximum extra seconds of latency.
+
+        * `bandwidth`: bytes per second, 0 for infinite.
+
+        * `seed`: of the jitter.'''
+
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.rng = random.Random(seed)
+        self._free_at = {} # (src, dst) -> when the link can send again
+        self._last_arrival = {} # (src, dst) -> arrival of the last message
+
+    def transfer_time(self, size: int):
+        '''Seconds to send `size` bytes.'''
+        return size / self.bandwidth if self.bandwidth > 0 else 0.0
+
+    def delivery(self, src: str, dst: str, depart: float, size: int):
+        '''Get when a message of `size` bytes sent at `depart` arrives.'''
+
+        link = (src, dst)
+        start = max(depart, self._free_at.get(link, 0.0))
+        self._free_at[link] = start + self.transfer_time(size)
+        arrival = self._free_at[link] + self.latency + self.rng.uniform(0, self.jitter)
+        arrival = max(arrival, self._last_arrival.get(link, 0.0))
+        self._last_arrival[link] = arrival
+        return arrival
+
+    def round_trip(self, size: int):
+        '''Seconds of a request with a response of `size` bytes.'''
+        return 2 * self.latency + self.transfer_time(size)
+
+class SimTransport:
+    '''In-memory transport (see `noobcash.transport`) of a `SimNode`.
+    Messages are delivered as events of the clock, requests waiting
+    for a response (blockchain length, blockchain) are answered
+    right away and their duration is charged to the requesting node.'''
+
+    def __init__(self, network):
+        '''Initialize `SimTransport` object.
+
+        Arguments:
+
+        * `network`: the `SimNetwork`.'''
+
+        self.network = network
+        self.address = None # set once the node has its wallet
+
+    @staticmethod
+    def map(function, items: list):
+        '''Call `function` for every one of `items` (sequentially).'''
+        return [function(item) for item in items]
+
+    def network_params(self, bootstrap_address: str):
+        '''See `HttpTransport.network_params()`.'''
+        return self.network.nodes_by_address[bootstrap_address].network_params()
+
+    def join(self, bootstrap_address: str, wallet_dict: dict):
+        '''See `HttpTransport.join()` (before the clock starts).'''
+
+        bootstrap = self.network.nodes_by_address[bootstrap_address]
+        response = bootstrap.register_node_to_ring(json.loads(json.dumps(wallet_dict)))
+        return json.loads(json.dumps(response))
+
+    def send(self, address: str, path: str, payload: tuple, _headers=None):
+        '''See `HttpTransport.send()`. Headers are dropped, messages are
+        not traced as all nodes share the process (and its `TRACER`).'''
+        return self.network.send(self.address, address, path, payload)
+
+    def send_dict(self, address: str, path: str, dct: dict):
+        '''See `HttpTransport.send_dict()`.'''
+        payload = (json.dumps(dct).encode('utf-8'), wire.JSON_CONTENT_TYPE)
+        return self.network.send(self.address, address, path, payload)
+
+    def blockchain_length(self, address: str):
+        '''See `HttpTransport.blockchain_length()`.'''
+
+        self.network.stall(self.network.link.round_trip(0))
+        return len(self.network.nodes_by_address[address].blockchain)
+
+    def stream_blockchain(self, address: str, wire_format: str):
+        '''See `HttpTransport.stream_blockchain()`, the blockchain
+        is encoded and decoded so that nodes share no objects.'''
+
+        self.network.resolves += 1
+        content_type = wire.STREAM_CONTENT_TYPE if wire_format == 'binary' \
+            else wire.NDJSON_CONTENT_TYPE
+        chain = list(self.network.nodes_by_address[address].blockchain.chain)
+        chunks = list(wire.iter_encoded_blocks(chain, content_type))
+        size = sum(len(chunk) for chunk in chunks)
+        self.network.bytes_sent += size
+        self.network.stall(self.network.link.round_trip(size))
+        yield from wire.iter_decoded_blocks(chunks, content_type)
+
+class SimNode(Node):
+    '''`Node` of a `SimNetwork`. Messages are handled like `rest.py`
+    does (without the ingest queue) and its miner is an event.'''
+
+    def __init__(self, network, index: int, **kwargs):
+        '''Initialize `SimNode` object.
+
+        Arguments:
+
+        * `network`: the `SimNetwork`.
+
+        * `index`: order of creation (the bootstrap is 0).
+
+        * `kwargs`: of `Node`.'''
+
+        self.network = network
+        # virtual time until which the node is handling an event
+        self.busy_until = 0.0
+        self.flush_event = None
+        transport = SimTransport(network)
+        super().__init__(port=BASE_PORT + index, transport=transport, **kwargs)
+        transport.address = self.my_wallet().address
+
+    def start_miner(self, transactions: list):
+        '''Mine the block now (in no time, unless `real_pow`) and
+        schedule it to be found after the mining time.'''
+
+        block = Block(self.blockchain)
+        block.add_transactions(transactions)
+        hashes = block.mine(self.retarget.expected(self.blockchain.chain))
+        if self.network.real_pow:
+            seconds = hashes / self.network.hash_rate
+        else:
+            seconds = self.network.rng.expovariate(
+                self.network.hash_rate / 2 ** self.network.difficulty)
+        return self.network.clock.schedule(self.network.local_time() + seconds,
+                                           self.network.handle, self, self.on_mined, block)
+
+    def stop_miner(self, pid):
+        '''Cancel the event of the miner.'''
+        self.network.clock.cancel(pid)
+
+    def reap_miner(self, pid):
+        '''Nothing to reap, the miner is an event.'''
+
+    def on_mined(self, block: Block):
+        '''Our miner found `block` (see `/mined_block`).'''
+
+        block = self.check_my_mined_block(block)
+        if block is not None:
+            self.network.mined_at[block.hash] = self.network.clock.now
+            self.broadcast_block(block)
+
+    def on_message(self, path: str, payload: tuple):
+        '''Another node sent `payload` to `path`.'''
+
+        data, content_type = payload
+        if path == 'transaction':
+            _, transaction = wire.decode_unseen(data, content_type, 'transaction',
+                                                self.seen_transactions)
+            if transaction is not None:
+                try:
+                    self.receive_transaction(transaction)
+                except KeyError: # unknown sender or receiver
+                    pass
+        elif path == 'transactions':
+            transactions = wire.decode_unseen_transactions(data, content_type,
+                                                           self.seen_transactions)
+            self.receive_transactions(transactions,
+                                      [self.verify_signature(tra) for tra in transactions])
+        elif path == 'block':
+            _, block = wire.decode_unseen(data, content_type, 'block', self.seen_blocks)
+            if block is not None:
+                self.receive_block(block)
+        elif path == 'wallets':
+            self.receive_wallets(json.loads(data))
+
+    def on_flush(self):
+        '''Mine a partial block if transactions are waiting
+        (see `BlockAssembler`).'''
+
+        self.flush_event = None
+        with TRANSACTION_LOCK.shared:
+            self.mine_block(partial=True)
+
+    def after_event(self):
+        '''Make sure waiting transactions are mined
+        within `block_wait` seconds.'''
+
+        if self.network.block_wait > 0 and self.flush_event is None and \
+            len(self.transaction_queue) > 0:
+            self.flush_event = self.network.clock.schedule(
+                self.network.clock.now + self.network.block_wait,
+                self.network.handle, self, self.on_flush)
+
+    def issue(self, rows: list, start: int):
+        '''Replay the workload from `rows[start]`, in batches
+        of `batch_size` (see `cli.py`).'''
+
+        batch = rows[start:start + self.network.batch_size]
+        if self.network.batch_size == 1:
+            transactions = [self.create_transaction(*batch[0])]
+        else:
+            transactions = self.create_transactions(batch)
+        transactions = [tra for tra in transactions if tra is not None]
+        for tra in transactions:
+            self.network.created_at[tra.transaction_id] = self.network.clock.now
+        if len(transactions) == 1:
+            self.broadcast_transaction(transactions[0])
+        elif transactions:
+            self.broadcast_transactions(transactions)
+        self.network.issued += len(batch)
+        self.network.rejected += len(batch) - len(transactions)
+
+        if start + len(batch) < len(rows):
+            interval = len(batch) / self.network.rate if self.network.rate > 0 else 0
+            self.network.clock.schedule(self.network.local_time() + interval,
+                                        self.network.handle, self, self.issue,
+                                        rows, start + len(batch))
+
+class SimNetwork:
+    '''Nodes of a simulated network, their links and clock.'''
+
+    def __init__(self, nodes=5, capacity=10, difficulty=4, link=None, hash_rate=1e6,
+                 real_pow=False, cpu_scale=0.0, block_wait=10.0, batch_size=20, rate=0.0,
+                 wire_format='json', signature_scheme=signatures.DEFAULT_SCHEME,
+                 hash_name=hashing.DEFAULT_HASH, seed=0):
+        '''Initialize `SimNetwork` object and its nodes, which join
+        the network (outside of virtual time).
+
+        Arguments:
+
+        * `nodes`, `capacity`, `difficulty`, `wire_format`, `signature_scheme`,
+        `hash_name`: see `Node`.
+
+        * `link`: `LinkModel`. Default: `None`, `LinkModel()`.
+
+        * `hash_rate`: hashes per second of every miner.
+
+        * `real_pow`: whether blocks are really mined with `difficulty`
+        (mining time is then hashes tried / `hash_rate`), else they are
+        mined with difficulty 0 and mining time is random.
+
+        * `cpu_scale`: factor of the CPU time of handling an event
+        charged to the node in virtual time, 0 to ignore CPU time.
+
+        * `block_wait`: seconds after which a partial block is mined.
+
+        * `batch_size`: transactions created and sent together.
+
+        * `rate`: transactions per second issued by each node,
+        0 for as fast as they are created.
+
+        * `seed`: of the randomness of the simulation.'''
+
+        random.seed(seed)
+        np.random.seed(seed)
+        self.rng = random.Random(seed)
+        self.clock = VirtualClock()
+        self.link = link if link is not None else LinkModel(seed=seed)
+        self.difficulty = difficulty
+        self.hash_rate = hash_rate
+        self.real_pow = real_pow
+        self.cpu_scale = cpu_scale
+        self.block_wait = block_wait
+        self.batch_size = batch_size
+        self.rate = rate
+
+        self.current = None # node handling an event
+        self._t_0 = 0.0
+        self._stall = 0.0
+
+        self.messages = 0
+        self.bytes_sent = 0
+        self.resolves = 0
+        self.issued = 0
+        self.rejected = 0
+        self.created_at = {} # transaction ID -> virtual time
+        self.mined_at = {} # block hash -> virtual time
+
+        self.nodes = []
+        self.nodes_by_address = {}
+        for index in range(nodes):
+            bootstrap_address = self.nodes[0].my_wallet().address if index else ''
+            node = SimNode(self, index, bootstrap_address=bootstrap_address,
+                           capacity=capacity, difficulty=difficulty if real_pow else 0,
+                           nodes=nodes, is_bootstrap=index == 0, wire_format=wire_format,
+                           signature_scheme=signature_scheme, hash_name=hash_name)
+            self.nodes.append(node)
+            self.nodes_by_address[node.my_wallet().address] = node
+
+    def local_time(self):
+        '''Virtual time of the node handling an event, which
+        has been busy since the event began.'''
+
+        if self.current is None:
+            return self.clock.now
+        return self.clock.now + self._stall + \
+            (time.perf_counter() - self._t_0) * self.cpu_scale
+
+    def stall(self, seconds: float):
+        '''The node handling an event waited for `seconds`.'''
+        self._stall += seconds
+
+    def handle(self, node: SimNode, function, *args):
+        '''Call `function(*args)` as an event of `node`,
+        later if `node` is still busy.'''
+
+        if node.busy_until > self.clock.now:
+            self.clock.schedule(node.busy_until, self.handle, node, function, *args)
+            return
+
+        self.current, self._t_0, self._stall = node, time.perf_counter(), 0.0
+        try:
+            function(*args)
+        finally:
+            node.busy_until = self.local_time()
+            self.current = None
+        node.after_event()
+
+    def send(self, src: str, dst: str, path: str, payload: tuple):
+        '''Deliver `payload` to `path` of node `dst` over the link.
+
+        Returns:
+
+        * `True`.'''
+
+        size = len(payload[0])
+        self.messages += 1
+        self.bytes_sent += size
+        node = self.nodes_by_address[dst]
+        arrival = self.link.delivery(src, dst, self.local_time(), size)
+        self.clock.schedule(arrival, self.handle, node, node.on_message, path, payload)
+        return True
+
+    def setup(self):
+        '''Broadcast the wallets and the initial transactions (see
+        `/ring`) and run until they have been handled.'''
+
+        bootstrap = self.nodes[0]
+
+        def start():
+            bootstrap.broadcast_wallets()
+            for tra in bootstrap.create_initial_transactions():
+                bootstrap.broadcast_transaction(tra)
+
+        self.clock.schedule(0.0, self.handle, bootstrap, start)
+        self.clock.run()
+
+    def replay(self, scripts: list, until=float('inf')):
+        '''Replay a workload and run until it has been handled.
+
+        Arguments:
+
+        * `scripts`: for every node, `list` of (receiver index, amount).
+
+        * `until`: virtual seconds after which to stop anyway.
+
+        Returns:
+
+        * `dict` of results (see `results()`).'''
+
+        start = self.clock.now
+        for node, rows in zip(self.nodes, scripts):
+            if rows:
+                self.clock.schedule(start, self.handle, node, node.issue, rows, 0)
+        wall = time.perf_counter()
+        self.clock.run(start + until)
+        return self.results(start, time.perf_counter() - wall)
+
+    def results(self, start: float, wall_seconds: float):
+        '''Throughput, block time and confirmation latency of the
+        workload that started at `start`, from the blockchain
+        of the bootstrap.
+
+        Returns:
+
+        * `dict`.'''
+
+        chain = self.nodes[0].blockchain.chain
+        blocks = [block for block in chain[1:] if self.mined_at.get(block.hash, -1) >= start]
+        confirmed = [(tra.transaction_id, self.mined_at[block.hash]) for block in blocks \
+            for tra in block.list_of_transactions if tra.transaction_id in self.created_at]
+        latencies = [at - self.created_at[tid] for tid, at in confirmed]
+        end = max((at for _, at in confirmed), default=start)
+        times = [start] + [self.mined_at[block.hash] for block in blocks]
+
+        return dict(
+            nodes=len(self.nodes),
+            issued=self.issued,
+            rejected=self.rejected,
+            confirmed=len(confirmed),
+            blocks=len(blocks),
+            duration=end - start,
+            throughput=len(confirmed) / (end - start) if end > start else 0.0,
+            block_time=float(np.mean(np.diff(times))) if blocks else None,
+            latency_p50=float(np.percentile(latencies, 50)) if latencies else None,
+            latency_p95=float(np.percentile(latencies, 95)) if latencies else None,
+            stale_blocks=len(self.mined_at) - sum(block.hash in self.mined_at for block in chain),
+            resolves=self.resolves,
+            agree=len({node.blockchain.get_block_hash(-1) for node in self.nodes}) == 1,
+            messages=self.messages,
+            bytes=self.bytes_sent,
+            events=self.clock.events,
+            wall_seconds=wall_seconds
+        )
+
+def load_scripts(directory: str, nodes: int, seed=0):
+    '''Load the workload of `nodes` nodes (see `cli.py`), or create
+    a random one if `directory` has none for `nodes`.
+
+    Returns:
+
+    * `list` for every node of `list` of (receiver index, amount).'''
+
+    scripts = []
+    rng = random.Random(seed)
+    for index in range(nodes):
+        path = os.path.join(directory, f'{nodes}nodes', f'transactions{index}.txt')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as script:
+                rows = [line.split() for line in script if line.strip()]
+            scripts.append([(int(idx[2:]), int(amount)) for idx, amount in rows])
+        else:
+            scripts.append([(rng.choice([i for i in range(nodes) if i != index]),
+                             rng.randint(1, 10)) for _ in range(SYNTHETIC_TRANSACTIONS)])
+    return scripts
+
+def simulate(params: dict):
+    '''Set up a network and replay its workload.
+
+    Arguments:
+
+    * `params`: `dict` with 'script', 'until' and the arguments
+    of `SimNetwork` (those of `LinkModel` too).
+
+    Returns:
+
+    * `dict` of `params` and results.'''
+
+    params = dict(params)
+    script, until = params.pop('script'), params.pop('until')
+    link = LinkModel(params.pop('latency'), params.pop('jitter'),
+                     params.pop('bandwidth'), params['seed'])
+    network = SimNetwork(link=link, **params)
+    network.setup()
+    results = network.replay(load_scripts(script, params['nodes'], params['seed']), until)
+    return dict(params, latency=link.latency, jitter=link.jitter,
+                bandwidth=link.bandwidth, **results)
+
+def main():
+    '''Sweep the parameters of the network.'''
+
+    parser = ArgumentParser(description='Simulate a noobcash network replaying a workload.')
+    parser.add_argument('-n', '--nodes', default=[5], type=int, nargs='+',
+                        help='numbers of nodes')
+    parser.add_argument('-c', '--capacity', default=[10], type=int, nargs='+',
+                        help='numbers of transactions in a block')
+    parser.add_argument('-d', '--difficulty', default=[4], type=int, nargs='+',
+                        help='difficulties of mining (bits)')
+    parser.add_argument('-s', '--script', default='transactions', type=str,
+                        help='directory of workloads (random ones if missing)')
+    parser.add_argument('--latency', default=0.01, type=float, help='one-way seconds of links')
+    parser.add_argument('--jitter', default=0.0, type=float, help='extra random seconds of links')
+    parser.add_argument('--bandwidth', default=12.5e6, type=float,
+                        help='bytes per second of links, 0 for infinite')
+    parser.add_argument('--hash_rate', default=1e6, type=float, help='hashes per second of miners')
+    parser.add_argument('--real_pow', action='store_true',
+                        help='really mine blocks (slower, mining time from hashes tried)')
+    parser.add_argument('--cpu_scale', default=0.0, type=float,
+                        help='charge this times the CPU time of events to nodes '
+                        '(non-deterministic), default 0')
+    parser.add_argument('-B', '--block_wait', default=10, type=float,
+                        help='seconds after which a partial block is mined, 0 to disable')
+    parser.add_argument('-k', '--batch_size', default=20, type=int,
+                        help='transactions of the workload sent per message')
+    parser.add_argument('-r', '--rate', default=0, type=float,
+                        help='transactions per second per node, 0 for no limit')
+    parser.add_argument('-w', '--wire_format', default='json', choices=['json', 'binary'])
+    parser.add_argument('-g', '--signature', default=signatures.DEFAULT_SCHEME,
+                        choices=signatures.SCHEMES)
+    parser.add_argument('--hash', default=hashing.DEFAULT_HASH, choices=hashing.HASHES)
+    parser.add_argument('--until', default=3600, type=float,
+                        help='virtual seconds after which a run is stopped')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('-P', '--processes', default=1, type=int,
+                        help='runs in parallel (each in its own process)')
+    parser.add_argument('-o', '--output', default=None, type=str,
+                        help='write results to this .json or .csv file')
+    args = parser.parse_args()
+
+    common = dict(script=args.script, until=args.until, latency=args.latency,
+                  jitter=args.jitter, bandwidth=args.bandwidth, hash_rate=args.hash_rate,
+                  real_pow=args.real_pow, cpu_scale=args.cpu_scale,
+                  block_wait=args.block_wait, batch_size=args.batch_size, rate=args.rate,
+                  wire_format=args.wire_format, signature_scheme=args.signature,
+                  hash_name=args.hash, seed=args.seed)
+    runs = [dict(common, nodes=nodes, capacity=capacity, difficulty=difficulty) \
+        for nodes, capacity, difficulty in \
+            itertools.product(args.nodes, args.capacity, args.difficulty)]
+
+    columns = ['nodes', 'capacity', 'difficulty', 'rejected', 'confirmed', 'blocks', 'throughput',
+               'block_time', 'latency_p50', 'latency_p95', 'stale_blocks', 'resolves',
+               'agree', 'wall_seconds']
+    print(''.join(f'{column:>13}' for column in columns))
+    results = []
+    # a fresh process per run, as keys and hashing are global
+    with multiprocessing.get_context('fork').Pool(args.processes, maxtasksperchild=1) as pool:
+        for result in pool.imap(simulate, runs):
+            results.append(result)
+            print(''.join(f'{result[column]:>13.3f}' if isinstance(result[column], float) \
+                else f'{str(result[column]):>13}' for column in columns), flush=True)
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8', newline='') as output:
+            if args.output.endswith('.csv'):
+                output.write(','.join(results[0]) + '\n')
+                for result in results:
+                    output.write(','.join(str(value) for value in result.values()) + '\n')
+            else:
+                json.dump(results, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''Bounded samples of measurements (e.g. latencies)
+summarized by percentiles.'''
+
+import threading
+from collections import deque
+
+import numpy as np
+
+# percentiles reported by `Sample.summary()` (and `LatencyTracker`)
+PERCENTILES = (50, 90, 95, 99)
+
+def percentiles(values, pcts=PERCENTILES):
+    '''Get percentiles `pcts` (in [0, 100]) of `values`.
+
+    Returns:
+
+    * `dict` like {'p50': ...} (values are `None` if empty).'''
+
+    if len(values) == 0:
+        return {f'p{p}': None for p in pcts}
+    return {f'p{p}': float(v) for p, v in zip(pcts, np.percentile(values, pcts))}
+
+class Sample:
+    '''Keeps the latest `maxlen` values of a measurement,
+    along with totals over all of them.'''
+
+    def __init__(self, maxlen=10000):
+        '''Initialize `Sample` object.
+
+        Arguments:
+
+        * `maxlen`: number of (latest) values kept for percentiles.'''
+
+        self.values = deque(maxlen=maxlen)
+        self.count = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        '''Record `value`.'''
+
+        with self._lock:
+            self.values.append(value)
+            self.count += 1
+            self.total += value
+
+    def extend(self, values):
+        '''Record every value in `values`.'''
+
+        values = list(values)
+        with self._lock:
+            self.values.extend(values)
+            self.count += len(values)
+            self.total += sum(values)
+
+    def percentiles(self, pcts=PERCENTILES):
+        '''Get percentiles of the kept values.
+
+        Arguments:
+
+        * `pcts`: iterable of percentiles in [0, 100].
+
+        Returns:
+
+        * `dict` like {'p50': ...} (values are `None` if empty).'''
+
+        with self._lock:
+            values = np.array(self.values)
+        return percentiles(values, pcts)
+
+    def summary(self):
+        '''Get count and mean of all values and
+        percentiles of the kept ones.
+
+        Returns:
+
+        * `dict`.'''
+
+        with self._lock:
+            count, total = self.count, self.total
+        summary = dict(count=count, mean=total / count if count else None)
+        summary.update(self.percentiles())
+        return summary
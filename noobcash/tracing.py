@@ -0,0 +1,370 @@
+'''Tracing of the propagation of transactions and blocks across the
+network. The node that broadcasts a message starts a `TraceContext`
+(origin node, message ID and hops, i.e. the nodes it went through and
+when they sent it) and sends it in the `TRACE_HEADER` along with the
+message. Every node writes spans (decode, queue, lock, verify,
+validate, apply, send, ...) of the messages it handles as JSON lines
+to its local trace log. The logs of all the nodes are merged offline
+into per-message timelines with:
+
+python -m noobcash.tracing [-m MESSAGE] [-s] [-j] LOG [LOG ...]
+
+Timestamps are wall-clock, so merged timelines across hosts are only
+as accurate as their clocks are synchronized. Tracing is disabled
+(and free) unless `configure()` is given a log.'''
+
+import sys
+import json
+import time
+import uuid
+import threading
+from argparse import ArgumentParser
+from collections import defaultdict
+
+import numpy as np
+
+TRACE_HEADER = 'X-Noobcash-Trace'
+
+class TraceContext:
+    '''Trace of a message as it propagates.'''
+
+    __slots__ = ('origin', 'kind', 'message', 'hops', 'item')
+
+    def __init__(self, origin, kind: str, message: str, hops=None, item=None):
+        '''Initialize `TraceContext` object.
+
+        Arguments:
+
+        * `origin`: ID of the node that started the trace.
+
+        * `kind`: 'transaction', 'transactions' (batch) or 'block'.
+
+        * `message`: ID of the message (transaction ID,
+        block hash or random ID of a batch).
+
+        * `hops`: `list` of [node ID, timestamp sent]. Default: `None`, no hops.
+
+        * `item`: ID of the transaction of a batch the context refers to.'''
+
+        self.origin = origin
+        self.kind = kind
+        self.message = message
+        self.hops = hops or []
+        self.item = item
+
+    def child(self, item: str):
+        '''Get context of transaction `item` of this batch.'''
+        return TraceContext(self.origin, self.kind, self.message, self.hops, item)
+
+    def forward(self, node):
+        '''Get header value of the context after adding a hop
+        of `node` sending the message now.
+
+        Returns:
+
+        * `str`.'''
+
+        return json.dumps(dict(origin=self.origin, kind=self.kind, message=self.message,
+                               hops=self.hops + [[node, time.time()]]),
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_header(cls, value: str):
+        '''Constructor from the value of `TRACE_HEADER`.
+
+        Returns:
+
+        * `TraceContext`, `None` if `value` is malformed.'''
+
+        try:
+            trace = json.loads(value)
+            return cls(trace['origin'], trace['kind'], trace['message'], trace['hops'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+class _Span:
+    '''Context of `Tracer.span()`.'''
+
+    __slots__ = ('tracer', 'name', 'trace', 'attrs', 'start', 't_0')
+
+    def __init__(self, tracer, name, trace, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace = trace
+        self.attrs = attrs
+        self.start = self.t_0 = None
+
+    def __enter__(self):
+        self.start = time.time()
+        self.t_0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.trace, self.start,
+                           time.perf_counter() - self.t_0, **self.attrs)
+        return False
+
+class _NoSpan:
+    '''Context of `Tracer.span()` when there is nothing to trace.'''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+class _Current:
+    '''Context of `Tracer.context()`.'''
+
+    def __init__(self, local, trace):
+        self.local = local
+        self.trace = trace
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self.local, 'trace', None)
+        self.local.trace = self.trace
+        return self.trace
+
+    def __exit__(self, *exc_info):
+        self.local.trace = self.previous
+        return False
+
+class Tracer:
+    '''Writes spans of traced messages to the trace log.'''
+
+    def __init__(self):
+        '''Initialize (disabled) `Tracer` object.'''
+
+        self.node = None
+        self.enabled = False
+        self._file = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def configure(self, path: str, node):
+        '''Start writing spans to `path` (appended) as `node`.'''
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, 'a', encoding='utf-8') # pylint: disable=consider-using-with
+            self.node = node
+            self.enabled = True
+
+    def new_context(self, kind: str, message=None):
+        '''Start a trace of a message this node originates.
+
+        Arguments:
+
+        * `kind`: see `TraceContext`.
+
+        * `message`: ID of the message. Default: `None`, a random ID.
+
+        Returns:
+
+        * `TraceContext`, `None` if disabled.'''
+
+        if not self.enabled:
+            return None
+        return TraceContext(self.node, kind, message or uuid.uuid4().hex)
+
+    def from_headers(self, headers):
+        '''Get the context sent along with a message, and record
+        its 'transit' span, from when it was sent until now.
+
+        Arguments:
+
+        * `headers`: headers of the request.
+
+        Returns:
+
+        * `TraceContext`, `None` if disabled or not sent.'''
+
+        if not self.enabled:
+            return None
+        value = headers.get(TRACE_HEADER)
+        trace = TraceContext.from_header(value) if value else None
+        if trace is not None and trace.hops:
+            sender, sent = trace.hops[-1]
+            self.record('transit', trace, sent, time.time() - sent, sender=sender)
+        return trace
+
+    def headers(self, trace: TraceContext):
+        '''Get headers to send along with the message of `trace`.
+
+        Returns:
+
+        * `dict`, empty if `trace` is `None`.'''
+
+        if trace is None:
+            return {}
+        return {TRACE_HEADER: trace.forward(self.node)}
+
+    def context(self, trace: TraceContext):
+        '''Context manager that makes `trace` the current trace of
+        the thread, used by `span()` if not given a trace.'''
+        return _Current(self._local, trace)
+
+    def current(self):
+        '''Get the current trace of the thread (or `None`).'''
+        return getattr(self._local, 'trace', None)
+
+    def span(self, name: str, trace=None, **attrs):
+        '''Context manager recording a span of `trace` (default:
+        the current trace). Nothing is recorded if there is no trace.
+
+        Arguments:
+
+        * `name`: name of the span, e.g. 'validate'.
+
+        * `attrs`: written along with the span.'''
+
+        trace = trace or self.current()
+        if trace is None:
+            return _NO_SPAN
+        return _Span(self, name, trace, attrs)
+
+    def record(self, name: str, trace, start: float, duration: float, **attrs):
+        '''Write a span of `trace` that started at `start`
+        (wall-clock) and lasted `duration` seconds.'''
+
+        if trace is None or not self.enabled:
+            return
+        span = dict(node=self.node, span=name, origin=trace.origin, kind=trace.kind,
+                    message=trace.message, start=start, duration=duration)
+        if trace.item is not None:
+            span['item'] = trace.item
+        span.update(attrs)
+        line = json.dumps(span, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+TRACER = Tracer()
+
+###########################################################
+######################### merging #########################
+###########################################################
+
+def load_spans(paths):
+    '''Load the spans of trace logs `paths`.
+
+    Returns:
+
+    * `dict` of message ID -> `list` of spans (`dict`s), by start.'''
+
+    messages = defaultdict(list)
+    for path in paths:
+        with open(path, encoding='utf-8') as log:
+            for line in log:
+                try:
+                    span = json.loads(line)
+                except ValueError: # truncated last line
+                    continue
+                messages[span['message']].append(span)
+    for spans in messages.values():
+        spans.sort(key=lambda span: span['start'])
+    return dict(messages)
+
+def timeline(spans: list):
+    '''Build the propagation timeline of a message.
+
+    Arguments:
+
+    * `spans`: spans of the message, by start.
+
+    Returns:
+
+    * `dict` with the origin, start, time until the last span ended
+    on every node and the spans with times relative to the start.'''
+
+    start = spans[0]['start']
+    reached = {}
+    for span in spans:
+        end = span['start'] + span['duration'] - start
+        reached[span['node']] = max(reached.get(span['node'], 0), end)
+    return dict(
+        message=spans[0]['message'],
+        kind=spans[0]['kind'],
+        origin=spans[0]['origin'],
+        start=start,
+        nodes=reached,
+        spans=[dict(span, offset=span['start'] - start) for span in spans]
+    )
+
+def summary(messages: dict):
+    '''Percentiles of the duration of every span name over
+    all messages, to see where propagation time goes.
+
+    Returns:
+
+    * `dict` of span name -> `dict` of stats.'''
+
+    durations = defaultdict(list)
+    for spans in messages.values():
+        for span in spans:
+            durations[(span['kind'], span['span'])].append(span['duration'])
+
+    stats = {}
+    for (kind, name), values in sorted(durations.items()):
+        p50, p95 = np.percentile(values, (50, 95))
+        stats[f'{kind}/{name}'] = dict(count=len(values), total=float(np.sum(values)),
+                                      mean=float(np.mean(values)), p50=float(p50),
+                                      p95=float(p95), max=float(np.max(values)))
+    return stats
+
+def print_timeline(line: dict, out=sys.stdout):
+    '''Print timeline `line` (see `timeline()`) in a human readable form.'''
+
+    print(f'{line["kind"]} {line["message"]} from node {line["origin"]}', file=out)
+    for span in line['spans']:
+        item = f' {span["item"][:12]}' if 'item' in span else ''
+        print(f'  +{span["offset"] * 1000:10.2f} ms  node {span["node"]:<3} '
+              f'{span["span"]:<18}{span["duration"] * 1000:10.2f} ms{item}', file=out)
+    reached = ', '.join(f'{node}: {end * 1000:.1f}' for node, end in sorted(line['nodes'].items()))
+    print(f'  done (ms) {reached}', file=out)
+
+def main():
+    '''Merge trace logs into per-message timelines.'''
+
+    parser = ArgumentParser(description='Merge trace logs of nodes into per-message timelines.')
+    parser.add_argument('logs', nargs='+', help='trace logs (--trace_log of the nodes)')
+    parser.add_argument('-m', '--message', default=None, type=str,
+                        help='only the message with this ID (or prefix)')
+    parser.add_argument('-s', '--summary', action='store_true',
+                        help='print percentiles of spans instead of timelines')
+    parser.add_argument('-j', '--json', action='store_true', help='print JSON')
+    args = parser.parse_args()
+
+    messages = load_spans(args.logs)
+    if args.message is not None:
+        messages = {msg: spans for msg, spans in messages.items() \
+            if msg.startswith(args.message)}
+
+    if args.summary:
+        stats = summary(messages)
+        if args.json:
+            print(json.dumps(stats, indent=2))
+        else:
+            print(f'{"span":<28}{"count":>8}{"mean ms":>10}'
+                  f'{"p50 ms":>10}{"p95 ms":>10}{"max ms":>10}')
+            for name, span in stats.items():
+                print(f'{name:<28}{span["count"]:>8}{span["mean"] * 1000:>10.2f}'
+                      f'{span["p50"] * 1000:>10.2f}{span["p95"] * 1000:>10.2f}'
+                      f'{span["max"] * 1000:>10.2f}')
+        return
+
+    lines = sorted((timeline(spans) for spans in messages.values()),
+                   key=lambda line: line['start'])
+    if args.json:
+        for line in lines:
+            print(json.dumps(line))
+    else:
+        for line in lines:
+            print_timeline(line)
+
+if __name__ == '__main__':
+    main()
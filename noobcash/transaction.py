@@ -1,41 +1,43 @@
 '''Cryptocurrency transaction. Contains "unique" `transaction_id`
-    (hex digest of SHA object), sender RSA public key `sender_pubk`,
-    receiver RSA public key `receiver_pubk`, transaction IDs `transaction_inputs`
+    (hex digest of the network's hash), sender public key `sender_pubk`,
+    receiver public key `receiver_pubk`, transaction IDs `transaction_inputs`
     where the money from `sender_pubk` supposedly come from, `signature` with
     private key of node for verification (in bytes).'''
 
 import json
 
 # import Crypto.Random
-from Crypto.Hash import SHA
 # from Crypto.PublicKey import RSA
-from Crypto.Signature import PKCS1_v1_5
 
 # from flask import Flask, jsonify, request, render_template
 
+from noobcash import signatures, hashing
 from noobcash.transaction_output import TransactionOutput
-from noobcash.helpers import pubk_from_dict, sign_from_dict, pubk_to_dict, sign_to_dict
+from noobcash.helpers import pubk_from_ref, sign_from_dict, pubk_to_ref, sign_to_dict
 
 
 class Transaction:
     '''Cryptocurrency transaction. Contains "unique" `transaction_id`
-    (hex digest of SHA object), sender RSA public key `sender_pubk`,
-    receiver RSA public key `receiver_pubk`, transaction IDs `transaction_inputs`
+    (hex digest of the network's hash), sender public key `sender_pubk`,
+    receiver public key `receiver_pubk`, transaction IDs `transaction_inputs`
     where the money from `sender_pubk` supposedly come from, `signature` with
     private key of node for verification (in bytes).'''
 
-    def __init__(self, recipient_pubk, value: int, my_wallet):
+    def __init__(self, recipient_pubk, value: int, my_wallet, sign=True):
         '''Initialize `Transaction` object.
 
         Arguments:
 
-        * `recipient_pubk`: RSA public key of recipient of NBCs.
+        * `recipient_pubk`: public key of recipient of NBCs.
 
         * `value`: amount of NBCs to be transfered.
 
         * `my_wallet`: `Wallet` of sender (MUST be this node's =>
-        must contain its RSA private key). If `None`, then GENESIS
-        transaction.'''
+        must contain its private key). If `None`, then GENESIS
+        transaction.
+
+        * `sign`: whether to sign the transaction. If `False`, `signature`
+        is `None` and must be set with `sign_transaction()` later.'''
 
         self.receiver_pubk = recipient_pubk
 
@@ -61,10 +63,12 @@ class Transaction:
                                   self.sender_pubk, change)
             )
 
-        if my_wallet is not None:
-            self.signature = self.sign_transaction(my_wallet.private_key)
-        else: # redundant but to be sure
+        if my_wallet is None: # redundant but to be sure
             self.signature = b'No need'
+        elif sign:
+            self.signature = self.sign_transaction(my_wallet.private_key)
+        else:
+            self.signature = None
 
     def __eq__(self, o):
         '''Compare IDs (assumed unique) for equality.'''
@@ -83,8 +87,8 @@ class Transaction:
         * `transaction`: `dict` directly from `to_dict()` send by other node.
         (NOTE: not validated yet).'''
 
-        receiver_pubk = pubk_from_dict(transaction['receiver_pubk'])
-        sender_pubk = pubk_from_dict(transaction['sender_pubk'])
+        receiver_pubk = pubk_from_ref(transaction['receiver_pubk'])
+        sender_pubk = pubk_from_ref(transaction['sender_pubk'])
         transaction_inputs = transaction['transaction_inputs']
         transaction_outputs = [
             TransactionOutput.from_dict(to_dict) \
@@ -92,13 +96,36 @@ class Transaction:
         ]
         signature = sign_from_dict(transaction['signature'])
 
-        # use constructor if genesis transaction
-        inst = cls(receiver_pubk, transaction_outputs[0].amount, my_wallet=None)
+        return cls.from_parts(sender_pubk, receiver_pubk, transaction_inputs,
+                              transaction_outputs, signature)
+
+    @classmethod
+    def from_parts(cls, sender_pubk, receiver_pubk, transaction_inputs: list,
+                   transaction_outputs: list, signature: bytes):
+        '''Constructor to be used when the attributes of a transaction
+        have already been decoded (e.g. from `dict` or binary payload).
+
+        Arguments:
+
+        * `sender_pubk`: public key of sender.
+
+        * `receiver_pubk`: public key of receiver.
+
+        * `transaction_inputs`: `list` of transaction IDs.
+
+        * `transaction_outputs`: `list` of `TransactionOutput`s.
+
+        * `signature`: `bytes` signature.
+
+        (NOTE: not validated yet).'''
+
+        # bypass constructor, it would compute a hash
+        # for the dummy genesis transaction
+        inst = cls.__new__(cls)
         inst.sender_pubk = sender_pubk
+        inst.receiver_pubk = receiver_pubk
         inst.transaction_inputs = transaction_inputs
-        # update id after new attributes
         inst.transaction_id = inst.make_hash()
-        # assign correct transaction outputs
         inst.transaction_outputs = transaction_outputs
         inst.signature = signature
 
@@ -110,32 +137,72 @@ class Transaction:
 
         Returns:
 
-        * `str` that somehow contains transaction's keys
-        and input unspent transactions.'''
+        * `str` that somehow contains transaction's keys (by
+        fingerprint, see `noobcash.keys`) and input unspent transactions.'''
+
+        return self.message_from_dicts(pubk_to_ref(self.sender_pubk),
+                                       pubk_to_ref(self.receiver_pubk),
+                                       self.transaction_inputs)
+
+    @staticmethod
+    def message_from_dicts(sender_pubk, receiver_pubk, transaction_inputs: list):
+        '''`message()` from keys as returned by `pubk_to_ref()`, so
+        that it can be computed before keys are resolved.
+
+        Arguments:
+
+        * `sender_pubk`: fingerprint of sender's key.
+
+        * `receiver_pubk`: fingerprint of receiver's key.
+
+        * `transaction_inputs`: `list` of transaction IDs.
+
+        Returns:
+
+        * `str` message.'''
 
         return json.dumps(dict(
-            sender_pubk=pubk_to_dict(self.sender_pubk),
-            receiver_pubk=pubk_to_dict(self.receiver_pubk),
-            transaction_inputs=self.transaction_inputs
+            sender_pubk=sender_pubk,
+            receiver_pubk=receiver_pubk,
+            transaction_inputs=transaction_inputs
         ))
 
+    @classmethod
+    def id_from_dict(cls, transaction: dict):
+        '''Get `transaction_id` of a transaction still in the form
+        of `to_dict()`, without reconstructing it (e.g. to look it up
+        before doing any heavy work).
+
+        Arguments:
+
+        * `transaction`: `dict` directly from `to_dict()`.
+
+        Returns:
+
+        * `hexdigest()` of transaction.'''
+
+        message = cls.message_from_dicts(transaction['sender_pubk'],
+                                         transaction['receiver_pubk'],
+                                         transaction['transaction_inputs'])
+        return hashing.hexdigest(message.encode('utf-8'))
+
     def make_hash(self, as_str=True):
-        '''Get SHA hash of transaction, in data type specified
+        '''Get hash of transaction, in data type specified
         by `as_str`.
 
         Arguments:
 
-        * `as_str`: `bool`, whether to return SHA object
-        or `hexdigest()`.
+        * `as_str`: `bool`, whether to return hash object
+        to sign (see `hashing.signable()`) or `hexdigest()`.
 
         Returns:
 
-        * Hash as SHA object or `str`'''
+        * Hash as `Crypto.Hash` object or `str`'''
 
-        _hash = SHA.new(data=self.message().encode('utf-8'))
+        message = self.message().encode('utf-8')
         if as_str:
-            _hash = _hash.hexdigest()
-        return _hash
+            return hashing.hexdigest(message)
+        return hashing.signable(message)
 
     def to_dict(self):
         '''Transform attributes to `dict` for
@@ -150,8 +217,8 @@ class Transaction:
         attribute, while `message()` can).'''
 
         return dict(
-            sender_pubk=pubk_to_dict(self.sender_pubk),
-            receiver_pubk=pubk_to_dict(self.receiver_pubk),
+            sender_pubk=pubk_to_ref(self.sender_pubk),
+            receiver_pubk=pubk_to_ref(self.receiver_pubk),
             transaction_inputs=self.transaction_inputs,
             transaction_outputs=[
                 to.to_dict() for to in self.transaction_outputs
@@ -164,13 +231,14 @@ class Transaction:
 
         Arguments:
 
-        * `private_key`: RSA private key to sign transaction with.
+        * `private_key`: private key to sign transaction with
+        (any scheme of `noobcash.signatures`).
 
         Returns:
 
         * `bytes` signature.'''
 
-        return PKCS1_v1_5.new(private_key).sign(self.make_hash(as_str=False))
+        return signatures.sign(private_key, self.make_hash(as_str=False))
 
     def __str__(self):
         '''Used for debugging, returns a `json.dumps`'d `dict`.'''
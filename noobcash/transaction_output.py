@@ -1,16 +1,15 @@
 '''Transaction Output (utxo). Contains "unique" transaction ID
-(`hexdigest()`) `transaction_id`, RSA public key of the receiver
+(`hexdigest()`) `transaction_id`, public key of the receiver
 `receiver_public_key` and amount `amount` she receives.'''
 
 import json
 
-from Crypto.PublicKey import RSA
-
-from noobcash.helpers import pubk_from_dict, pubk_to_dict
+from noobcash import signatures
+from noobcash.helpers import pubk_from_ref, pubk_to_ref
 
 class TransactionOutput:
     '''Transaction Output (utxo). Contains "unique" transaction ID
-    (`hexdigest()`) `transaction_id`, RSA public key of the receiver
+    (`hexdigest()`) `transaction_id`, public key of the receiver
     `receiver_public_key` and amount `amount` she receives.'''
 
     def __init__(self, transaction_id, receiver_public_key, amount: int):
@@ -21,7 +20,7 @@ class TransactionOutput:
         * `transaction_id`: `hexdigest()` of transaction ID of transaction
         that created this object.
 
-        * `receiver_public_key`: RSA public key of the node that will
+        * `receiver_public_key`: public key of the node that will
         receiver this utxo.
 
         * `amount`: amount that this utxo contains.'''
@@ -38,8 +37,7 @@ class TransactionOutput:
         * Replica of this object wrt to values, not memory location etc.'''
 
         inst = TransactionOutput(self.transaction_id, 0, self.amount)
-        inst.receiver_public_key = RSA.RsaKey(n=self.receiver_public_key.n,
-                                              e=self.receiver_public_key.e)
+        inst.receiver_public_key = signatures.copy_key(self.receiver_public_key)
         return inst
 
     @classmethod
@@ -51,7 +49,7 @@ class TransactionOutput:
         `transaction_output`: `dict` directly from `to_dict()` send
         by other node.'''
 
-        transaction_output['receiver_pubk'] = pubk_from_dict(transaction_output['receiver_pubk'])
+        transaction_output['receiver_pubk'] = pubk_from_ref(transaction_output['receiver_pubk'])
         return cls(transaction_output['transaction_id'], transaction_output['receiver_pubk'],
                    int(transaction_output['amount']))
 
@@ -66,7 +64,7 @@ class TransactionOutput:
 
         return dict(
             transaction_id=self.transaction_id,
-            receiver_pubk=pubk_to_dict(self.receiver_public_key),
+            receiver_pubk=pubk_to_ref(self.receiver_public_key),
             amount=self.amount
         )
 
@@ -1,49 +1,154 @@
 '''Queue to hold received or created transactions.
-Has a single attribute, a list of `Trsansaction`s,
-`queue`. Mainly used to make commands on `queue`
-atomic with `syncronized`.'''
+Transactions are kept in order of arrival in `queue`,
+an `OrderedDict` indexed by their ID, so they can be
+appended, looked up and removed in O(1) and the first
+k of them can be taken in O(k). Transactions spending outputs of
+other queued transactions are tracked as their children, so that
+block templates respect dependencies and evictions take the
+descendants along. The queue can be bounded in number of
+transactions and bytes, `trim()` evicts the oldest (or lowest
+priority) transactions to respect the bounds. Commands on `queue`
+are atomic with `syncronized` (each queue has its own lock).'''
+
+import time
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
 
 import wrapt
 
 from noobcash.transaction import Transaction
+from noobcash.wire import encode_transaction
+from noobcash.locks import ProfiledLock
 
-@wrapt.synchronized
 class TransactionQueue:
     '''Queue to hold received or created transactions.
-    Has a single attribute, a list of `Trsansaction`s,
-    `queue`. Mainly used to make commands on `queue`
-    atomic with `syncronized`.'''
-
-    def __init__(self, queue=list()):
+    Transactions are kept in order of arrival in `queue`,
+    an `OrderedDict` indexed by their ID, so they can be
+    appended, looked up and removed in O(1) and the first
+    k of them can be taken in O(k). Transactions spending outputs of
+    other queued transactions are tracked as their children, so that
+    block templates respect dependencies and evictions take the
+    descendants along. The queue can be bounded in number of
+    transactions and bytes, `trim()` evicts the oldest (or lowest
+    priority) transactions to respect the bounds. Commands on `queue`
+    are atomic with `syncronized` (each queue has its own lock).'''
+
+    def __init__(self, queue=None, max_count=0, max_bytes=0, priority=None, protected=None):
         '''Initialize `TransactionQueue` object.
 
         Arguments:
 
-        * `queue`: Initial `Transaction`s. Default: `[]`.'''
-
-        assert hasattr(queue, '__len__')
-        if not isinstance(queue, list):
-            queue = list(queue)
-
-        self.queue = queue
-
+        * `queue`: Initial `Transaction`s. Default: `[]`.
+
+        * `max_count`: maximum number of transactions, 0 for no limit.
+
+        * `max_bytes`: maximum total size of transactions (in their binary
+        wire encoding), 0 for no limit (sizes are not computed then).
+
+        * `priority`: function of a `Transaction` returning an `int`, lower
+        priorities are evicted first. Default: `None`, oldest are evicted first.
+
+        * `protected`: function of a `Transaction` returning `True` if it must
+        never be evicted (so neither are its ancestors). Default: `None`.'''
+
+        # lock of `wrapt.synchronized` methods, profiled
+        self._synchronized_lock = ProfiledLock(threading.RLock(), 'TransactionQueue')
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.priority = priority
+        self.protected = protected
+
+        # ID -> time.monotonic() when appended
+        self.arrived = dict()
+        # ID -> size, if max_bytes
+        self.sizes = dict()
+        self.bytes = 0
+        # ID -> priority and priority -> `OrderedDict` of IDs, if priority
+        self.priorities = dict()
+        self.by_priority = dict()
+
+        # IDs of protected transactions, if protected
+        self.protected_ids = set()
+
+        self.evicted = 0
+        self.evicted_bytes = 0
+        self.evictions = 0 # times `trim()` evicted something
+
+        self.queue = OrderedDict()
+        # ID -> `set` of IDs of queued transactions it spends from
+        self.parents = dict()
+        # ID -> `set` of IDs of queued transactions spending from it
+        self.children = dict()
+        # input ID (whether queued or not) -> `set` of IDs of
+        # queued transactions spending it, to link a parent
+        # that arrives after its children
+        self.spenders = dict()
+        if queue is not None:
+            self.extend(queue)
+
+    @wrapt.synchronized
     def __str__(self):
         '''Used for debugging.'''
-        return str(self.queue)
+        return str(list(self.queue.values()))
 
+    @wrapt.synchronized
     def __len__(self):
         '''Return number of transactions in queue.'''
         return len(self.queue)
 
-    def append(self, transaction: Transaction):#, line: int):
-        '''Append `transaction` to `queue`.
+    @wrapt.synchronized
+    def __contains__(self, transaction):
+        '''Check if a transaction is in the queue.
 
         Arguments:
 
-        * `transaction`: `Trsansaction` to be appended.'''
-        self.queue.append(transaction)
+        * `transaction`: `Transaction` or its ID.'''
+
+        if isinstance(transaction, Transaction):
+            transaction = transaction.transaction_id
+        return transaction in self.queue
 
+    def __iter__(self):
+        '''Iterate over (a snapshot of) the transactions.'''
+        return iter(self.transactions())
 
+    @wrapt.synchronized
+    def append(self, transaction: Transaction):
+        '''Append `transaction` to `queue`. Ignored if
+        already in `queue` (keeps its position).
+
+        Arguments:
+
+        * `transaction`: `Trsansaction` to be appended.'''
+
+        tid = transaction.transaction_id
+        if tid in self.queue:
+            return
+        self.queue[tid] = transaction
+        self.arrived[tid] = time.monotonic()
+
+        if self.max_bytes:
+            self.sizes[tid] = len(encode_transaction(transaction))
+            self.bytes += self.sizes[tid]
+        if self.priority is not None:
+            self.priorities[tid] = self.priority(transaction)
+            self.by_priority.setdefault(self.priorities[tid], OrderedDict())[tid] = None
+        if self.protected is not None and self.protected(transaction):
+            self.protected_ids.add(tid)
+
+        self.parents[tid] = set()
+        for utxo_id in transaction.transaction_inputs:
+            if utxo_id in self.queue:
+                self.parents[tid].add(utxo_id)
+                self.children[utxo_id].add(tid)
+            self.spenders.setdefault(utxo_id, set()).add(tid)
+
+        self.children[tid] = set(self.spenders.get(tid, ()))
+        for child in self.children[tid]:
+            self.parents[child].add(tid)
+
+    @wrapt.synchronized
     def extend(self, transactions):
         '''Extend `queue` with `transactions`.
 
@@ -51,16 +156,257 @@ class TransactionQueue:
 
         * `transactions`: `Trsansactions` to be appended.'''
 
-        assert hasattr(transactions, '__len__')
-        if not isinstance(transactions, list):
-            transactions = list(transactions)
+        for transaction in transactions:
+            self.append(transaction)
 
-        self.queue.extend(transactions)
+    @wrapt.synchronized
+    def get(self, transaction_id: str):
+        '''Get transaction by ID.
 
+        Arguments:
+
+        * `transaction_id`: hex digest.
+
+        Returns:
+
+        * `Transaction` or `None` if not in `queue`.'''
+
+        return self.queue.get(transaction_id)
+
+    @wrapt.synchronized
+    def head(self, k: int):
+        '''Get the first `k` transactions (in O(k)).
+
+        Arguments:
+
+        * `k`: number of transactions.
+
+        Returns:
+
+        * `list` of `Transaction`s.'''
+
+        return list(islice(self.queue.values(), k))
+
+    @wrapt.synchronized
+    def template(self, k: int):
+        '''Get the first `k` transactions (in order of arrival)
+        whose queued ancestors are all included, i.e. transactions
+        that can form a valid block.
+
+        Arguments:
+
+        * `k`: number of transactions.
+
+        Returns:
+
+        * `list` of `Transaction`s.'''
+
+        included, transactions = set(), []
+        for tid, transaction in self.queue.items():
+            if len(transactions) >= k:
+                break
+            if self.parents[tid] <= included:
+                included.add(tid)
+                transactions.append(transaction)
+        return transactions
+
+    @wrapt.synchronized
+    def oldest_arrival(self):
+        '''Get when the oldest transaction was appended.
+
+        Returns:
+
+        * `time.monotonic()` of the append or `None` if empty.'''
+
+        for tid in self.queue:
+            return self.arrived[tid]
+        return None
+
+    @wrapt.synchronized
     def __getitem__(self, index):
-        '''Method to access `queue` by indexing class.'''
-        return self.queue[index]
+        '''Method to access `queue` by indexing class. Slices
+        from the start take O(k), anything else O(len).'''
+
+        if isinstance(index, slice) and index.start in (None, 0) and \
+            index.step in (None, 1) and index.stop is not None and index.stop >= 0:
+            return self.head(index.stop)
+        return list(self.queue.values())[index]
 
+    @wrapt.synchronized
+    def remove(self, transaction_id: str):
+        '''Remove transaction by ID.
+
+        Arguments:
+
+        * `transaction_id`: hex digest.
+
+        Returns:
+
+        * Removed `Transaction` or `None` if not in `queue`.'''
+
+        transaction = self.queue.pop(transaction_id, None)
+        if transaction is None:
+            return None
+
+        del self.arrived[transaction_id]
+        self.bytes -= self.sizes.pop(transaction_id, 0)
+        if transaction_id in self.priorities:
+            del self.by_priority[self.priorities.pop(transaction_id)][transaction_id]
+        self.protected_ids.discard(transaction_id)
+
+        # its children (if any) no longer depend on a queued transaction
+        for parent in self.parents.pop(transaction_id):
+            self.children[parent].discard(transaction_id)
+        for child in self.children.pop(transaction_id):
+            self.parents[child].discard(transaction_id)
+        for utxo_id in transaction.transaction_inputs:
+            spenders = self.spenders.get(utxo_id, set()) # inputs may repeat if not validated
+            spenders.discard(transaction_id)
+            if not spenders:
+                self.spenders.pop(utxo_id, None)
+
+        return transaction
+
+    @wrapt.synchronized
+    def remove_many(self, transaction_ids):
+        '''Remove transactions by ID, e.g. those in a block.
+
+        Arguments:
+
+        * `transaction_ids`: iterable of hex digests.
+
+        Returns:
+
+        * `list` of removed `Transaction`s (the rest were
+        not in `queue`).'''
+
+        removed = []
+        for tid in transaction_ids:
+            transaction = self.remove(tid)
+            if transaction is not None:
+                removed.append(transaction)
+        return removed
+
+    @wrapt.synchronized
+    def descendants(self, transaction_id: str):
+        '''Get IDs of all queued transactions depending on
+        the one with `transaction_id`, including itself.
+
+        Arguments:
+
+        * `transaction_id`: hex digest.
+
+        Returns:
+
+        * `list` of IDs, parents before children.'''
+
+        if transaction_id not in self.queue:
+            return []
+
+        found, frontier = OrderedDict.fromkeys([transaction_id]), deque([transaction_id])
+        while frontier:
+            tid = frontier.popleft()
+            for child in self.children[tid]:
+                if child not in found:
+                    found[child] = None
+                    frontier.append(child)
+        return list(found)
+
+    @wrapt.synchronized
+    def evict(self, transaction_id: str):
+        '''Remove transaction and all its descendants, e.g.
+        when it turns out to be invalid.
+
+        Arguments:
+
+        * `transaction_id`: hex digest.
+
+        Returns:
+
+        * `list` of removed `Transaction`s, parents before children.'''
+
+        return self.remove_many(self.descendants(transaction_id))
+
+    @wrapt.synchronized
+    def over_limit(self):
+        '''Check if the queue exceeds its bounds.'''
+        return bool(self.max_count and len(self.queue) > self.max_count or \
+            self.max_bytes and self.bytes > self.max_bytes)
+
+    @wrapt.synchronized
+    def trim(self):
+        '''Evict transactions (along with their descendants)
+        until the queue is within its bounds. Oldest transactions
+        are evicted first, among those of the lowest priority
+        if `priority` is set. Protected transactions are never
+        evicted, the queue may stay over its bounds then.
+
+        Returns:
+
+        * `list` of evicted `Transaction`s, parents before children.'''
+
+        evicted, shielded = [], None
+        while self.over_limit():
+            if shielded is None:
+                # stays valid, no victim is an ancestor of a protected transaction
+                shielded = self._shielded()
+            victim = self._victim(shielded)
+            if victim is None:
+                break
+            bytes_before = self.bytes
+            evicted.extend(self.evict(victim))
+            self.evicted_bytes += bytes_before - self.bytes
+
+        if evicted:
+            self.evicted += len(evicted)
+            self.evictions += 1
+        return evicted
+
+    def _shielded(self):
+        '''IDs of protected transactions and their ancestors (in
+        O(number of them)), i.e. of those that must not be evicted.'''
+
+        shielded, frontier = set(self.protected_ids), deque(self.protected_ids)
+        while frontier:
+            for parent in self.parents[frontier.popleft()]:
+                if parent not in shielded:
+                    shielded.add(parent)
+                    frontier.append(parent)
+        return shielded
+
+    def _victim(self, shielded):
+        '''ID of the next transaction to evict, `None` if
+        all of them are in `shielded`.'''
+
+        if self.priority is None:
+            candidates = iter(self.queue)
+        else:
+            candidates = (tid for prio in sorted(self.by_priority) \
+                for tid in self.by_priority[prio])
+        for tid in candidates:
+            if tid not in shielded:
+                return tid
+        return None
+
+    @wrapt.synchronized
+    def stats(self):
+        '''Get size of the queue and eviction counters.
+
+        Returns:
+
+        * `dict` of counters.'''
+
+        return dict(
+            count=len(self.queue),
+            max_count=self.max_count,
+            bytes=self.bytes if self.max_bytes else None,
+            max_bytes=self.max_bytes,
+            evicted=self.evicted,
+            evicted_bytes=self.evicted_bytes if self.max_bytes else None,
+            evictions=self.evictions
+        )
+
+    @wrapt.synchronized
     def split(self, index, assign=None):
         '''Split queue at `index`. Assign one of the splits
         to the queue is `assign` is set.
@@ -76,30 +422,42 @@ class TransactionQueue:
 
         * `tuple` of splits (`list`s).'''
 
-        # chech if split possible ?
-        ret = (self.queue[:index], self.queue[index:])
+        if assign == 1: # only remove the first split
+            first = self.remove_many([tra.transaction_id for tra in self.head(index)])
+            return first, list(self.queue.values())
+
+        transactions = list(self.queue.values())
+        ret = (transactions[:index], transactions[index:])
 
         if assign is not None:
-            assert assign in (0, 1)
-            self.queue = ret[assign]
+            assert assign == 0
+            self.set(ret[0])
 
         return ret
 
-
+    @wrapt.synchronized
     def empty(self):
         '''Empty `queue`.'''
-        self.queue = []
-
+        self.queue = OrderedDict()
+        self.parents = dict()
+        self.children = dict()
+        self.spenders = dict()
+        self.arrived = dict()
+        self.sizes = dict()
+        self.bytes = 0
+        self.priorities = dict()
+        self.by_priority = dict()
+        self.protected_ids = set()
+
+    @wrapt.synchronized
     def set(self, queue):
         '''Set `queue` to another queue without
         initializing a new object.'''
 
-        assert hasattr(queue, '__len__')
-        if not isinstance(queue, list):
-            queue = list(queue)
-
-        self.queue = queue
+        self.empty()
+        self.extend(queue)
 
+    @wrapt.synchronized
     def transactions(self):
-        '''Get `Transaction`s in `list`, i.e. `queue`.'''
-        return self.queue
+        '''Get `Transaction`s in `list`, i.e. a copy of `queue`.'''
+        return list(self.queue.values())
@@ -0,0 +1,177 @@
+'''How a `Node` talks to the other nodes of the network. `HttpTransport`
+sends requests to the REST API of the nodes (see `rest.py`), possibly
+through an HTTP proxy (e.g. `benchmarks.faultproxy`), the simulator
+(see `noobcash.simulator`) provides an in-memory transport with the
+same methods. Addresses are ip+port as in `Wallet.address`.'''
+
+import json
+import time
+from multiprocessing.dummy import Pool as ThreadPool
+
+import urllib3
+
+from noobcash import wire
+from noobcash.helpers import (
+    get_len_from_address, send_dict_to_address, send_payload_to_address, COMPRESSIONS
+)
+
+# threads sending a broadcast
+NUM_OF_THREADS = 2
+# bytes read at a time when streaming a blockchain
+STREAM_CHUNK_SIZE = 2 ** 16
+# identifies the sender to the proxy
+SOURCE_HEADER = 'X-Noobcash-Source'
+
+class HttpTransport:
+    '''Transport over the REST API of the nodes.'''
+
+    def __init__(self, proxy=None, source=None):
+        '''Initialize `HttpTransport` object.
+
+        Arguments:
+
+        * `proxy`: URL of an HTTP proxy that all requests to other nodes
+        go through. Default: `None`, direct requests.
+
+        * `source`: sent to the proxy in `SOURCE_HEADER` to identify
+        us (e.g. our port). Default: `None`.'''
+
+        self.http = None
+        self.headers = {}
+        self.scheme = ''
+        if proxy is not None:
+            # urllib3 only forwards http:// URLs in absolute form
+            self.http = urllib3.ProxyManager(proxy, maxsize=4 * NUM_OF_THREADS)
+            self.scheme = 'http://'
+            if source is not None:
+                self.headers[SOURCE_HEADER] = str(source)
+
+    def _url(self, address: str, path: str):
+        return f'{self.scheme}{address}/{path}'
+
+    def map(self, function, items: list):
+        '''Call `function` (e.g. sending to a node) for
+        every one of `items` concurrently.
+
+        Returns:
+
+        * `list` of results.'''
+
+        pool = ThreadPool(NUM_OF_THREADS)
+        results = pool.map(function, items)
+        pool.close()
+        pool.join()
+        return results
+
+    def network_params(self, bootstrap_address: str):
+        '''Get the parameters of the network from the bootstrap
+        (see `Node.network_params()`), waiting for it to be up.
+
+        Arguments:
+
+        * `bootstrap_address`: ip+port of bootstrap.
+
+        Returns:
+
+        * `dict`.'''
+
+        http = self.http or urllib3.PoolManager()
+        while True:
+            try:
+                response = http.request('GET', self._url(bootstrap_address, 'network'),
+                                        headers=dict(self.headers, Accept='application/json'))
+                if response.status == 200:
+                    return json.loads(response.data)
+            except urllib3.exceptions.HTTPError:
+                pass
+            time.sleep(1)
+
+    def join(self, bootstrap_address: str, wallet_dict: dict):
+        '''Register to the network (see `Node.register_node_to_ring()`).
+
+        Arguments:
+
+        * `bootstrap_address`: ip+port of bootstrap.
+
+        * `wallet_dict`: `dict` of our `Wallet`.
+
+        Returns:
+
+        * `dict` response of the bootstrap.
+
+        Raises:
+
+        * `RuntimeError` if the bootstrap refused to register us.'''
+
+        http = self.http or urllib3.PoolManager()
+        response = http.request('POST', self._url(bootstrap_address, 'node'),
+                                headers=dict(self.headers, **{'Content-Type': 'application/json'}),
+                                body=json.dumps(wallet_dict))
+        if response.status != 200:
+            raise RuntimeError(f'Bootstrap refused to register node: {json.loads(response.data)}')
+        return json.loads(response.data)
+
+    def send(self, address: str, path: str, payload: tuple, headers=None):
+        '''Send an encoded message.
+
+        Arguments:
+
+        * `address`: ip+port of the node.
+
+        * `path`: endpoint, e.g. 'block'.
+
+        * `payload`: (`bytes` body, `str` content type) from `wire.encode()`.
+
+        * `headers`: `dict` of extra headers. Default: `None`.
+
+        Returns:
+
+        * `True` if the node accepted it.'''
+
+        return send_payload_to_address((payload, self._url(address, path)),
+                                       headers=dict(self.headers, **(headers or {})),
+                                       http=self.http)
+
+    def send_dict(self, address: str, path: str, dct: dict):
+        '''Send `dct` as JSON, see `send()`.'''
+        return send_dict_to_address((dct, self._url(address, path)),
+                                    headers=self.headers, http=self.http)
+
+    def blockchain_length(self, address: str):
+        '''Get the length of the blockchain of a node.
+
+        Returns:
+
+        * `int`, 0 if the node did not respond properly.'''
+
+        return get_len_from_address(self._url(address, 'length'),
+                                    headers=self.headers, http=self.http)
+
+    def stream_blockchain(self, address: str, wire_format: str):
+        '''Download the blockchain of a node block by block, binary
+        or NDJSON (by `wire_format`) if the node supports streaming.
+
+        Arguments:
+
+        * `address`: ip+port of the node.
+
+        * `wire_format`: 'json' or 'binary'.
+
+        Returns:
+
+        * Generator of `Block`s, to be closed if not exhausted.'''
+
+        accept = wire.STREAM_CONTENT_TYPE if wire_format == 'binary' \
+            else wire.NDJSON_CONTENT_TYPE
+        http = self.http or urllib3.PoolManager()
+        response = http.request('GET', self._url(address, 'blockchain'), preload_content=False,
+                                headers=dict(self.headers,
+                                             Accept=f'{accept}, {wire.JSON_CONTENT_TYPE};q=0.5',
+                                             **{'Accept-Encoding': ', '.join(COMPRESSIONS)}))
+        try:
+            # peer may not support streaming, so check what was actually sent
+            yield from wire.iter_decoded_blocks(response.stream(STREAM_CHUNK_SIZE),
+                                                response.headers.get('Content-Type'))
+        finally:
+            # may not have been read until the end
+            response.close()
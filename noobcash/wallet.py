@@ -1,6 +1,6 @@
 '''Wallet of cryptocurrency of a node in a network.
-Contains `private_key` (RSA object) if wallet belongs to the node,
-`public_key` (RSA object) of the node, `address` (ip+port as string)
+Contains `private_key` (RSA or ECC object) if wallet belongs to the node,
+`public_key` (RSA or ECC object) of the node, `address` (ip+port as string)
 of the node, `utxos` as a dict of its unspent transactions and `balance`
 the sum of its available money.'''
 
@@ -8,19 +8,20 @@ import subprocess
 
 import wrapt
 
-from Crypto.PublicKey import RSA
-
+from noobcash import signatures
+from noobcash.keys import REGISTRY
+from noobcash.locks import ProfiledLock
 from noobcash.transaction_output import TransactionOutput
 from noobcash.helpers import pubk_to_dict, pubk_from_dict, object_dict_deepcopy
 
 class Wallet:
     '''Wallet of cryptocurrency of a node in a network.
-    Contains `private_key` (RSA object) if wallet belongs to the node,
-    `public_key` (RSA object) of the node, `address` (ip+port as string)
+    Contains `private_key` (RSA or ECC object) if wallet belongs to the node,
+    `public_key` (RSA or ECC object) of the node, `address` (ip+port as string)
     of the node, `utxos` as a dict of its unspent transactions and `balance`
     the sum of its available money.'''
 
-    def __init__(self, port: int, this_node=True):
+    def __init__(self, port: int, this_node=True, scheme=signatures.DEFAULT_SCHEME):
         '''Initialize `Wallet` object.
 
         Arguments:
@@ -28,17 +29,30 @@ class Wallet:
         * `port`: the port where the node is listening to.
 
         * `this_node`: flag, whether this objects refers to the
-        information of this node.'''
+        information of this node.
+
+        * `scheme`: signature scheme of the keys of this node
+        (see `noobcash.signatures`).'''
 
         if this_node:
-            self.private_key = RSA.generate(2048)
-            self.public_key = self.private_key.publickey() # n, e
+            self.private_key = signatures.generate_key(scheme)
+            self.public_key = signatures.public_key(self.private_key)
+            REGISTRY.register(self.public_key)
             # get LOCAL ip
             hip = subprocess.check_output(["hostname", "-I"]).decode().split()[0]
             self.address = f'{hip}:{port}'
         self.utxos = dict() # key: transaction_id.hex_digest, value: utxo
         self.balance = 0 # Utxos and balance may be inconsistent (lock)
 
+    def __setattr__(self, name, value):
+        '''Profile the lock of `wrapt.synchronized` methods, which
+        `wrapt` creates on their first call (so copies that are never
+        locked, e.g. in `object_dict_deepcopy()`, create none).'''
+
+        if name == '_synchronized_lock':
+            value = ProfiledLock(value, 'Wallet')
+        super().__setattr__(name, value)
+
     @classmethod
     def from_dict(cls, wallet: dict):
         '''Constructor to be used when bootstrap node sends
@@ -50,6 +64,8 @@ class Wallet:
 
         inst = cls(port=0, this_node=False) # dummy port, wont be used
         inst.public_key = pubk_from_dict(wallet['public_key'])
+        # transactions refer to it by fingerprint from now on
+        REGISTRY.register(inst.public_key)
         inst.address = wallet['address']
         # NOTE: private key is not set
         return inst
@@ -78,25 +94,21 @@ class Wallet:
         inst.balance = self.balance
         inst.utxos = object_dict_deepcopy(self.utxos)
         try:
-            inst.private_key = RSA.RsaKey(n=self.private_key.n,
-                                          e=self.private_key.e,
-                                          d=self.private_key.d,
-                                          p=self.private_key.p,
-                                          q=self.private_key.q,
-                                          u=self.private_key.u)
+            inst.private_key = signatures.copy_key(self.private_key)
         except AttributeError:
             pass
-        inst.public_key = RSA.RsaKey(n=self.public_key.n,
-                                     e=self.public_key.e)
+        inst.public_key = signatures.copy_key(self.public_key)
         inst.address = self.address
 
         return inst
 
+    @wrapt.synchronized
     def get_sufficient_utxos(self, amount: int):
         '''Get enough unspent transactions from wallet.'''
         return self._get_necessary_utxos(amount)
 
 
+    @wrapt.synchronized
     def add_utxo(self, utxo: TransactionOutput):
         '''Add an unspent transaction to be added to wallet.
         Balance is also updated.
@@ -109,6 +121,7 @@ class Wallet:
         self.utxos[utxo.transaction_id] = utxo
         self.balance += utxo.amount
 
+    @wrapt.synchronized
     def remove_utxos(self, utxo_ids):
         '''Remove unspent transactions in `utxo_ids`
         from wallet. Balance is also updated.
@@ -142,8 +155,9 @@ class Wallet:
     # within one function so we can lock it for each wallet
     # e.g. two valid transactions signature-wise use the same utxos
     # Note that concurrency while removing can only happen for the same sender
-    # since she is the only one that can access her utxos
-    # CAN BE REMOVED IF WE ASSUME NO ILL WILL
+    # since she is the only one that can access her utxos.
+    # Every method that changes utxos and balance shares the same (per wallet)
+    # lock, so transactions of different senders are validated concurrently
     @wrapt.synchronized
     def check_and_remove_utxos(self, utxo_ids, amount):
         '''Encapsulates checking and removing transaction inputs.
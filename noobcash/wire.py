@@ -0,0 +1,571 @@
+'''Compact, versioned binary encoding of `Transaction`s,
+`TransactionOutput`s, `Block`s and `Blockchain`s to be used
+instead of JSON between nodes. Every payload starts with a
+header (`MAGIC`, `VERSION`, kind of object). Variable length
+fields are length-prefixed, hex digests (and key fingerprints)
+are sent as raw bytes.'''
+
+import json
+import struct
+
+from noobcash.keys import FINGERPRINT_SIZE
+from noobcash.helpers import pubk_to_ref, pubk_from_ref
+
+from noobcash.transaction_output import TransactionOutput
+from noobcash.transaction import Transaction
+from noobcash.block import Block
+from noobcash.blockchain import Blockchain
+
+CONTENT_TYPE = 'application/x-noobcash'
+JSON_CONTENT_TYPE = 'application/json'
+# block-by-block streams of a blockchain
+STREAM_CONTENT_TYPE = 'application/x-noobcash-stream'
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+
+MAGIC = b'NBC'
+VERSION = 3 # 2: difficulty of blocks, 3: keys by fingerprint
+
+# kinds of payloads
+KIND_OUTPUT = b'O'
+KIND_TRANSACTION = b'T'
+KIND_BLOCK = b'B'
+KIND_BLOCKCHAIN = b'C'
+KIND_TRANSACTIONS = b'L' # batch of transactions
+
+# tags of public keys
+_KEY_PLACEHOLDER = 0 # genesis "keys" (e.g. `sender_pubk` = 0)
+_KEY_REF = 1 # fingerprint (see `noobcash.keys`)
+
+_U8 = struct.Struct('>B')
+_U16 = struct.Struct('>H')
+_U32 = struct.Struct('>I')
+_I64 = struct.Struct('>q')
+_U64 = struct.Struct('>Q')
+_F64 = struct.Struct('>d')
+
+class WireError(ValueError):
+    '''Raised when a payload cannot be decoded.'''
+
+class _Reader:
+    '''Cursor over a `bytes` payload.'''
+
+    def __init__(self, data: bytes):
+        '''Initialize `_Reader` object.
+
+        Arguments:
+
+        * `data`: the payload.'''
+
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def take(self, size: int):
+        '''Consume `size` bytes.
+
+        Returns:
+
+        * `bytes`.'''
+
+        end = self.offset + size
+        if end > len(self.data):
+            raise WireError('Truncated payload')
+        chunk = self.data[self.offset:end].tobytes()
+        self.offset = end
+        return chunk
+
+    def unpack(self, fmt: struct.Struct):
+        '''Consume a fixed size field.'''
+
+        value, = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return value
+
+    def done(self):
+        '''Whether the whole payload has been consumed.'''
+        return self.offset == len(self.data)
+
+###########################################################
+######################## primitives #######################
+###########################################################
+
+def _pack_bytes(buf: list, value: bytes):
+    buf.append(_U32.pack(len(value)))
+    buf.append(value)
+
+def _unpack_bytes(reader: _Reader):
+    return reader.take(reader.unpack(_U32))
+
+def _pack_hex(buf: list, value: str):
+    # number of nibbles is kept so that '0', '1' (genesis)
+    # and digests with leading zeros survive the round trip
+    buf.append(_U16.pack(len(value)))
+    buf.append(bytes.fromhex(value.zfill(len(value) + len(value) % 2)))
+
+def _unpack_hex(reader: _Reader):
+    nibbles = reader.unpack(_U16)
+    return reader.take((nibbles + 1) // 2).hex()[-nibbles:] if nibbles else ''
+
+def _pack_int(buf: list, value: int):
+    _pack_bytes(buf, value.to_bytes((value.bit_length() + 7) // 8 or 1, 'big'))
+
+def _unpack_int(reader: _Reader):
+    return int.from_bytes(_unpack_bytes(reader), 'big')
+
+def _pack_key(buf: list, pubk):
+    if isinstance(pubk, int):
+        buf.append(_U8.pack(_KEY_PLACEHOLDER))
+        _pack_int(buf, pubk)
+    else:
+        buf.append(_U8.pack(_KEY_REF))
+        buf.append(bytes.fromhex(pubk_to_ref(pubk)))
+
+def _unpack_key_dict(reader: _Reader):
+    # in the form of `pubk_to_ref()`
+    tag = reader.unpack(_U8)
+    if tag == _KEY_PLACEHOLDER:
+        return _unpack_int(reader)
+    if tag == _KEY_REF:
+        return reader.take(FINGERPRINT_SIZE).hex()
+    raise WireError(f'Unknown key tag {tag}')
+
+def _unpack_key(reader: _Reader):
+    # keys are resolved through the registry, not reconstructed
+    return pubk_from_ref(_unpack_key_dict(reader))
+
+def _pack_header(buf: list, kind: bytes):
+    buf.append(MAGIC)
+    buf.append(_U8.pack(VERSION))
+    buf.append(kind)
+
+def _unpack_header(reader: _Reader, kind: bytes):
+    if reader.take(len(MAGIC)) != MAGIC:
+        raise WireError('Not a noobcash payload')
+    version = reader.unpack(_U8)
+    if version != VERSION:
+        raise WireError(f'Unsupported wire version {version}')
+    if reader.take(1) != kind:
+        raise WireError(f'Expected payload of kind {kind!r}')
+
+###########################################################
+######################### objects #########################
+###########################################################
+
+def _pack_output(buf: list, transaction_output: TransactionOutput):
+    _pack_hex(buf, transaction_output.transaction_id)
+    _pack_key(buf, transaction_output.receiver_public_key)
+    buf.append(_I64.pack(transaction_output.amount))
+
+def _unpack_output(reader: _Reader):
+    transaction_id = _unpack_hex(reader)
+    receiver_public_key = _unpack_key(reader)
+    return TransactionOutput(transaction_id, receiver_public_key, reader.unpack(_I64))
+
+def _pack_transaction(buf: list, transaction: Transaction):
+    _pack_key(buf, transaction.sender_pubk)
+    _pack_key(buf, transaction.receiver_pubk)
+    buf.append(_U32.pack(len(transaction.transaction_inputs)))
+    for tid in transaction.transaction_inputs:
+        _pack_hex(buf, tid)
+    buf.append(_U32.pack(len(transaction.transaction_outputs)))
+    for tro in transaction.transaction_outputs:
+        _pack_output(buf, tro)
+    _pack_bytes(buf, transaction.signature)
+
+def _unpack_transaction(reader: _Reader):
+    sender_pubk = _unpack_key(reader)
+    receiver_pubk = _unpack_key(reader)
+    transaction_inputs = [_unpack_hex(reader) for _ in range(reader.unpack(_U32))]
+    transaction_outputs = [_unpack_output(reader) for _ in range(reader.unpack(_U32))]
+    signature = _unpack_bytes(reader)
+    return Transaction.from_parts(sender_pubk, receiver_pubk, transaction_inputs,
+                                  transaction_outputs, signature)
+
+def _pack_block(buf: list, block: Block):
+    buf.append(_U32.pack(block.index))
+    _pack_hex(buf, block.previous_hash)
+    _pack_hex(buf, block.hash)
+    buf.append(_U64.pack(int(block.nonce)))
+    buf.append(_U16.pack(block.difficulty))
+    buf.append(_F64.pack(block.timestamp))
+    buf.append(_U32.pack(len(block.list_of_transactions)))
+    for tra in block.list_of_transactions:
+        _pack_transaction(buf, tra)
+
+def _unpack_block(reader: _Reader):
+    # use constructor of genesis block
+    # with dummy genesis transaction
+    block = Block(None, 0)
+    block.index = reader.unpack(_U32)
+    block.previous_hash = _unpack_hex(reader)
+    block.hash = _unpack_hex(reader)
+    block.nonce = reader.unpack(_U64)
+    block.difficulty = reader.unpack(_U16)
+    block.timestamp = reader.unpack(_F64)
+    block.list_of_transactions = [
+        _unpack_transaction(reader) for _ in range(reader.unpack(_U32))
+    ]
+    return block
+
+def _peek_transaction_id(reader: _Reader):
+    sender_pubk = _unpack_key_dict(reader)
+    receiver_pubk = _unpack_key_dict(reader)
+    transaction_inputs = [_unpack_hex(reader) for _ in range(reader.unpack(_U32))]
+    return Transaction.id_from_dict(dict(sender_pubk=sender_pubk, receiver_pubk=receiver_pubk,
+                                         transaction_inputs=transaction_inputs))
+
+def _peek_block_hash(reader: _Reader):
+    reader.unpack(_U32) # index
+    _unpack_hex(reader) # previous_hash
+    return _unpack_hex(reader)
+
+def _encode(kind: bytes, packer, obj):
+    buf = []
+    _pack_header(buf, kind)
+    packer(buf, obj)
+    return b''.join(buf)
+
+def _decode(kind: bytes, unpacker, data: bytes, whole=True):
+    reader = _Reader(data)
+    try:
+        _unpack_header(reader, kind)
+        obj = unpacker(reader)
+    except struct.error as exc:
+        raise WireError('Truncated payload') from exc
+    if whole and not reader.done():
+        raise WireError('Trailing bytes in payload')
+    return obj
+
+def peek_transaction_id(data: bytes):
+    '''Get `transaction_id` of an encoded transaction without
+    decoding it as a whole.
+
+    Arguments:
+
+    * `data`: payload of `encode_transaction()`.
+
+    Returns:
+
+    * `hexdigest()` of transaction.'''
+    return _decode(KIND_TRANSACTION, _peek_transaction_id, data, whole=False)
+
+def peek_block_hash(data: bytes):
+    '''Get (claimed, not verified) `hash` of an encoded block
+    without decoding it as a whole.
+
+    Arguments:
+
+    * `data`: payload of `encode_block()`.
+
+    Returns:
+
+    * `hash` of block.'''
+    return _decode(KIND_BLOCK, _peek_block_hash, data, whole=False)
+
+def encode_transaction_output(transaction_output: TransactionOutput):
+    '''Encode `transaction_output`.
+
+    Returns:
+
+    * `bytes`.'''
+    return _encode(KIND_OUTPUT, _pack_output, transaction_output)
+
+def decode_transaction_output(data: bytes):
+    '''Decode payload of `encode_transaction_output()`.
+
+    Returns:
+
+    * `TransactionOutput`.'''
+    return _decode(KIND_OUTPUT, _unpack_output, data)
+
+def encode_transaction(transaction: Transaction):
+    '''Encode `transaction`.
+
+    Returns:
+
+    * `bytes`.'''
+    return _encode(KIND_TRANSACTION, _pack_transaction, transaction)
+
+def decode_transaction(data: bytes):
+    '''Decode payload of `encode_transaction()`
+    (NOTE: not validated yet).
+
+    Returns:
+
+    * `Transaction`.'''
+    return _decode(KIND_TRANSACTION, _unpack_transaction, data)
+
+def encode_block(block: Block):
+    '''Encode `block`.
+
+    Returns:
+
+    * `bytes`.'''
+    return _encode(KIND_BLOCK, _pack_block, block)
+
+def decode_block(data: bytes):
+    '''Decode payload of `encode_block()`
+    (NOTE: not validated yet).
+
+    Returns:
+
+    * `Block`.'''
+    return _decode(KIND_BLOCK, _unpack_block, data)
+
+def _pack_transactions(buf: list, transactions: list):
+    # every transaction is length-prefixed so that
+    # seen ones can be skipped without decoding them
+    buf.append(_U32.pack(len(transactions)))
+    for tra in transactions:
+        tra_buf = []
+        _pack_transaction(tra_buf, tra)
+        body = b''.join(tra_buf)
+        buf.append(_U32.pack(len(body)))
+        buf.append(body)
+
+def _unpack_transactions(reader: _Reader, seen_cache=None):
+    transactions = []
+    for _ in range(reader.unpack(_U32)):
+        body = reader.take(reader.unpack(_U32))
+        if seen_cache is not None and \
+            seen_cache.check(_peek_transaction_id(_Reader(body)), len(body)):
+            continue
+        tra_reader = _Reader(body)
+        transactions.append(_unpack_transaction(tra_reader))
+        if not tra_reader.done():
+            raise WireError('Trailing bytes in transaction of batch')
+    return transactions
+
+def encode_transactions(transactions: list):
+    '''Encode a batch of transactions.
+
+    Returns:
+
+    * `bytes`.'''
+    return _encode(KIND_TRANSACTIONS, _pack_transactions, transactions)
+
+def decode_transactions(data: bytes):
+    '''Decode payload of `encode_transactions()`
+    (NOTE: not validated yet).
+
+    Returns:
+
+    * `list` of `Transaction`s.'''
+    return _decode(KIND_TRANSACTIONS, _unpack_transactions, data)
+
+def _pack_blockchain(buf: list, blockchain: Blockchain):
+    buf.append(_U32.pack(len(blockchain.chain)))
+    for block in blockchain.chain:
+        _pack_block(buf, block)
+
+def _unpack_blockchain(reader: _Reader):
+    blockchain = Blockchain()
+    for _ in range(reader.unpack(_U32)):
+        blockchain.append_block(_unpack_block(reader))
+    return blockchain
+
+def encode_blockchain(blockchain: Blockchain):
+    '''Encode `blockchain`.
+
+    Returns:
+
+    * `bytes`.'''
+    return _encode(KIND_BLOCKCHAIN, _pack_blockchain, blockchain)
+
+def decode_blockchain(data: bytes):
+    '''Decode payload of `encode_blockchain()`
+    (NOTE: not validated yet).
+
+    Returns:
+
+    * `Blockchain`.'''
+    return _decode(KIND_BLOCKCHAIN, _unpack_blockchain, data)
+
+def encode(obj, wire_format: str):
+    '''Encode `obj` in `wire_format`.
+
+    Arguments:
+
+    * `obj`: `Transaction`, `Block`, `Blockchain` or
+    `list` of `Transaction`s.
+
+    * `wire_format`: 'json' or 'binary'.
+
+    Returns:
+
+    * (`bytes` body, `str` content type).'''
+
+    if isinstance(obj, list):
+        if wire_format == 'binary':
+            return encode_transactions(obj), CONTENT_TYPE
+        return json.dumps([tra.to_dict() for tra in obj]).encode('utf-8'), JSON_CONTENT_TYPE
+
+    if wire_format == 'binary':
+        if isinstance(obj, Transaction):
+            return encode_transaction(obj), CONTENT_TYPE
+        if isinstance(obj, Block):
+            return encode_block(obj), CONTENT_TYPE
+        if isinstance(obj, Blockchain):
+            return encode_blockchain(obj), CONTENT_TYPE
+        raise TypeError(f'Cannot encode {type(obj).__name__}')
+
+    return json.dumps(obj.to_dict()).encode('utf-8'), JSON_CONTENT_TYPE
+
+def decode(data: bytes, content_type: str, decoder):
+    '''Decode `data` based on its `content_type`. JSON
+    payloads are returned as `dict`s (like before),
+    binary ones as objects.
+
+    Arguments:
+
+    * `data`: the payload.
+
+    * `content_type`: value of the Content-Type header.
+
+    * `decoder`: one of `decode_*` of this module.
+
+    Returns:
+
+    * `dict` or object.'''
+
+    if _mimetype(content_type) == CONTENT_TYPE:
+        return decoder(data)
+    return json.loads(data)
+
+def decode_unseen(data: bytes, content_type: str, kind: str, seen_cache):
+    '''Decode a transaction or a block, unless it has already been
+    seen. Its key is extracted from the payload before any heavy
+    decoding (e.g. reconstruction of keys).
+
+    Arguments:
+
+    * `data`: the payload.
+
+    * `content_type`: value of the Content-Type header.
+
+    * `kind`: 'transaction' or 'block'.
+
+    * `seen_cache`: `SeenCache` of `transaction_id`s or `hash`es of blocks.
+
+    Returns:
+
+    * (`transaction_id` or claimed `hash`, `Transaction`/`Block` or
+    `None` if seen).'''
+
+    binary = _mimetype(content_type) == CONTENT_TYPE
+
+    if binary:
+        key = peek_transaction_id(data) if kind == 'transaction' else peek_block_hash(data)
+    else:
+        obj_dict = json.loads(data)
+        key = Transaction.id_from_dict(obj_dict) if kind == 'transaction' else obj_dict['hash']
+
+    if seen_cache.check(key, len(data)):
+        return key, None
+
+    if kind == 'transaction':
+        return key, decode_transaction(data) if binary else Transaction.from_dict(obj_dict)
+    return key, decode_block(data) if binary else Block.from_dict(obj_dict)
+
+def decode_unseen_transactions(data: bytes, content_type: str, seen_cache):
+    '''Decode the transactions of a batch that have not been seen
+    (see `decode_unseen()`).
+
+    Arguments:
+
+    * `data`: payload of a `list` of `Transaction`s.
+
+    * `content_type`: value of the Content-Type header.
+
+    * `seen_cache`: `SeenCache` of `transaction_id`s.
+
+    Returns:
+
+    * `list` of unseen `Transaction`s.'''
+
+    if _mimetype(content_type) == CONTENT_TYPE:
+        return _decode(KIND_TRANSACTIONS, lambda reader: _unpack_transactions(reader, seen_cache),
+                       data)
+
+    tra_dicts = json.loads(data)
+    size = len(data) // max(len(tra_dicts), 1) # approximately, for the stats of the cache
+    transactions = []
+    for tra_dict in tra_dicts:
+        if not seen_cache.check(Transaction.id_from_dict(tra_dict), size):
+            transactions.append(Transaction.from_dict(tra_dict))
+    return transactions
+
+def _mimetype(content_type: str):
+    if content_type is None:
+        return None
+    return content_type.split(';')[0].strip()
+
+def iter_encoded_blocks(blocks, content_type: str):
+    '''Encode `blocks` one at a time, so that a blockchain can be
+    streamed without being serialized as a whole.
+
+    Arguments:
+
+    * `blocks`: iterable of `Block`s.
+
+    * `content_type`: `STREAM_CONTENT_TYPE` (length-prefixed binary
+    blocks) or `NDJSON_CONTENT_TYPE` (a JSON block per line).
+
+    Yields:
+
+    * `bytes` of a single block.'''
+
+    for block in blocks:
+        if content_type == STREAM_CONTENT_TYPE:
+            payload = encode_block(block)
+            yield _U32.pack(len(payload)) + payload
+        else:
+            yield json.dumps(block.to_dict()).encode('utf-8') + b'\n'
+
+def iter_decoded_blocks(chunks, content_type: str):
+    '''Decode blocks as soon as they are completely received.
+    Non-streamed payloads (whole JSON or binary blockchain) are
+    also handled, but can only be decoded after they are received.
+
+    Arguments:
+
+    * `chunks`: iterable of `bytes` of arbitrary size (e.g. from
+    `urllib3`'s `stream()`).
+
+    * `content_type`: value of the Content-Type header.
+
+    Yields:
+
+    * `Block`s (NOTE: not validated yet).'''
+
+    content_type = _mimetype(content_type)
+
+    if content_type not in (STREAM_CONTENT_TYPE, NDJSON_CONTENT_TYPE):
+        data = b''.join(chunks)
+        if content_type == CONTENT_TYPE:
+            yield from decode_blockchain(data).chain
+        else:
+            for block_dict in json.loads(data)['chain']:
+                yield Block.from_dict(block_dict)
+        return
+
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while True:
+            if content_type == STREAM_CONTENT_TYPE:
+                if len(buffer) < _U32.size:
+                    break
+                end = _U32.size + _U32.unpack_from(buffer)[0]
+                if len(buffer) < end:
+                    break
+                block = decode_block(bytes(buffer[_U32.size:end]))
+            else:
+                end = buffer.find(b'\n') + 1
+                if end == 0:
+                    break
+                block = Block.from_dict(json.loads(bytes(buffer[:end])))
+            del buffer[:end]
+            yield block
+
+    if buffer:
+        raise WireError('Truncated stream')
@@ -22,5 +22,9 @@ setup(
             'numpy',
             'pycryptodome',
         ],
+        'perf': [
+            'waitress',
+            'zstandard',
+        ],
     },
 )